@@ -1,6 +1,11 @@
 from pyramid.config import Configurator
+from pyramid.settings import asbool
 from sqlalchemy import engine_from_config
 
+from c2corg_api import instrumentation
+from c2corg_api.caching import configure_caches
+from c2corg_api.indexing import configure_indexing
+
 from c2corg_api.models import (
     DBSession,
     Base,
@@ -13,7 +18,11 @@ def main(global_config, **settings):
     engine = engine_from_config(settings, 'sqlalchemy.')
     DBSession.configure(bind=engine)
     Base.metadata.bind = engine
+    configure_caches(settings)
+    configure_indexing(settings, engine)
     config = Configurator(settings=settings)
     config.include('cornice')
+    if asbool(settings.get('instrumentation.db_stats', False)):
+        instrumentation.setup(config, engine)
     config.scan(ignore='c2corg_api.tests')
     return config.make_wsgi_app()
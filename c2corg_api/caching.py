@@ -0,0 +1,289 @@
+"""Caches for serialized API responses.
+
+A cache is made of a backend storing the values by key:
+
+ - `LRUCache`: an in-process cache with a maximum number of entries, the
+   least recently used entries are dropped first.
+ - `SharedCache`: a cache shared between processes, backed by a client with
+   a redis-like interface (`get`, `set`, `delete`, `sadd`, `smembers`,
+   `srem`).
+ - `NullCache`: caching is disabled.
+
+Besides the values, a backend keeps indexes: named sets of the keys of
+entries, which allow to find the entries of a group (e.g. the tiles of a
+zoom level) without scanning the whole cache.
+
+The backends are configured in `configure_caches` with the settings
+`cache.backend` (`memory`, `redis` or `none`), `cache.size`,
+`cache.tiles.size` and `cache.versions.size` (for `memory`) and
+`cache.redis_url` (for `redis`).
+"""
+from collections import OrderedDict
+import base64
+import json
+import threading
+
+
+class NullCache(object):
+    """A cache backend that does not store anything.
+    """
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def add_to_index(self, index, key):
+        pass
+
+    def get_index(self, index):
+        return set()
+
+    def remove_from_index(self, index, keys):
+        pass
+
+
+class LRUCache(object):
+    """An in-process cache containing at most `max_size` entries. The keys
+    of dropped entries are also removed from the indexes.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        # the keys of each index and the indexes of each key
+        self._indexes = {}
+        self._key_indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                # move the entry to the end (most recently used)
+                self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._drop_from_indexes(self._entries.popitem(last=False)[0])
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._drop_from_indexes(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+            self._key_indexes.clear()
+
+    def add_to_index(self, index, key):
+        with self._lock:
+            if key in self._entries:
+                self._indexes.setdefault(index, set()).add(key)
+                self._key_indexes.setdefault(key, set()).add(index)
+
+    def get_index(self, index):
+        with self._lock:
+            return set(self._indexes.get(index, ()))
+
+    def remove_from_index(self, index, keys):
+        with self._lock:
+            index_keys = self._indexes.get(index, set())
+            for key in keys:
+                index_keys.discard(key)
+                self._key_indexes.get(key, set()).discard(index)
+            if not index_keys:
+                self._indexes.pop(index, None)
+
+    def _drop_from_indexes(self, key):
+        for index in self._key_indexes.pop(key, ()):
+            index_keys = self._indexes[index]
+            index_keys.discard(key)
+            if not index_keys:
+                del self._indexes[index]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCache(object):
+    """A cache shared between processes. The values are stored as JSON with
+    the given client, which has to provide the methods `get(key)`,
+    `set(key, value)` and `delete(key)`, and the set operations `sadd`,
+    `smembers` and `srem` for the indexes (e.g. a redis client). The
+    indexes may contain the keys of entries that were dropped by the server.
+    """
+    def __init__(self, client, prefix='c2corg:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        pass
+
+    def add_to_index(self, index, key):
+        self.client.sadd(self.prefix + index, key)
+
+    def get_index(self, index):
+        return set(self.client.smembers(self.prefix + index))
+
+    def remove_from_index(self, index, keys):
+        if keys:
+            self.client.srem(self.prefix + index, *keys)
+
+
+class DocumentCache(object):
+    """Caches the serialized responses for documents.
+
+    All variants of a document (e.g. the responses for the different
+    cultures) are stored in a single entry, so that a document can be
+    invalidated at once.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, doc_type, document_id, variant):
+        variants = self.backend.get(self._key(doc_type, document_id))
+        return variants.get(variant) if variants else None
+
+    def set(self, doc_type, document_id, variant, value):
+        key = self._key(doc_type, document_id)
+        variants = dict(self.backend.get(key) or {})
+        variants[variant] = value
+        self.backend.set(key, variants)
+
+    def invalidate(self, doc_type, document_id):
+        self.backend.delete(self._key(doc_type, document_id))
+
+    def _key(self, doc_type, document_id):
+        return 'document:%s:%d' % (doc_type, document_id)
+
+
+class TileCache(object):
+    """Caches the generated vector tiles. Like for documents, all variants
+    of a tile (e.g. with the titles in different cultures) are stored in a
+    single entry. Only the tiles up to the zoom level `max_zoom` are
+    cached. The cached tiles of each layer and zoom level are kept in an
+    index, so that only the tiles which are actually cached have to be
+    looked at when invalidating an area.
+    """
+    def __init__(self, backend, max_zoom=14):
+        self.backend = backend
+        self.max_zoom = max_zoom
+
+    def get(self, layer, z, x, y, variant):
+        if z > self.max_zoom:
+            return None
+        variants = self.backend.get(self._key(layer, z, x, y))
+        tile = variants.get(variant) if variants else None
+        # the tiles are stored base64-encoded, so that they can be stored
+        # as JSON in a shared cache
+        return None if tile is None else base64.b64decode(tile)
+
+    def set(self, layer, z, x, y, variant, tile):
+        if z > self.max_zoom:
+            return
+        key = self._key(layer, z, x, y)
+        variants = dict(self.backend.get(key) or {})
+        variants[variant] = base64.b64encode(tile)
+        self.backend.set(key, variants)
+        self.backend.add_to_index(self._index(layer, z), key)
+
+    def get_cached_tiles(self, layer, z):
+        """Returns the `(x, y)` coordinates of the cached tiles of a layer at
+        the given zoom level.
+        """
+        tiles = set()
+        for key in self.backend.get_index(self._index(layer, z)):
+            x, y = key.rsplit(':', 2)[1:]
+            tiles.add((int(x), int(y)))
+        return tiles
+
+    def invalidate(self, layer, z, tiles):
+        """Remove the given tiles (`(x, y)` coordinates) of a layer at the
+        given zoom level.
+        """
+        keys = [self._key(layer, z, x, y) for x, y in tiles]
+        for key in keys:
+            self.backend.delete(key)
+        self.backend.remove_from_index(self._index(layer, z), keys)
+
+    def _key(self, layer, z, x, y):
+        return 'tile:%s:%d:%d:%d' % (layer, z, x, y)
+
+    def _index(self, layer, z):
+        return 'tiles:%s:%d' % (layer, z)
+
+
+class VersionCache(object):
+    """Caches the serialized responses for archived versions of documents.
+    The archives are never changed, so the entries are never invalidated.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, doc_type, document_id, culture, version_id, variant):
+        return self.backend.get(
+            self._key(doc_type, document_id, culture, version_id, variant))
+
+    def set(self, doc_type, document_id, culture, version_id, variant,
+            value):
+        self.backend.set(
+            self._key(doc_type, document_id, culture, version_id, variant),
+            value)
+
+    def _key(self, doc_type, document_id, culture, version_id, variant):
+        return 'version:%s:%d:%s:%d:%s' % (
+            doc_type, document_id, culture, version_id, variant)
+
+
+document_cache = DocumentCache(NullCache())
+
+tile_cache = TileCache(NullCache())
+
+version_cache = VersionCache(NullCache())
+
+
+def get_cache_backend(settings, size_setting='cache.size'):
+    """Create the cache backend configured in the given settings.
+    """
+    backend = settings.get('cache.backend', 'none')
+    if backend == 'none':
+        return NullCache()
+    elif backend == 'memory':
+        return LRUCache(int(settings.get(size_setting, 1000)))
+    elif backend == 'redis':
+        # optional dependency, only needed for this backend
+        import redis
+        return SharedCache(redis.StrictRedis.from_url(
+            settings['cache.redis_url']))
+    else:
+        raise ValueError('unknown cache backend: %s' % backend)
+
+
+def configure_caches(settings):
+    document_cache.backend = get_cache_backend(settings)
+    tile_cache.backend = get_cache_backend(settings, 'cache.tiles.size')
+    tile_cache.max_zoom = int(settings.get('cache.tiles.max_zoom', 14))
+    version_cache.backend = get_cache_backend(
+        settings, 'cache.versions.size')
@@ -5,13 +5,96 @@ from colander import (null, Invalid, SchemaType)
 
 from geoalchemy2 import WKBElement
 from geoalchemy2.shape import to_shape, from_shape
-from shapely.geometry import mapping, shape
-from shapely.ops import transform
-from functools import partial
+from shapely.geometry import (
+    mapping, shape, Point, LineString, LinearRing, Polygon, MultiPoint,
+    MultiLineString, MultiPolygon, GeometryCollection)
+import threading
 import pyproj
 import json
 
 
+class Transformer(object):
+    """Reprojects coordinates from one SRID to another. The coordinates of
+    a whole geometry part (e.g. all points of a line) are reprojected with a
+    single call to pyproj, instead of one call per point.
+    """
+    def __init__(self, src_srid, dst_srid):
+        self.src_srid = src_srid
+        self.dst_srid = dst_srid
+        if hasattr(pyproj, 'Transformer'):
+            # pyproj >= 2
+            transformer = pyproj.Transformer.from_crs(
+                src_srid, dst_srid, always_xy=True)
+            self._transform = transformer.transform
+        else:
+            src_proj = pyproj.Proj(init='epsg:' + str(src_srid))
+            dst_proj = pyproj.Proj(init='epsg:' + str(dst_srid))
+
+            def transform_coords(*coords):
+                return pyproj.transform(src_proj, dst_proj, *coords)
+            self._transform = transform_coords
+
+    def transform_coords(self, coords):
+        """Reproject a sequence of (x, y[, z]) tuples.
+        """
+        coords = list(coords)
+        if not coords:
+            return coords
+        return zip(*self._transform(*zip(*coords)))
+
+    def transform(self, geometry):
+        """Reproject a Shapely geometry.
+        """
+        if geometry.is_empty:
+            return geometry
+        if isinstance(geometry, Point):
+            return Point(self.transform_coords(geometry.coords)[0])
+        if isinstance(geometry, LinearRing):
+            return LinearRing(self.transform_coords(geometry.coords))
+        if isinstance(geometry, LineString):
+            return LineString(self.transform_coords(geometry.coords))
+        if isinstance(geometry, Polygon):
+            return Polygon(
+                self.transform_coords(geometry.exterior.coords),
+                [self.transform_coords(ring.coords)
+                 for ring in geometry.interiors])
+        if isinstance(geometry, MultiPoint):
+            return MultiPoint(self.transform_coords(
+                [point.coords[0] for point in geometry.geoms]))
+        if isinstance(geometry, MultiLineString):
+            return MultiLineString(
+                [self.transform_coords(line.coords)
+                 for line in geometry.geoms])
+        if isinstance(geometry, MultiPolygon):
+            return MultiPolygon(
+                [self.transform(polygon) for polygon in geometry.geoms])
+        if isinstance(geometry, GeometryCollection):
+            return GeometryCollection(
+                [self.transform(part) for part in geometry.geoms])
+        raise ValueError('Unsupported geometry type: %s' % geometry.type)
+
+
+# the transformers by (source SRID, target SRID), shared by the process
+_transformers = {}
+_transformers_lock = threading.Lock()
+
+
+def get_transformer(src_srid, dst_srid):
+    """Returns the cached `Transformer` for the given SRIDs. Creating the
+    projections is expensive, so that a transformer is only created once
+    per pair of SRIDs.
+    """
+    key = (src_srid, dst_srid)
+    transformer = _transformers.get(key)
+    if transformer is None:
+        with _transformers_lock:
+            transformer = _transformers.get(key)
+            if transformer is None:
+                transformer = Transformer(src_srid, dst_srid)
+                _transformers[key] = transformer
+    return transformer
+
+
 class Geometry(SchemaType):
     """ A Colander type meant to be used with GeoAlchemy 2 geometry columns.
     Example usage
@@ -40,14 +123,10 @@ class Geometry(SchemaType):
             self.map_srid = self.srid
 
         if self.srid != self.map_srid:
-            self.project_db_to_map = partial(
-                pyproj.transform,
-                pyproj.Proj(init='epsg:' + str(self.srid)),
-                pyproj.Proj(init='epsg:' + str(self.map_srid)))
-            self.project_map_to_db = partial(
-                pyproj.transform,
-                pyproj.Proj(init='epsg:' + str(self.map_srid)),
-                pyproj.Proj(init='epsg:' + str(self.srid)))
+            self.transformer_db_to_map = \
+                get_transformer(self.srid, self.map_srid)
+            self.transformer_map_to_db = \
+                get_transformer(self.map_srid, self.srid)
 
     def serialize(self, node, appstruct):
         """
@@ -60,7 +139,7 @@ class Geometry(SchemaType):
         if isinstance(appstruct, WKBElement):
             geometry = to_shape(appstruct)
             if self.srid != self.map_srid and appstruct.srid != self.map_srid:
-                geometry = transform(self.project_db_to_map, geometry)
+                geometry = self.transformer_db_to_map.transform(geometry)
 
             return json.dumps(mapping(geometry))
         raise Invalid(node, 'Unexpected value: %r' % appstruct)
@@ -69,19 +148,23 @@ class Geometry(SchemaType):
         """
         In Colander speak: Converts a serialized value (a cstruct) into a
         Python data structure (a appstruct).
-        Or: Converts a GeoJSON string into a `WKBElement`.
+        Or: Converts a GeoJSON string (or an already parsed GeoJSON object)
+        into a `WKBElement`.
         """
         if cstruct is null or cstruct == '':
             return null
         try:
             # TODO Shapely does not support loading GeometryCollections from
             # GeoJSON, see https://github.com/Toblerity/Shapely/issues/115
-            geometry = shape(json.loads(cstruct))
+            if isinstance(cstruct, dict):
+                geometry = shape(cstruct)
+            else:
+                geometry = shape(json.loads(cstruct))
         except Exception:
             raise Invalid(node, 'Invalid geometry: %r' % cstruct)
 
         if self.srid != self.map_srid:
-            geometry = transform(self.project_map_to_db, geometry)
+            geometry = self.transformer_map_to_db.transform(geometry)
 
         return from_shape(geometry, srid=self.srid)
 
@@ -0,0 +1,389 @@
+"""Synchronization of the documents with the Elasticsearch index.
+
+When documents are created or updated, their ids are added to the
+`index_queue` once the transaction is committed (see `sync_documents`). A
+background thread (`SyncWorker`) takes the ids from the queue and indexes
+the documents in batches with the bulk API (`Indexer`). Failed requests and
+documents rejected because of an overload of Elasticsearch are retried.
+The index is created with an explicit mapping (see `get_mapping`) if it
+does not exist yet.
+
+The synchronization is enabled if the setting `elasticsearch.host` is set.
+The whole index can be rebuilt with the command `reindex_c2corg_api`.
+"""
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, sessionmaker
+import transaction
+
+from c2corg_api.attributes import default_cultures
+from c2corg_api.models.document import DocumentGeometry
+from c2corg_api.models.document_types import (
+    document_types, document_types_by_type)
+
+log = logging.getLogger(__name__)
+
+# the Elasticsearch mapping type of the documents
+DOC_TYPE = 'document'
+
+# the attributes of the documents that are indexed (if the document type has
+# this attribute)
+INDEXED_ATTRIBUTES = ['waypoint_type', 'activities']
+
+DEFAULT_BATCH_SIZE = 100
+
+# the Elasticsearch analyzer used for the texts of each culture
+ANALYZERS = {
+    'ca': 'catalan',
+    'de': 'german',
+    'en': 'english',
+    'es': 'spanish',
+    'eu': 'basque',
+    'fr': 'french',
+    'it': 'italian'
+}
+
+DEFAULT_ANALYZER = 'standard'
+
+
+def get_mapping():
+    """Returns the mapping of the documents in the index: the titles and
+    descriptions are analyzed with the analyzer of their culture, the type
+    and the indexed attributes are not analyzed and the centroid is a
+    `geo_point`.
+    """
+    properties = {
+        'type': {'type': 'string', 'index': 'not_analyzed'},
+        'geom': {'type': 'geo_point'}
+    }
+    for attribute in INDEXED_ATTRIBUTES:
+        properties[attribute] = {'type': 'string', 'index': 'not_analyzed'}
+    for culture in default_cultures:
+        analyzer = ANALYZERS.get(culture, DEFAULT_ANALYZER)
+        for field in ['title', 'description']:
+            properties[field + '_' + culture] = {
+                'type': 'string', 'analyzer': analyzer}
+    return {DOC_TYPE: {'properties': properties}}
+
+
+def is_retryable(status):
+    """Tells if a request or a document rejected with the given status may
+    succeed when sent again (429 or 5xx).
+    """
+    return status == 429 or status >= 500
+
+
+class NullQueue(object):
+    """A queue that drops all documents (the synchronization is disabled).
+    """
+    def add(self, doc_type, document_id):
+        pass
+
+
+class IndexQueue(object):
+    """The queue of documents to index. A document is only queued once, even
+    if it is changed several times before being indexed.
+    """
+    def __init__(self):
+        self._keys = OrderedDict()
+        self._condition = threading.Condition()
+
+    def add(self, doc_type, document_id):
+        with self._condition:
+            self._keys[(doc_type, document_id)] = True
+            self._condition.notify()
+
+    def get_batch(self, max_size, timeout=None):
+        """Take at most `max_size` documents from the queue as list of
+        `(doc_type, document_id)` tuples. If the queue is empty, wait at most
+        `timeout` seconds for new documents.
+        """
+        with self._condition:
+            if not self._keys and timeout:
+                self._condition.wait(timeout)
+            keys = []
+            while self._keys and len(keys) < max_size:
+                keys.append(self._keys.popitem(last=False)[0])
+            return keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+index_queue = NullQueue()
+
+
+def sync_documents(keys):
+    """Queue the given documents (`(doc_type, document_id)` tuples) for
+    indexing, once the current transaction is successfully committed.
+    """
+    def add_to_queue(success):
+        if success:
+            for doc_type, document_id in keys:
+                index_queue.add(doc_type, document_id)
+    transaction.get().addAfterCommitHook(add_to_queue)
+
+
+class Indexer(object):
+    """Indexes documents with the bulk API of Elasticsearch.
+
+    `client` has to provide a method `bulk(body)` and the methods
+    `indices.exists(index)` and `indices.create(index, body)` like
+    `elasticsearch.Elasticsearch`, `session_factory` creates the database
+    sessions used to load the documents. Each bulk request contains at most
+    `batch_size` documents. A request that fails, or the documents that were
+    rejected, with a status that may be temporary (429 or 5xx, or no status
+    for connection errors) are retried at most `max_retries` times, waiting
+    `retry_delay` seconds (doubled for every attempt) in between. Other
+    errors are logged and not retried.
+    """
+    def __init__(self, client, index, session_factory,
+                 batch_size=DEFAULT_BATCH_SIZE, max_retries=3,
+                 retry_delay=1.0, sleep=time.sleep):
+        self.client = client
+        self.index = index
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.sleep = sleep
+
+    def create_index(self):
+        """Create the index with the mapping of `get_mapping` if it does not
+        exist. Returns `True` if the index was created.
+        """
+        if self.client.indices.exists(index=self.index):
+            return False
+        self.client.indices.create(
+            index=self.index, body={'mappings': get_mapping()})
+        log.info('index %s created', self.index)
+        return True
+
+    def index_documents(self, keys):
+        """Index (or remove from the index, if they do not exist anymore) the
+        given documents. Returns the documents that could not be indexed
+        because of an error that may be temporary.
+        """
+        failed = []
+        for i in range(0, len(keys), self.batch_size):
+            failed.extend(self._index_batch(keys[i:i + self.batch_size]))
+        return failed
+
+    def _index_batch(self, keys):
+        session = self.session_factory()
+        try:
+            actions = self._get_actions(session, keys)
+        finally:
+            session.close()
+        return self._bulk(actions)
+
+    def _get_actions(self, session, keys):
+        """Returns the bulk actions for the given documents as list of
+        `(key, action lines)` tuples.
+        """
+        ids_by_type = {}
+        for doc_type, document_id in keys:
+            ids_by_type.setdefault(doc_type, []).append(document_id)
+
+        documents = {}
+        for doc_type, ids in ids_by_type.items():
+            clazz = document_types_by_type[doc_type].clazz
+            for document in session.query(clazz). \
+                    options(joinedload(clazz.locales)). \
+                    filter(clazz.document_id.in_(ids)):
+                documents[(doc_type, document.document_id)] = document
+        centroids = self._get_centroids(
+            session, [key[1] for key in documents.keys()])
+
+        actions = []
+        for key in keys:
+            document_id = key[1]
+            meta_data = {
+                '_index': self.index, '_type': DOC_TYPE, '_id': document_id}
+            document = documents.get(key)
+            if document is None:
+                actions.append((key, [{'delete': meta_data}]))
+            else:
+                actions.append((key, [
+                    {'index': meta_data},
+                    get_index_document(
+                        document, key[0], centroids.get(document_id))
+                ]))
+        return actions
+
+    def _get_centroids(self, session, document_ids):
+        """Returns the centroids of the geometries of the given documents as
+        `{'lon': ..., 'lat': ...}` (WGS84), by document id.
+        """
+        if not document_ids:
+            return {}
+        centroid = func.ST_Transform(
+            func.ST_Centroid(DocumentGeometry.geom), 4326)
+        return {
+            document_id: {'lon': lon, 'lat': lat}
+            for document_id, lon, lat in session.query(
+                DocumentGeometry.document_id,
+                func.ST_X(centroid), func.ST_Y(centroid)).
+            filter(DocumentGeometry.document_id.in_(document_ids)).
+            filter(DocumentGeometry.geom.isnot(None))
+        }
+
+    def _bulk(self, actions):
+        pending = actions
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.sleep(self.retry_delay * 2 ** (attempt - 1))
+            body = [line for _, lines in pending for line in lines]
+            try:
+                response = self.client.bulk(body=body)
+            except Exception as e:
+                # e.g. `elasticsearch.TransportError`, the status is not set
+                # for connection errors
+                status = getattr(e, 'status_code', None)
+                if isinstance(status, int) and not is_retryable(status):
+                    log.error(
+                        'bulk request rejected, %d documents could not be '
+                        'indexed', len(pending), exc_info=True)
+                    return []
+                log.warning(
+                    'bulk request failed (attempt %d)', attempt + 1,
+                    exc_info=True)
+                continue
+
+            retry = []
+            for action, item in zip(pending, response['items']):
+                status = item.values()[0].get('status', 500)
+                if is_retryable(status):
+                    retry.append(action)
+                elif status >= 300 and not (
+                        status == 404 and 'delete' in item):
+                    log.error(
+                        'document %s could not be indexed: %s',
+                        action[0], item)
+            pending = retry
+            if not pending:
+                return []
+
+        log.error('%d documents could not be indexed', len(pending))
+        return [key for key, _ in pending]
+
+
+def get_index_document(document, doc_type, centroid):
+    """Returns the document to index: the title and description of every
+    culture (`title_fr`, `description_fr`, ...), the type, the indexed
+    attributes and the centroid of the geometry.
+    """
+    index_document = {'type': doc_type}
+    for locale in document.locales:
+        index_document['title_' + locale.culture] = locale.title
+        index_document['description_' + locale.culture] = locale.description
+    for attribute in INDEXED_ATTRIBUTES:
+        if hasattr(document, attribute):
+            index_document[attribute] = getattr(document, attribute)
+    if centroid is not None:
+        index_document['geom'] = centroid
+    return index_document
+
+
+def get_all_keys(session, batch_size=1000):
+    """Iterate over the keys of all documents (ordered by type and id).
+    """
+    for document_type in document_types:
+        document_id = document_type.clazz.document_id
+        last_id = None
+        while True:
+            query = session.query(document_id).order_by(document_id)
+            if last_id is not None:
+                query = query.filter(document_id > last_id)
+            ids = [row[0] for row in query.limit(batch_size)]
+            for id in ids:
+                yield (document_type.type, id)
+            if len(ids) < batch_size:
+                break
+            last_id = ids[-1]
+
+
+class SyncWorker(threading.Thread):
+    """A thread indexing the documents added to the queue. The index is
+    created first if it does not exist. The documents that could not be
+    indexed are queued again, a document is dropped after `max_attempts`
+    failed attempts.
+    """
+    daemon = True
+
+    def __init__(self, queue, indexer, timeout=1.0, max_attempts=5):
+        super(SyncWorker, self).__init__(name='index-sync')
+        self.queue = queue
+        self.indexer = indexer
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        # the number of failed attempts, by document
+        self.attempts = {}
+        self.index_ready = False
+
+    def run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                log.exception('index synchronization failed')
+                time.sleep(self.timeout)
+
+    def run_once(self):
+        if not self.index_ready:
+            self.indexer.create_index()
+            self.index_ready = True
+
+        keys = self.queue.get_batch(self.indexer.batch_size, self.timeout)
+        if not keys:
+            return
+        failed = set(self.indexer.index_documents(keys))
+        for key in keys:
+            if key not in failed:
+                self.attempts.pop(key, None)
+                continue
+            attempts = self.attempts.get(key, 0) + 1
+            if attempts >= self.max_attempts:
+                log.error(
+                    'document %s dropped after %d failed attempts',
+                    key, attempts)
+                self.attempts.pop(key, None)
+            else:
+                self.attempts[key] = attempts
+                self.queue.add(*key)
+
+
+def get_indexer(settings, engine):
+    """Create the `Indexer` configured in the given settings, or `None` if
+    no Elasticsearch host is configured.
+    """
+    host = settings.get('elasticsearch.host')
+    if not host:
+        return None
+    # optional dependency, only needed if the synchronization is enabled
+    from elasticsearch import Elasticsearch
+    client = Elasticsearch([{
+        'host': host,
+        'port': int(settings.get('elasticsearch.port', 9200))
+    }])
+    return Indexer(
+        client, settings.get('elasticsearch.index', 'c2corg'),
+        sessionmaker(bind=engine),
+        batch_size=int(settings.get(
+            'elasticsearch.batch_size', DEFAULT_BATCH_SIZE)))
+
+
+def configure_indexing(settings, engine):
+    """Start the synchronization with the index if it is enabled.
+    """
+    global index_queue
+    indexer = get_indexer(settings, engine)
+    if indexer is None:
+        index_queue = NullQueue()
+    else:
+        index_queue = IndexQueue()
+        SyncWorker(index_queue, indexer).start()
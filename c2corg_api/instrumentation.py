@@ -0,0 +1,110 @@
+"""Counts the SQL statements executed for a request and the time spent in
+the database.
+
+The statistics are returned in the response headers `X-DB-Queries` and
+`Server-Timing` and written to the log (logger `c2corg_api.instrumentation`,
+level INFO), e.g.:
+
+    X-DB-Queries: 3
+    Server-Timing: db;dur=4.2;desc="3 queries", total;dur=12.7
+
+The instrumentation is disabled by default and can be enabled with the
+setting `instrumentation.db_stats = true`.
+"""
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+# the statistics of the request handled by the current thread
+_current = threading.local()
+
+
+class RequestStats(object):
+    """The statistics collected for a single request.
+    """
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def add_query(self, duration):
+        self.query_count += 1
+        self.query_time += duration
+
+
+def get_current_stats():
+    """Returns the `RequestStats` of the current request or `None` if no
+    request is being instrumented.
+    """
+    return getattr(_current, 'stats', None)
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    # the start time is kept on the execution context (and not in
+    # `conn.info`) so that nothing is left behind when a statement fails
+    # and `after_cursor_execute` is not called
+    context._query_start_time = time.time()
+
+
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    stats = get_current_stats()
+    if stats is not None:
+        stats.add_query(time.time() - context._query_start_time)
+
+
+def instrument_engine(engine):
+    """Register the event listeners that count the statements executed with
+    the given engine (or connection).
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def uninstrument_engine(engine):
+    event.remove(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.remove(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def db_stats_tween_factory(handler, registry):
+    """A Pyramid tween that collects the database statistics of a request.
+    """
+    def db_stats_tween(request):
+        stats = _current.stats = RequestStats()
+        start_time = time.time()
+        try:
+            response = handler(request)
+        finally:
+            _current.stats = None
+        total_time = time.time() - start_time
+
+        db_ms = stats.query_time * 1000
+        total_ms = total_time * 1000
+        response.headers['X-DB-Queries'] = str(stats.query_count)
+        response.headers['Server-Timing'] = \
+            'db;dur=%.1f;desc="%d queries", total;dur=%.1f' % (
+                db_ms, stats.query_count, total_ms)
+
+        log.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_int,
+            'db_queries': stats.query_count,
+            'db_ms': round(db_ms, 1),
+            'total_ms': round(total_ms, 1)
+        }))
+        return response
+
+    return db_stats_tween
+
+
+def setup(config, engine):
+    """Enable the instrumentation for the given engine.
+    """
+    instrument_engine(engine)
+    config.add_tween('c2corg_api.instrumentation.db_stats_tween_factory')
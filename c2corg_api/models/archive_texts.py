@@ -0,0 +1,158 @@
+"""Compact storage of the descriptions of the locale archives.
+
+Every change of a locale creates a new archive with a full copy of the
+texts. If the delta storage is enabled (setting `archives.locale_deltas`),
+the description of a new archive is instead stored as delta against the
+previous archive of the locale (`ArchiveDocumentLocale.delta`). Every
+`snapshot_interval` archives, a full copy (a snapshot) is stored again, so
+that a description is reconstructed from at most `snapshot_interval`
+archives. The archives between two snapshots reference the first of them
+(`snapshot_id`), so that they are loaded with a single query.
+
+A delta is the JSON list of the changed line ranges of the previous text,
+`[[start, end, [new lines]], ...]`, or `null` if the description was
+removed. Existing archives are converted with the command
+`compress_archives_c2corg_api`.
+"""
+import difflib
+import json
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm.attributes import set_committed_value
+
+from c2corg_api.models.document import ArchiveDocumentLocale
+
+DEFAULT_SNAPSHOT_INTERVAL = 10
+
+
+def get_delta(old_text, new_text):
+    """Returns the delta which turns `old_text` into `new_text`.
+    """
+    if new_text is None:
+        return json.dumps(None)
+    old_lines = (old_text or '').splitlines(True)
+    new_lines = new_text.splitlines(True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    return json.dumps([
+        [old_start, old_end, new_lines[new_start:new_end]]
+        for op, old_start, old_end, new_start, new_end
+        in matcher.get_opcodes() if op != 'equal'
+    ])
+
+
+def apply_delta(old_text, delta):
+    """Returns the text obtained by applying a delta to `old_text`.
+    """
+    changes = json.loads(delta)
+    if changes is None:
+        return None
+    old_lines = (old_text or '').splitlines(True)
+    lines = []
+    position = 0
+    for start, end, new_lines in changes:
+        lines.extend(old_lines[position:start])
+        lines.extend(new_lines)
+        position = end
+    lines.extend(old_lines[position:])
+    return ''.join(lines)
+
+
+def get_texts(rows):
+    """Reconstruct the descriptions of the archives of the given rows
+    (`(id, snapshot_id, description, delta)` ordered by id, all archives
+    following a snapshot). Returns the descriptions by archive id.
+    """
+    texts = {}
+    current_texts = {}
+    for id, snapshot_id, description, delta in rows:
+        if snapshot_id is None:
+            text = description
+            current_texts[id] = text
+        else:
+            text = apply_delta(current_texts[snapshot_id], delta)
+            current_texts[snapshot_id] = text
+        texts[id] = text
+    return texts
+
+
+def _load_chains(session, snapshot_ids, max_id=None):
+    """Load the rows of the snapshots with the given ids and of the archives
+    referencing them (up to `max_id`) with a single query.
+    """
+    archives = ArchiveDocumentLocale
+    query = session. \
+        query(
+            archives.id, archives.snapshot_id, archives.description,
+            archives.delta). \
+        filter(or_(
+            archives.id.in_(snapshot_ids),
+            archives.snapshot_id.in_(snapshot_ids))). \
+        order_by(archives.id)
+    if max_id is not None:
+        query = query.filter(archives.id <= max_id)
+    return query.all()
+
+
+def compress_locale_archives(
+        session, locale_archives,
+        snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+    """Store the descriptions of new (not yet flushed) locale archives as
+    deltas against the previous archives of the locales. A new archive is
+    kept as full snapshot if the locale has no archive yet or if the last
+    snapshot is followed by `snapshot_interval - 1` archives.
+    """
+    if not locale_archives:
+        return
+    archives = ArchiveDocumentLocale
+    document_ids = set(archive.document_id for archive in locale_archives)
+
+    # the snapshot of the latest archive of every locale
+    snapshots = {
+        (document_id, culture): snapshot_id
+        for document_id, culture, snapshot_id in session.
+        query(
+            archives.document_id, archives.culture,
+            func.coalesce(archives.snapshot_id, archives.id)).
+        filter(archives.document_id.in_(document_ids)).
+        distinct(archives.document_id, archives.culture).
+        order_by(
+            archives.document_id, archives.culture, archives.id.desc())
+    }
+    if not snapshots:
+        return
+
+    rows = _load_chains(session, set(snapshots.values()))
+    texts = get_texts(rows)
+    chains = {}
+    for row in rows:
+        chains.setdefault(row.snapshot_id or row.id, []).append(row.id)
+
+    for archive in locale_archives:
+        snapshot_id = snapshots.get((archive.document_id, archive.culture))
+        if snapshot_id is None:
+            continue
+        chain = chains[snapshot_id]
+        if len(chain) >= snapshot_interval:
+            continue
+        archive.delta = get_delta(texts[chain[-1]], archive.description)
+        archive.snapshot_id = snapshot_id
+        archive.description = None
+
+
+def load_locale_archive_texts(session, locale_archives):
+    """Reconstruct the descriptions of loaded locale archives which are
+    stored as deltas. The descriptions are set without marking the
+    archives as modified.
+    """
+    delta_archives = [
+        archive for archive in locale_archives
+        if archive is not None and archive.snapshot_id is not None
+    ]
+    if not delta_archives:
+        return
+    texts = get_texts(_load_chains(
+        session,
+        set(archive.snapshot_id for archive in delta_archives),
+        max(archive.id for archive in delta_archives)))
+    for archive in delta_archives:
+        set_committed_value(archive, 'description', texts[archive.id])
@@ -4,10 +4,12 @@ from sqlalchemy import (
     Boolean,
     String,
     ForeignKey,
-    Enum
+    Enum,
+    Index
     )
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from geoalchemy2 import Geometry
 from colander import MappingSchema, SchemaNode, String as ColanderString, null
 from itertools import ifilter
@@ -16,7 +18,7 @@ import enum
 
 from c2corg_api.models import Base, schema
 from c2corg_api.ext import colander_ext
-from utils import copy_attributes
+from utils import get_copier
 
 quality_types = [
     'stub',
@@ -89,10 +91,10 @@ class Document(Base, _DocumentMixin):
         return
 
     def _to_archive(self, doc):
-        """Copy the attributes of this document into a passed in
-        `Archive*` instance.
+        """Copy the attributes of this document (the `_ATTRIBUTES` of its
+        class and of the base classes) into a passed in `Archive*` instance.
         """
-        copy_attributes(self, doc, Document._ATTRIBUTES)
+        get_copier(type(self))(self, doc)
         return doc
 
     def get_archive_locales(self):
@@ -102,10 +104,11 @@ class Document(Base, _DocumentMixin):
         return self.geometry.to_archive() if self.geometry else None
 
     def update(self, other):
-        """Copies the attributes from `other` to this document.
-        Also updates all locales.
+        """Copies the attributes from `other` to this document (the
+        `_ATTRIBUTES_WHITELISTED` of `Document` and the `_ATTRIBUTES` of the
+        document type). Also updates all locales.
         """
-        copy_attributes(other, self, Document._ATTRIBUTES_WHITELISTED)
+        get_copier(type(self), '_ATTRIBUTES_WHITELISTED')(other, self)
 
         for locale_in in other.locales:
             locale = self.get_locale(locale_in.culture)
@@ -185,7 +188,7 @@ class ArchiveDocument(Base, _DocumentMixin):
     def document_id(self):
         return Column(
             Integer, ForeignKey(schema + '.documents.document_id'),
-            nullable=False)
+            nullable=False, index=True)
 
 
 # Locales for documents
@@ -197,7 +200,7 @@ class _DocumentLocaleMixin(object):
     def document_id(self):
         return Column(
             Integer, ForeignKey(schema + '.documents.document_id'),
-            nullable=False)
+            nullable=False, index=True)
 
     @declared_attr
     def culture(self):
@@ -221,18 +224,37 @@ class DocumentLocale(Base, _DocumentLocaleMixin):
     __mapper_args__ = {
         'polymorphic_identity': 'd',
         'polymorphic_on': _DocumentLocaleMixin.type,
-        'version_id_col': _DocumentLocaleMixin.version
+        'version_id_col': _DocumentLocaleMixin.version,
+        # always join the tables of the child classes (e.g. `WaypointLocale`)
+        # so that their attributes are loaded together with the locale
+        # instead of with one query per locale
+        'with_polymorphic': '*'
     }
 
+    # the words of the locale for the full-text search, maintained by
+    # triggers (see `c2corg_api.models.search`)
+    search_vector = deferred(Column(TSVECTOR))
+
     _ATTRIBUTES = \
         ['document_id', 'version', 'culture', 'title', 'description']
 
     def to_archive(self, locale):
-        copy_attributes(self, locale, DocumentLocale._ATTRIBUTES)
+        get_copier(type(self))(self, locale)
         return locale
 
     def update(self, other):
-        copy_attributes(other, self, DocumentLocale._ATTRIBUTES)
+        get_copier(type(self))(other, self)
+
+
+Index(
+    'ix_documents_locales_search_vector', DocumentLocale.search_vector,
+    postgresql_using='gin')
+
+# a trigram index for the autocompletion of titles (`ILIKE '%...%'`),
+# requires the extension `pg_trgm`
+Index(
+    'ix_documents_locales_title_trgm', DocumentLocale.title,
+    postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
 
 
 class ArchiveDocumentLocale(Base, _DocumentLocaleMixin):
@@ -243,21 +265,34 @@ class ArchiveDocumentLocale(Base, _DocumentLocaleMixin):
         'polymorphic_on': _DocumentLocaleMixin.type
     }
 
+    # if set, the description is not stored in `description` but as delta
+    # against the previous archive of the locale, starting from the full
+    # snapshot with this id (see `c2corg_api.models.archive_texts`)
+    snapshot_id = Column(
+        Integer, ForeignKey(schema + '.documents_locales_archives.id'),
+        index=True)
+    delta = Column(String)
+
 
 class _DocumentGeometryMixin(object):
     id = Column(Integer, primary_key=True)
     version = Column(Integer, nullable=False)
 
+    # whether a GiST index is created for the geometry column
+    _SPATIAL_INDEX = False
+
     @declared_attr
     def document_id(self):
         return Column(
             Integer, ForeignKey(schema + '.documents.document_id'),
-            nullable=False)
+            nullable=False, index=True)
 
     @declared_attr
     def geom(self):
         return Column(
-            Geometry(geometry_type='GEOMETRY', srid=3857, management=True),
+            Geometry(
+                geometry_type='GEOMETRY', srid=3857, management=True,
+                spatial_index=self._SPATIAL_INDEX),
             info={
                 'colanderalchemy': {
                     'typ': colander_ext.Geometry('GEOMETRY', srid=3857)
@@ -269,6 +304,9 @@ class _DocumentGeometryMixin(object):
 class DocumentGeometry(Base, _DocumentGeometryMixin):
     __tablename__ = 'documents_geometries'
 
+    # the current geometries are used in spatial queries (e.g. bbox filters)
+    _SPATIAL_INDEX = True
+
     __colanderalchemy_config__ = {
         'missing': null
     }
@@ -280,13 +318,17 @@ class DocumentGeometry(Base, _DocumentGeometryMixin):
     _ATTRIBUTES = \
         ['document_id', 'version', 'geom']
 
+    # the geometry as GeoJSON string, only set when the GeoJSON was
+    # generated by the database (`ST_AsGeoJSON`) for a read request
+    geom_geojson = None
+
     def to_archive(self):
         geometry = ArchiveDocumentGeometry()
-        copy_attributes(self, geometry, DocumentGeometry._ATTRIBUTES)
+        get_copier(DocumentGeometry)(self, geometry)
         return geometry
 
     def update(self, other):
-        copy_attributes(other, self, DocumentGeometry._ATTRIBUTES)
+        get_copier(DocumentGeometry)(other, self)
 
 
 class ArchiveDocumentGeometry(Base, _DocumentGeometryMixin):
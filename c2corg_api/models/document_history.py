@@ -3,7 +3,8 @@ from sqlalchemy import (
     Integer,
     String,
     DateTime,
-    ForeignKey
+    ForeignKey,
+    Index
     )
 from sqlalchemy.orm import relationship, backref
 import datetime
@@ -60,3 +61,10 @@ class DocumentVersion(Base):
         Integer, ForeignKey(schema + '.history_metadata.id'), nullable=False)
     history_metadata = relationship(
         HistoryMetaData, primaryjoin=history_metadata_id == HistoryMetaData.id)
+
+
+# the versions of a document in a culture are read in order of their ids
+# (history of a document, current archives when updating a document)
+Index(
+    'ix_documents_versions_document_id_culture', DocumentVersion.document_id,
+    DocumentVersion.culture, DocumentVersion.id)
@@ -0,0 +1,44 @@
+from collections import namedtuple
+
+from c2corg_api.models.waypoint import (
+    Waypoint, WaypointLocale, ArchiveWaypoint, ArchiveWaypointLocale,
+    schema_waypoint)
+from c2corg_api.models.route import (
+    Route, RouteLocale, ArchiveRoute, ArchiveRouteLocale, schema_route)
+from c2corg_api.models.image import (
+    Image, ImageLocale, ArchiveImage, ArchiveImageLocale, schema_image)
+
+DocumentType = namedtuple('DocumentType', [
+    # the polymorphic identity (e.g. 'w')
+    'type',
+    # the name used in the URLs (e.g. 'waypoints')
+    'name',
+    'clazz',
+    'locale_clazz',
+    'archive_clazz',
+    'archive_locale_clazz',
+    'schema'
+])
+
+document_types = [
+    DocumentType(
+        'w', 'waypoints', Waypoint, WaypointLocale, ArchiveWaypoint,
+        ArchiveWaypointLocale, schema_waypoint),
+    DocumentType(
+        'r', 'routes', Route, RouteLocale, ArchiveRoute, ArchiveRouteLocale,
+        schema_route),
+    DocumentType(
+        'i', 'images', Image, ImageLocale, ArchiveImage, ArchiveImageLocale,
+        schema_image)
+]
+
+document_types_by_type = {
+    document_type.type: document_type for document_type in document_types}
+
+document_types_by_name = {
+    document_type.name: document_type for document_type in document_types}
+
+# a pattern for routes that matches the URL names of all document types
+# (e.g. '/{doc_type:%s}/export' % DOCUMENT_TYPE_NAMES_PATTERN)
+DOCUMENT_TYPE_NAMES_PATTERN = '|'.join(
+    document_type.name for document_type in document_types)
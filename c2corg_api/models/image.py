@@ -9,7 +9,6 @@ from sqlalchemy import (
 from colanderalchemy import SQLAlchemySchemaNode
 
 from c2corg_api.models import schema
-from utils import copy_attributes
 from document import (
     ArchiveDocument, Document, DocumentLocale, ArchiveDocumentLocale,
     get_update_schema, geometry_schema_overrides)
@@ -40,15 +39,7 @@ class Image(_ImageMixin, Document):
     _ATTRIBUTES = ['activities', 'height']
 
     def to_archive(self):
-        image = ArchiveImage()
-        super(Image, self)._to_archive(image)
-        copy_attributes(self, image, Image._ATTRIBUTES)
-
-        return image
-
-    def update(self, other):
-        super(Image, self).update(other)
-        copy_attributes(other, self, Image._ATTRIBUTES)
+        return self._to_archive(ArchiveImage())
 
 
 class ArchiveImage(_ImageMixin, ArchiveDocument):
@@ -80,15 +71,7 @@ class ImageLocale(_ImageLocaleMixin, DocumentLocale):
     _ATTRIBUTES = []
 
     def to_archive(self):
-        locale = ArchiveImageLocale()
-        super(ImageLocale, self).to_archive(locale)
-        copy_attributes(self, locale, ImageLocale._ATTRIBUTES)
-
-        return locale
-
-    def update(self, other):
-        super(ImageLocale, self).update(other)
-        copy_attributes(other, self, ImageLocale._ATTRIBUTES)
+        return super(ImageLocale, self).to_archive(ArchiveImageLocale())
 
 
 class ArchiveImageLocale(_ImageLocaleMixin, ArchiveDocumentLocale):
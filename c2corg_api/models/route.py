@@ -10,7 +10,6 @@ from sqlalchemy import (
 from colanderalchemy import SQLAlchemySchemaNode
 
 from c2corg_api.models import schema
-from utils import copy_attributes
 from document import (
     ArchiveDocument, Document, DocumentLocale, ArchiveDocumentLocale,
     get_update_schema, geometry_schema_overrides)
@@ -41,15 +40,7 @@ class Route(_RouteMixin, Document):
     _ATTRIBUTES = ['activities', 'height']
 
     def to_archive(self):
-        route = ArchiveRoute()
-        super(Route, self)._to_archive(route)
-        copy_attributes(self, route, Route._ATTRIBUTES)
-
-        return route
-
-    def update(self, other):
-        super(Route, self).update(other)
-        copy_attributes(other, self, Route._ATTRIBUTES)
+        return self._to_archive(ArchiveRoute())
 
 
 class ArchiveRoute(_RouteMixin, ArchiveDocument):
@@ -83,15 +74,7 @@ class RouteLocale(_RouteLocaleMixin, DocumentLocale):
     _ATTRIBUTES = ['gear']
 
     def to_archive(self):
-        locale = ArchiveRouteLocale()
-        super(RouteLocale, self).to_archive(locale)
-        copy_attributes(self, locale, RouteLocale._ATTRIBUTES)
-
-        return locale
-
-    def update(self, other):
-        super(RouteLocale, self).update(other)
-        copy_attributes(other, self, RouteLocale._ATTRIBUTES)
+        return super(RouteLocale, self).to_archive(ArchiveRouteLocale())
 
 
 class ArchiveRouteLocale(_RouteLocaleMixin, ArchiveDocumentLocale):
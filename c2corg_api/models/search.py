@@ -0,0 +1,168 @@
+"""Full-text search over the locales of the documents.
+
+`documents_locales.search_vector` contains the words of a locale, weighted
+by field (A: title, B: the texts of the type-specific locale tables, e.g.
+`waypoints_locales.pedestrian_access`, C: description). It is computed with
+the text search configuration of the culture of the locale and maintained
+by triggers, so that it is also up-to-date for rows that are not written
+with the ORM (e.g. with the bulk loader): a BEFORE trigger on
+`documents_locales` sets the vector of the row being written, and triggers
+on the type-specific locale tables update it when their texts change.
+"""
+from sqlalchemy import DDL, String, Enum, event
+
+from c2corg_api.models import Base, schema
+from c2corg_api.models.document import DocumentLocale
+from c2corg_api.models.document_types import document_types
+
+# the PostgreSQL text search configuration used for each culture, there is
+# no configuration for Catalan and Basque
+TS_CONFIGS = {
+    'ca': 'simple',
+    'de': 'german',
+    'en': 'english',
+    'es': 'spanish',
+    'eu': 'simple',
+    'fr': 'french',
+    'it': 'italian'
+}
+
+DEFAULT_TS_CONFIG = 'simple'
+
+
+def get_ts_config(culture):
+    """Returns the text search configuration for the given culture.
+    """
+    return TS_CONFIGS.get(culture, DEFAULT_TS_CONFIG)
+
+
+def get_ts_configs():
+    """Returns all text search configurations used for the locales.
+    """
+    return sorted(set(TS_CONFIGS.values()))
+
+
+def _get_text_columns(locale_clazz):
+    """Returns the text columns of the table of a type-specific locale class
+    (e.g. `pedestrian_access` for `WaypointLocale`).
+    """
+    return [
+        column for column in locale_clazz.__table__.columns
+        if isinstance(column.type, String) and
+        not isinstance(column.type, Enum) and
+        not column.primary_key
+    ]
+
+
+def _get_search_ddl():
+    locales_table = DocumentLocale.__table__.fullname
+
+    # the texts of the type-specific locale tables
+    type_texts = []
+    type_triggers = []
+    for document_type in document_types:
+        table = document_type.locale_clazz.__table__
+        columns = [
+            column.name
+            for column in _get_text_columns(document_type.locale_clazz)]
+        if not columns:
+            continue
+        type_texts.extend(
+            '(SELECT %s FROM %s WHERE id = locale_id)' % (
+                column, table.fullname)
+            for column in columns)
+        # the row of the type-specific table is inserted after the row of
+        # `documents_locales`, the search vector is only updated again if
+        # the new row contains texts
+        type_triggers.append(
+            'DROP TRIGGER IF EXISTS %(name)s_search_vector ON %(table)s; '
+            'CREATE TRIGGER %(name)s_search_vector '
+            'AFTER INSERT ON %(table)s FOR EACH ROW '
+            'WHEN (%(inserted)s) EXECUTE PROCEDURE '
+            '%(schema)s.update_search_vector_trigger(); '
+            'DROP TRIGGER IF EXISTS %(name)s_search_vector_update '
+            'ON %(table)s; '
+            'CREATE TRIGGER %(name)s_search_vector_update '
+            'AFTER UPDATE OF %(columns)s ON %(table)s FOR EACH ROW '
+            'WHEN (%(updated)s) EXECUTE PROCEDURE '
+            '%(schema)s.update_search_vector_trigger();' % {
+                'name': table.name,
+                'columns': ', '.join(columns),
+                'inserted': ' OR '.join(
+                    'NEW.%s IS NOT NULL' % column for column in columns),
+                'updated': ' OR '.join(
+                    'OLD.%s IS DISTINCT FROM NEW.%s' % (column, column)
+                    for column in columns),
+                'table': table.fullname,
+                'schema': schema
+            })
+
+    config_cases = ' '.join(
+        "WHEN '%s' THEN '%s'" % (culture, config)
+        for culture, config in sorted(TS_CONFIGS.items()))
+
+    return """
+CREATE OR REPLACE FUNCTION %(schema)s.get_ts_config(culture varchar)
+RETURNS regconfig AS $$
+  SELECT (CASE culture %(config_cases)s ELSE '%(default_config)s' END)
+    ::regconfig;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION %(schema)s.get_search_vector(
+  locale_id integer, locale_culture varchar, locale_title varchar,
+  locale_description varchar)
+RETURNS tsvector AS $$
+  SELECT
+    setweight(to_tsvector(
+      %(schema)s.get_ts_config(locale_culture),
+      coalesce(locale_title, '')), 'A') ||
+    setweight(to_tsvector(
+      %(schema)s.get_ts_config(locale_culture),
+      concat_ws(' ', %(type_texts)s)), 'B') ||
+    setweight(to_tsvector(
+      %(schema)s.get_ts_config(locale_culture),
+      coalesce(locale_description, '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION %(schema)s.set_search_vector_trigger()
+RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector := %(schema)s.get_search_vector(
+    NEW.id, NEW.culture, NEW.title, NEW.description);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION %(schema)s.update_search_vector(locale_id integer)
+RETURNS void AS $$
+  UPDATE %(locales_table)s SET search_vector = %(schema)s.get_search_vector(
+    id, culture, title, description)
+  WHERE id = locale_id;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION %(schema)s.update_search_vector_trigger()
+RETURNS trigger AS $$
+BEGIN
+  PERFORM %(schema)s.update_search_vector(NEW.id);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS documents_locales_search_vector ON %(locales_table)s;
+CREATE TRIGGER documents_locales_search_vector
+BEFORE INSERT OR UPDATE OF culture, title, description ON %(locales_table)s
+FOR EACH ROW EXECUTE PROCEDURE %(schema)s.set_search_vector_trigger();
+
+%(type_triggers)s
+""" % {
+        'schema': schema,
+        'config_cases': config_cases,
+        'default_config': DEFAULT_TS_CONFIG,
+        'locales_table': locales_table,
+        'type_texts': ', '.join(type_texts) if type_texts else "''",
+        'type_triggers': '\n'.join(type_triggers)
+    }
+
+
+# the functions and triggers are created once all tables exist
+event.listen(Base.metadata, 'after_create', DDL(_get_search_ddl()))
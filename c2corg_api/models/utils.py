@@ -1,19 +1,83 @@
-from geoalchemy2 import WKBElement
+from operator import attrgetter
 
+from geoalchemy2 import Geometry
+from sqlalchemy import inspect
 
-def copy_attributes(obj_from, obj_to, attributes):
+
+# the compiled copiers, by class and attribute list name
+_copiers = {}
+
+
+def get_attributes(clazz, name='_ATTRIBUTES'):
+    """Returns the attributes listed in `name` (e.g. `_ATTRIBUTES`) by the
+    given class and its base classes, base classes first. A class which
+    does not define `name` contributes its `_ATTRIBUTES`, e.g. the
+    attributes updated for a waypoint are
+    `Document._ATTRIBUTES_WHITELISTED + Waypoint._ATTRIBUTES`.
     """
-    Copies the given attributes from `obj_from` to `obj_to` (shallow copy).
+    attributes = []
+    for cls in reversed(clazz.__mro__):
+        cls_attributes = cls.__dict__.get(name)
+        if cls_attributes is None:
+            cls_attributes = cls.__dict__.get('_ATTRIBUTES', [])
+        for attribute in cls_attributes:
+            if attribute not in attributes:
+                attributes.append(attribute)
+    return attributes
+
+
+def get_copier(clazz, name='_ATTRIBUTES'):
+    """Returns a function `copy(obj_from, obj_to)` which copies the
+    attributes of `get_attributes(clazz, name)` (shallow copy). To make the
+    SQLAlchemy check if a document has changed work properly, an attribute
+    is only set if the value has changed, except for geometries which are
+    always set.
+
+    The copier is built once per class: the attribute lists of the class
+    hierarchy are merged and the geometry columns are looked up in the
+    mapper, so that copying only reads the values with `attrgetter` and
+    compares them.
     """
+    key = (clazz, name)
+    copier = _copiers.get(key)
+    if copier is None:
+        copier = _compile_copier(clazz, get_attributes(clazz, name))
+        _copiers[key] = copier
+    return copier
+
+
+def _compile_copier(clazz, attributes):
+    column_attrs = inspect(clazz).column_attrs
     for attribute in attributes:
-        if hasattr(obj_from, attribute):
-            current_val = getattr(obj_to, attribute)
-            new_val = getattr(obj_from, attribute)
-
-            # To make the SQLAlchemy check if a document has changed work
-            # properly, we only copy an attribute if the value has changed.
-            # For geometries, we always copy the value.
-            if isinstance(current_val, WKBElement) or \
-                    isinstance(new_val, WKBElement) or \
-                    current_val != new_val:
+        if attribute not in column_attrs:
+            raise ValueError(
+                '%s is not a column of %s' % (attribute, clazz.__name__))
+    geometries = tuple(
+        attribute for attribute in attributes
+        if isinstance(column_attrs[attribute].columns[0].type, Geometry))
+    compared = tuple(
+        attribute for attribute in attributes if attribute not in geometries)
+
+    get_compared = _get_tuple_getter(compared)
+    get_geometries = _get_tuple_getter(geometries)
+
+    def copy(obj_from, obj_to):
+        for attribute, current_val, new_val in zip(
+                compared, get_compared(obj_to), get_compared(obj_from)):
+            if current_val != new_val:
                 setattr(obj_to, attribute, new_val)
+        for attribute, new_val in zip(geometries, get_geometries(obj_from)):
+            setattr(obj_to, attribute, new_val)
+
+    return copy
+
+
+def _get_tuple_getter(attributes):
+    # `attrgetter` with a single name does not return a tuple
+    if not attributes:
+        return lambda obj: ()
+    elif len(attributes) == 1:
+        single_getter = attrgetter(attributes[0])
+        return lambda obj: (single_getter(obj), )
+    else:
+        return attrgetter(*attributes)
@@ -10,7 +10,6 @@ from sqlalchemy import (
 from colanderalchemy import SQLAlchemySchemaNode
 
 from c2corg_api.models import schema
-from utils import copy_attributes
 from document import (
     ArchiveDocument, Document, DocumentLocale, ArchiveDocumentLocale,
     get_update_schema, geometry_schema_overrides)
@@ -42,15 +41,7 @@ class Waypoint(_WaypointMixin, Document):
     _ATTRIBUTES = ['waypoint_type', 'elevation', 'maps_info']
 
     def to_archive(self):
-        waypoint = ArchiveWaypoint()
-        super(Waypoint, self)._to_archive(waypoint)
-        copy_attributes(self, waypoint, Waypoint._ATTRIBUTES)
-
-        return waypoint
-
-    def update(self, other):
-        super(Waypoint, self).update(other)
-        copy_attributes(other, self, Waypoint._ATTRIBUTES)
+        return self._to_archive(ArchiveWaypoint())
 
 
 class ArchiveWaypoint(_WaypointMixin, ArchiveDocument):
@@ -83,15 +74,7 @@ class WaypointLocale(_WaypointLocaleMixin, DocumentLocale):
     _ATTRIBUTES = ['pedestrian_access']
 
     def to_archive(self):
-        locale = ArchiveWaypointLocale()
-        super(WaypointLocale, self).to_archive(locale)
-        copy_attributes(self, locale, WaypointLocale._ATTRIBUTES)
-
-        return locale
-
-    def update(self, other):
-        super(WaypointLocale, self).update(other)
-        copy_attributes(other, self, WaypointLocale._ATTRIBUTES)
+        return super(WaypointLocale, self).to_archive(ArchiveWaypointLocale())
 
 
 class ArchiveWaypointLocale(_WaypointLocaleMixin, ArchiveDocumentLocale):
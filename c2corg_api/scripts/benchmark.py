@@ -0,0 +1,155 @@
+"""Micro-benchmarks for code paths that run once per document.
+
+Usage:
+
+    .build/venv/bin/python -m c2corg_api.scripts.benchmark serializer [n]
+    .build/venv/bin/python -m c2corg_api.scripts.benchmark archive [n]
+
+No database is needed, the benchmarks use transient objects.
+"""
+import sys
+import timeit
+
+from shapely.geometry import LineString, Point
+from geoalchemy2 import WKBElement
+from geoalchemy2.shape import from_shape
+
+from c2corg_api.models.document import (
+    Document, DocumentLocale, DocumentGeometry, ArchiveDocumentGeometry)
+from c2corg_api.models.waypoint import (
+    Waypoint, WaypointLocale, ArchiveWaypoint, ArchiveWaypointLocale,
+    schema_waypoint)
+from c2corg_api.models.route import Route, RouteLocale, schema_route
+from c2corg_api.models.utils import get_copier
+from c2corg_api.attributes import default_cultures
+
+
+def get_waypoint():
+    return Waypoint(
+        document_id=1, version=1, waypoint_type='summit', elevation=2203,
+        maps_info='IGN 3433OT',
+        locales=[
+            WaypointLocale(
+                version=1, culture=culture, title='Mont Granier',
+                description='...' * 100, pedestrian_access='yes')
+            for culture in default_cultures
+        ],
+        geometry=DocumentGeometry(
+            version=1, geom=from_shape(Point(635956, 5723604), srid=3857)))
+
+
+def get_route():
+    return Route(
+        document_id=2, version=1, activities='skitouring', height=1200,
+        locales=[
+            RouteLocale(
+                version=1, culture=culture, title='Face nord',
+                description='...' * 100, gear='rope')
+            for culture in default_cultures
+        ],
+        geometry=DocumentGeometry(
+            version=1, geom=from_shape(LineString(
+                [(635956 + i, 5723604 + i) for i in range(100)]),
+                srid=3857)))
+
+
+def copy_attributes(obj_from, obj_to, attributes):
+    """The attribute copy used before the compiled copiers of
+    `c2corg_api.models.utils.get_copier`, kept as baseline.
+    """
+    for attribute in attributes:
+        if hasattr(obj_from, attribute):
+            current_val = getattr(obj_to, attribute)
+            new_val = getattr(obj_from, attribute)
+            if isinstance(current_val, WKBElement) or \
+                    isinstance(new_val, WKBElement) or \
+                    current_val != new_val:
+                setattr(obj_to, attribute, new_val)
+
+
+def report(name, number, seconds):
+    print('%-40s %10.1f us/document' % (name, seconds / number * 1e6))
+
+
+def bench_serializer(number):
+    from c2corg_api.views import serialize
+    from c2corg_api.views.serializer import get_serializer
+
+    for name, document, schema in [
+            ('waypoint', get_waypoint(), schema_waypoint),
+            ('route', get_route(), schema_route)]:
+        serializer = get_serializer(schema)
+        report(
+            'serializer (dictify + serialize) ' + name, number,
+            timeit.timeit(
+                lambda: serialize(schema.dictify(document)), number=number))
+        report(
+            'serializer (compiled) ' + name, number,
+            timeit.timeit(lambda: serializer(document), number=number))
+
+
+def bench_archive(number):
+    def to_archive_copy_attributes(document):
+        # the archives as created with one `copy_attributes` call per class
+        archive = ArchiveWaypoint()
+        copy_attributes(document, archive, Document._ATTRIBUTES)
+        copy_attributes(document, archive, Waypoint._ATTRIBUTES)
+        for locale in document.locales:
+            locale_archive = ArchiveWaypointLocale()
+            copy_attributes(
+                locale, locale_archive, DocumentLocale._ATTRIBUTES)
+            copy_attributes(
+                locale, locale_archive, WaypointLocale._ATTRIBUTES)
+        geometry_archive = ArchiveDocumentGeometry()
+        copy_attributes(
+            document.geometry, geometry_archive,
+            DocumentGeometry._ATTRIBUTES)
+
+    def to_archive(document):
+        document.to_archive()
+        document.get_archive_locales()
+        document.get_archive_geometry()
+
+    document = get_waypoint()
+    report(
+        'archive (copy_attributes) waypoint', number,
+        timeit.timeit(
+            lambda: to_archive_copy_attributes(document), number=number))
+    report(
+        'archive (compiled copiers) waypoint', number,
+        timeit.timeit(lambda: to_archive(document), number=number))
+
+    # the copy alone, without the creation of the archive objects
+    attributes = Document._ATTRIBUTES + Waypoint._ATTRIBUTES
+    copier = get_copier(Waypoint)
+    archive = ArchiveWaypoint()
+    report(
+        'copy only (copy_attributes) waypoint', number,
+        timeit.timeit(
+            lambda: copy_attributes(document, archive, attributes),
+            number=number))
+    report(
+        'copy only (compiled copier) waypoint', number,
+        timeit.timeit(lambda: copier(document, archive), number=number))
+
+
+BENCHMARKS = {
+    'serializer': bench_serializer,
+    'archive': bench_archive
+}
+
+
+def usage(argv):
+    print('usage: %s <%s> [number]' % (argv[0], '|'.join(BENCHMARKS)))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2 or argv[1] not in BENCHMARKS:
+        usage(argv)
+    number = int(argv[2]) if len(argv) > 2 else 1000
+    BENCHMARKS[argv[1]](number)
+
+
+if __name__ == '__main__':
+    main()
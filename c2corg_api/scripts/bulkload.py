@@ -0,0 +1,314 @@
+"""Bulk import of documents from a dump with one JSON document per line, in
+the format returned by the export endpoints (e.g. `/waypoints/export`).
+
+Usage:
+
+    .build/venv/bin/bulkload_c2corg_api development.ini dump.ndjson \
+        [batch_size=5000]
+
+Instead of creating the documents one by one like the API does, the rows of
+all tables (documents, locales, geometries, their archives, the history
+metadata and the versions) are created for a whole batch of documents and
+written with `COPY`. Each batch is committed separately.
+
+Every line must contain the document `type` (e.g. `w`). If a line has a
+`document_id`, the document is imported with this id, otherwise a new id
+is assigned. A dump should either contain the ids for all documents or for
+none of them.
+"""
+import datetime
+import json
+import os
+import sys
+import time
+from io import BytesIO
+
+from shapely.geometry import shape
+from sqlalchemy import engine_from_config, text
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from c2corg_api.models import Base
+from c2corg_api.models.document import (
+    Document, DocumentGeometry, ArchiveDocumentGeometry)
+from c2corg_api.models.document_history import (
+    HistoryMetaData, DocumentVersion)
+from c2corg_api.models.document_types import document_types_by_type
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> <dump_file> [batch_size=value] '
+          '[var=value]\n'
+          '(example: "%s development.ini waypoints.ndjson")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 3:
+        usage(argv)
+    config_uri = argv[1]
+    dump_file = argv[2]
+    options = parse_vars(argv[3:])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    batch_size = int(options.get('batch_size', DEFAULT_BATCH_SIZE))
+
+    with open(dump_file) as lines:
+        connection = engine.connect()
+        try:
+            BulkLoader(connection, batch_size, report_progress).load(lines)
+        finally:
+            connection.close()
+
+
+def report_progress(count, seconds):
+    print('%d documents imported (%.0f documents/s)' % (
+        count, count / seconds if seconds else 0))
+
+
+class BulkLoader(object):
+    """Imports documents with `COPY` in batches of `batch_size` documents.
+    After each batch, `progress(count, seconds)` is called with the number
+    of documents imported so far and the elapsed time.
+    """
+    def __init__(self, connection, batch_size=DEFAULT_BATCH_SIZE,
+                 progress=None):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.progress = progress
+        self._sequences = {}
+
+    def load(self, lines):
+        """Import the documents of the given JSON lines and return the number
+        of imported documents.
+        """
+        count = 0
+        start_time = time.time()
+        batch = []
+        for line in lines:
+            if not line.strip():
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= self.batch_size:
+                count += self._load_batch(batch)
+                batch = []
+                self._report(count, start_time)
+        if batch:
+            count += self._load_batch(batch)
+            self._report(count, start_time)
+        return count
+
+    def _report(self, count, start_time):
+        if self.progress:
+            self.progress(count, time.time() - start_time)
+
+    def _load_batch(self, documents):
+        with self.connection.begin():
+            rows = _Rows()
+            ids = _Ids(self, documents)
+            written_at = datetime.datetime.now()
+
+            for document_in in documents:
+                self._add_document(rows, ids, document_in, written_at)
+
+            for table in Base.metadata.sorted_tables:
+                if rows.get(table):
+                    self._copy(table, rows.get(table))
+
+            # new ids must be greater than the imported ids
+            self._reset_sequence(Document.__table__, 'document_id')
+        return len(documents)
+
+    def _add_document(self, rows, ids, document_in, written_at):
+        document_type = document_types_by_type[document_in['type']]
+        document_id = document_in.get('document_id') or \
+            ids.next(Document.__table__)
+        document = dict(
+            document_in, document_id=document_id, version=1,
+            type=document_type.type)
+        archive_id = ids.next(document_type.archive_clazz.__table__)
+        rows.add_entity(document_type.clazz, document)
+        rows.add_entity(
+            document_type.archive_clazz, dict(document, id=archive_id))
+
+        geometry_archive_id = None
+        geometry_in = document_in.get('geometry')
+        if geometry_in and geometry_in.get('geom'):
+            geometry = {
+                'id': ids.next(DocumentGeometry.__table__),
+                'document_id': document_id,
+                'version': 1,
+                'geom': _to_ewkt(geometry_in['geom'])
+            }
+            geometry_archive_id = ids.next(ArchiveDocumentGeometry.__table__)
+            rows.add_entity(DocumentGeometry, geometry)
+            rows.add_entity(
+                ArchiveDocumentGeometry,
+                dict(geometry, id=geometry_archive_id))
+
+        meta_data_id = ids.next(HistoryMetaData.__table__)
+        rows.add_entity(HistoryMetaData, {
+            'id': meta_data_id,
+            'comment': 'creation',
+            'written_at': written_at
+        })
+
+        for locale_in in document_in.get('locales', []):
+            locale = dict(
+                locale_in, document_id=document_id, version=1,
+                type=document_type.type)
+            locale_archive_id = ids.next(
+                document_type.archive_locale_clazz.__table__)
+            rows.add_entity(
+                document_type.locale_clazz,
+                dict(locale, id=ids.next(
+                    document_type.locale_clazz.__table__)))
+            rows.add_entity(
+                document_type.archive_locale_clazz,
+                dict(locale, id=locale_archive_id))
+            rows.add_entity(DocumentVersion, {
+                'id': ids.next(DocumentVersion.__table__),
+                'document_id': document_id,
+                'culture': locale['culture'],
+                'document_archive_id': archive_id,
+                'document_locales_archive_id': locale_archive_id,
+                'document_geometry_archive_id': geometry_archive_id,
+                'history_metadata_id': meta_data_id
+            })
+
+    def _copy(self, table, rows):
+        data = BytesIO()
+        for row in rows:
+            data.write(u'\t'.join(
+                _to_copy_value(value) for value in row).encode('utf-8'))
+            data.write(b'\n')
+        data.seek(0)
+
+        sql = 'COPY %s (%s) FROM STDIN' % (
+            table.fullname,
+            ', '.join('"%s"' % column.name for column in table.columns))
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert(sql, data)
+        finally:
+            cursor.close()
+
+    def _get_sequence(self, table):
+        if table not in self._sequences:
+            column = table.primary_key.columns.values()[0]
+            self._sequences[table] = self.connection.execute(
+                text('SELECT pg_get_serial_sequence(:table, :column)'),
+                table=table.fullname, column=column.name).scalar()
+        return self._sequences[table]
+
+    def reserve_ids(self, table, count):
+        """Get `count` new ids from the sequence of the given table.
+        """
+        if count == 0:
+            return []
+        return [row[0] for row in self.connection.execute(
+            text('SELECT nextval(:sequence) FROM generate_series(1, :count)'),
+            sequence=self._get_sequence(table), count=count)]
+
+    def _reset_sequence(self, table, column_name):
+        self.connection.execute(
+            text('SELECT setval(:sequence, (SELECT max(%s) FROM %s))' % (
+                column_name, table.fullname)),
+            sequence=self._get_sequence(table))
+
+
+class _Rows(object):
+    """The rows to write, by table.
+    """
+    def __init__(self):
+        self._rows = {}
+
+    def get(self, table):
+        return self._rows.get(table)
+
+    def add_entity(self, clazz, values):
+        """Add a row to every table of the given mapped class (e.g.
+        `documents` and `waypoints` for `Waypoint`).
+        """
+        for table in clazz.__mapper__.tables:
+            self._rows.setdefault(table, []).append(
+                [values.get(column.name) for column in table.columns])
+
+
+class _Ids(object):
+    """Reserves the ids needed for a batch of documents with one query per
+    table.
+    """
+    def __init__(self, loader, documents):
+        counts = {}
+
+        def count(table, n=1):
+            counts[table] = counts.get(table, 0) + n
+
+        for document_in in documents:
+            document_type = document_types_by_type[document_in['type']]
+            locale_count = len(document_in.get('locales', []))
+            if not document_in.get('document_id'):
+                count(Document.__table__)
+            count(document_type.archive_clazz.__table__)
+            count(document_type.locale_clazz.__table__, locale_count)
+            count(document_type.archive_locale_clazz.__table__, locale_count)
+            count(DocumentVersion.__table__, locale_count)
+            count(HistoryMetaData.__table__)
+            geometry_in = document_in.get('geometry')
+            if geometry_in and geometry_in.get('geom'):
+                count(DocumentGeometry.__table__)
+                count(ArchiveDocumentGeometry.__table__)
+
+        # the classes of a type share the sequence of their base table
+        self._ids = {}
+        for table, n in counts.items():
+            base_table = _get_base_table(table)
+            self._ids.setdefault(base_table, []).extend(
+                reversed(loader.reserve_ids(base_table, n)))
+
+    def next(self, table):
+        return self._ids[_get_base_table(table)].pop()
+
+
+def _get_base_table(table):
+    """Returns the table that holds the sequence for the primary key of the
+    given table (e.g. `documents_archives` for `waypoints_archives`).
+    """
+    column = table.primary_key.columns.values()[0]
+    while column.foreign_keys:
+        column = list(column.foreign_keys)[0].column
+    return column.table
+
+
+def _to_ewkt(geom):
+    """Convert a GeoJSON geometry (as string or as object) into EWKT.
+    """
+    if isinstance(geom, basestring):
+        geom = json.loads(geom)
+    return 'SRID=3857;' + shape(geom).wkt
+
+
+def _to_copy_value(value):
+    """Format a value for the text format of `COPY`.
+    """
+    if value is None:
+        return u'\\N'
+    if isinstance(value, bool):
+        return u't' if value else u'f'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return unicode(value.isoformat())
+    return unicode(value). \
+        replace(u'\\', u'\\\\'). \
+        replace(u'\t', u'\\t'). \
+        replace(u'\n', u'\\n'). \
+        replace(u'\r', u'\\r')
@@ -0,0 +1,159 @@
+"""Convert the existing locale archives to the delta storage (see
+`c2corg_api.models.archive_texts`).
+
+Usage:
+
+    .build/venv/bin/compress_archives_c2corg_api development.ini \
+        [snapshot_interval=10] [batch_size=1000]
+
+The archives of every locale are rewritten so that every
+`snapshot_interval`-th archive is a full snapshot and the others are deltas.
+With `snapshot_interval=1`, all archives are converted back to full copies.
+The archives are processed in batches of `batch_size` documents, each batch
+is committed separately. Archives that are already stored in the requested
+layout are not changed, so the command can be run again after an
+interruption.
+
+The columns have to be added to an existing database first:
+
+    ALTER TABLE guidebook.documents_locales_archives
+      ADD COLUMN snapshot_id integer
+        REFERENCES guidebook.documents_locales_archives (id),
+      ADD COLUMN delta varchar;
+    CREATE INDEX ON guidebook.documents_locales_archives (snapshot_id);
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import engine_from_config, bindparam, select
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from c2corg_api.models.archive_texts import (
+    get_delta, get_texts, DEFAULT_SNAPSHOT_INTERVAL)
+from c2corg_api.models.document import ArchiveDocumentLocale
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [snapshot_interval=value] '
+          '[batch_size=value] [var=value]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+    config_uri = argv[1]
+    options = parse_vars(argv[2:])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+
+    connection = engine.connect()
+    try:
+        count = compress_archives(
+            connection,
+            int(options.get('snapshot_interval', DEFAULT_SNAPSHOT_INTERVAL)),
+            int(options.get('batch_size', DEFAULT_BATCH_SIZE)),
+            report_progress)
+    finally:
+        connection.close()
+    print('%d archives rewritten' % count)
+
+
+def report_progress(count, seconds):
+    print('%d documents processed (%.0f documents/s)' % (
+        count, count / seconds if seconds else 0))
+
+
+def compress_archives(
+        connection, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+        batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Rewrite the locale archives of all documents with the given snapshot
+    interval. Returns the number of rewritten archives.
+    """
+    table = ArchiveDocumentLocale.__table__
+    update = table.update(). \
+        where(table.c.id == bindparam('archive_id')). \
+        values(
+            snapshot_id=bindparam('new_snapshot_id'),
+            description=bindparam('new_description'),
+            delta=bindparam('new_delta'))
+
+    start_time = time.time()
+    count = 0
+    rewritten = 0
+    last_document_id = None
+    while True:
+        query = select([table.c.document_id]). \
+            distinct(). \
+            order_by(table.c.document_id). \
+            limit(batch_size)
+        if last_document_id is not None:
+            query = query.where(table.c.document_id > last_document_id)
+        document_ids = [row[0] for row in connection.execute(query)]
+        if not document_ids:
+            break
+
+        with connection.begin():
+            changes = _get_changes(
+                connection, table, document_ids, snapshot_interval)
+            if changes:
+                connection.execute(update, changes)
+        rewritten += len(changes)
+        count += len(document_ids)
+        last_document_id = document_ids[-1]
+        if progress:
+            progress(count, time.time() - start_time)
+    return rewritten
+
+
+def _get_changes(connection, table, document_ids, snapshot_interval):
+    """Returns the update parameters of the archives of the given documents
+    which are not stored in the requested layout.
+    """
+    rows = connection.execute(
+        select([
+            table.c.id, table.c.document_id, table.c.culture,
+            table.c.snapshot_id, table.c.description, table.c.delta]).
+        where(table.c.document_id.in_(document_ids)).
+        order_by(table.c.id)).fetchall()
+    texts = get_texts(
+        (row.id, row.snapshot_id, row.description, row.delta)
+        for row in rows)
+
+    rows_by_locale = {}
+    for row in rows:
+        rows_by_locale.setdefault(
+            (row.document_id, row.culture), []).append(row)
+
+    changes = []
+    for locale_rows in rows_by_locale.values():
+        snapshot_id = None
+        previous_text = None
+        for i, row in enumerate(locale_rows):
+            text = texts[row.id]
+            if i % snapshot_interval == 0:
+                snapshot_id = row.id
+                layout = (None, text, None)
+            else:
+                layout = (snapshot_id, None, get_delta(previous_text, text))
+            if layout != (row.snapshot_id, row.description, row.delta):
+                changes.append({
+                    'archive_id': row.id,
+                    'new_snapshot_id': layout[0],
+                    'new_description': layout[1],
+                    'new_delta': layout[2]
+                })
+            previous_text = text
+    return changes
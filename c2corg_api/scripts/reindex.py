@@ -0,0 +1,79 @@
+"""Rebuild the Elasticsearch index with all documents.
+
+Usage:
+
+    .build/venv/bin/reindex_c2corg_api development.ini
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import engine_from_config
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from c2corg_api.indexing import get_indexer, get_all_keys
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [var=value]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+    config_uri = argv[1]
+    options = parse_vars(argv[2:])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+
+    indexer = get_indexer(settings, engine)
+    if indexer is None:
+        print('elasticsearch.host is not configured')
+        sys.exit(1)
+    reindex(indexer)
+
+
+def reindex(indexer):
+    """Index all documents (the index is created if it does not exist),
+    returns the number of documents that could not be indexed.
+    """
+    if indexer.create_index():
+        print('index %s created' % indexer.index)
+    session = indexer.session_factory()
+    start_time = time.time()
+    count = 0
+    failed = 0
+    batch = []
+    try:
+        for key in get_all_keys(session):
+            batch.append(key)
+            if len(batch) >= indexer.batch_size:
+                failed += len(indexer.index_documents(batch))
+                count += len(batch)
+                batch = []
+                _report(count, start_time)
+        if batch:
+            failed += len(indexer.index_documents(batch))
+            count += len(batch)
+            _report(count, start_time)
+    finally:
+        session.close()
+    if failed:
+        print('%d documents could not be indexed' % failed)
+    return failed
+
+
+def _report(count, start_time):
+    seconds = time.time() - start_time
+    print('%d documents indexed (%.0f documents/s)' % (
+        count, count / seconds if seconds else 0))
@@ -60,6 +60,17 @@ class TestGeometry(unittest.TestCase):
             {}, '{"type": "Point", "coordinates": [1.0, 2.0]}')
         self.assertEquals(expected_wkb.desc, wkb.desc)
 
+    def test_deserialize_geojson_object(self):
+        from c2corg_api.ext.colander_ext import Geometry
+        geom_schema = Geometry()
+
+        from shapely.geometry.point import Point
+        expected_wkb = WKBElement(Point(1.0, 2.0).wkb)
+
+        wkb = geom_schema.deserialize(
+            {}, {'type': 'Point', 'coordinates': [1.0, 2.0]})
+        self.assertEquals(expected_wkb.desc, wkb.desc)
+
     def test_deserialize_reproject(self):
         from c2corg_api.ext.colander_ext import Geometry
         geom_schema = Geometry(srid=4326, map_srid=3857)
@@ -93,3 +104,44 @@ class TestGeometry(unittest.TestCase):
             geom_schema.deserialize,
             {},
             '"type": "Point", "coordinates": [1.0, 2.0]}')
+
+
+class TestTransformer(unittest.TestCase):
+
+    def test_get_transformer_cached(self):
+        from c2corg_api.ext.colander_ext import get_transformer
+        transformer = get_transformer(4326, 3857)
+        self.assertIs(transformer, get_transformer(4326, 3857))
+        self.assertIsNot(transformer, get_transformer(3857, 4326))
+
+    def test_transform_line(self):
+        from c2corg_api.ext.colander_ext import get_transformer
+        from shapely.geometry import LineString
+        transformer = get_transformer(4326, 3857)
+
+        line = LineString([(1.0 + i * 0.001, 2.0) for i in range(10000)])
+        line_3857 = transformer.transform(line)
+        self.assertIsInstance(line_3857, LineString)
+        self.assertEqual(len(line_3857.coords), 10000)
+        self.assertAlmostEqual(111319.49079327231, line_3857.coords[0][0])
+        self.assertAlmostEqual(222684.20850554455, line_3857.coords[0][1])
+
+        # the back-transformation gives the original coordinates
+        line_4326 = get_transformer(3857, 4326).transform(line_3857)
+        for (x1, y1), (x2, y2) in zip(line.coords, line_4326.coords):
+            self.assertAlmostEqual(x1, x2)
+            self.assertAlmostEqual(y1, y2)
+
+    def test_transform_polygon_with_hole(self):
+        from c2corg_api.ext.colander_ext import get_transformer
+        from shapely.geometry import Polygon, MultiPolygon
+        transformer = get_transformer(4326, 3857)
+
+        polygon = Polygon(
+            [(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)],
+            [[(0.5, 0.5), (0.5, 1), (1, 1), (1, 0.5), (0.5, 0.5)]])
+        multi_polygon = transformer.transform(MultiPolygon([polygon]))
+        polygon_3857 = multi_polygon.geoms[0]
+        self.assertEqual(len(polygon_3857.interiors), 1)
+        self.assertAlmostEqual(
+            222638.98158654713, polygon_3857.exterior.coords[2][0])
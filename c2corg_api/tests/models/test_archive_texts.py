@@ -0,0 +1,79 @@
+import json
+import unittest
+
+from c2corg_api.models.archive_texts import (
+    get_delta, apply_delta, compress_locale_archives,
+    load_locale_archive_texts)
+from c2corg_api.models.waypoint import ArchiveWaypointLocale, Waypoint
+from c2corg_api.tests import BaseTestCase
+
+TEXT = 'Line 1\nLine 2\nLine 3\n'
+
+
+class TestDelta(unittest.TestCase):
+
+    def test_delta(self):
+        new_text = 'Line 1\nLine 2 changed\nLine 3\nLine 4'
+        delta = get_delta(TEXT, new_text)
+        self.assertEqual(apply_delta(TEXT, delta), new_text)
+
+    def test_delta_only_stores_changes(self):
+        long_text = ''.join('Line %d\n' % i for i in range(1000))
+        new_text = long_text.replace('Line 500\n', 'Line 500 changed\n')
+        delta = get_delta(long_text, new_text)
+        self.assertEqual(
+            json.loads(delta), [[500, 501, ['Line 500 changed\n']]])
+        self.assertEqual(apply_delta(long_text, delta), new_text)
+
+    def test_delta_none(self):
+        self.assertEqual(apply_delta(None, get_delta(None, TEXT)), TEXT)
+        self.assertIsNone(apply_delta(TEXT, get_delta(TEXT, None)))
+        self.assertEqual(apply_delta(TEXT, get_delta(TEXT, '')), '')
+
+
+class TestArchiveTexts(BaseTestCase):
+
+    def setUp(self):  # noqa
+        BaseTestCase.setUp(self)
+        self.waypoint = Waypoint(waypoint_type='summit')
+        self.session.add(self.waypoint)
+        self.session.flush()
+
+    def test_compress_and_load(self):
+        texts = [TEXT + 'Version %d\n' % i for i in range(7)]
+        archives = [self._add_archive(text, 3) for text in texts]
+
+        # every third archive is a snapshot
+        self.assertEqual(
+            [archive.snapshot_id for archive in archives], [
+                None, archives[0].id, archives[0].id,
+                None, archives[3].id, archives[3].id,
+                None
+            ])
+        self.assertIsNone(archives[1].description)
+        self.assertEqual(archives[3].description, texts[3])
+
+        self.session.expunge_all()
+        loaded = self.session.query(ArchiveWaypointLocale). \
+            filter(ArchiveWaypointLocale.id.in_(
+                [archive.id for archive in archives])). \
+            order_by(ArchiveWaypointLocale.id).all()
+        load_locale_archive_texts(self.session, loaded)
+        self.assertEqual([archive.description for archive in loaded], texts)
+        # the reconstructed descriptions are not written back
+        self.assertFalse(self.session.dirty)
+
+    def test_compress_other_culture(self):
+        self._add_archive(TEXT, 10)
+        archive = self._add_archive(TEXT, 10, culture='en')
+        self.assertIsNone(archive.snapshot_id)
+        self.assertEqual(archive.description, TEXT)
+
+    def _add_archive(self, text, snapshot_interval, culture='fr'):
+        archive = ArchiveWaypointLocale(
+            document_id=self.waypoint.document_id, culture=culture,
+            title='Mont Granier', description=text)
+        compress_locale_archives(self.session, [archive], snapshot_interval)
+        self.session.add(archive)
+        self.session.flush()
+        return archive
@@ -0,0 +1,72 @@
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+from c2corg_api.tests import BaseTestCase
+
+
+class TestDocumentGeometry(BaseTestCase):
+
+    def test_spatial_index(self):
+        """Check that the spatial queries on `documents_geometries.geom` can
+        use a GiST index.
+        """
+        self.assertTrue(self._has_gist_index('documents_geometries'))
+
+    def test_no_spatial_index_on_archives(self):
+        self.assertFalse(
+            self._has_gist_index('documents_geometries_archives'))
+
+    def _has_gist_index(self, table):
+        indexes = self.session.execute(
+            'SELECT indexdef FROM pg_indexes '
+            'WHERE schemaname = :schema AND tablename = :table',
+            {'schema': 'guidebook', 'table': table}).fetchall()
+        return any(
+            'USING gist (geom)' in indexdef for (indexdef, ) in indexes)
+
+
+class TestDocumentLocale(BaseTestCase):
+
+    def test_search_vector_index(self):
+        indexes = self.session.execute(
+            'SELECT indexdef FROM pg_indexes '
+            'WHERE schemaname = :schema AND tablename = :table',
+            {'schema': 'guidebook', 'table': 'documents_locales'}).fetchall()
+        self.assertTrue(any(
+            'USING gin (search_vector)' in indexdef
+            for (indexdef, ) in indexes))
+
+    def test_search_vector(self):
+        """The search vector is maintained by triggers, also for the texts of
+        the type-specific locale tables.
+        """
+        waypoint = Waypoint(
+            waypoint_type='summit',
+            locales=[
+                WaypointLocale(
+                    culture='fr', title='Mont Blanc',
+                    description='Le plus haut sommet',
+                    pedestrian_access='Par le refuge')
+            ])
+        self.session.add(waypoint)
+        self.session.flush()
+
+        search_vector = self._get_search_vector(waypoint.locales[0].id)
+        self.assertIn("'blanc':2A", search_vector)
+        self.assertIn("'sommet':", search_vector)
+        self.assertIn("'refug':", search_vector)
+
+        waypoint.locales[0].pedestrian_access = 'Par le glacier'
+        self.session.flush()
+        search_vector = self._get_search_vector(waypoint.locales[0].id)
+        self.assertNotIn("'refug':", search_vector)
+        self.assertIn("'glaci", search_vector)
+
+        waypoint.locales[0].title = 'Mont Blanc du Tacul'
+        self.session.flush()
+        search_vector = self._get_search_vector(waypoint.locales[0].id)
+        self.assertIn("'tacul':4A", search_vector)
+        self.assertIn("'glaci", search_vector)
+
+    def _get_search_vector(self, locale_id):
+        return self.session.execute(
+            'SELECT search_vector FROM guidebook.documents_locales '
+            'WHERE id = :id', {'id': locale_id}).scalar()
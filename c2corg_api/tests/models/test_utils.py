@@ -0,0 +1,79 @@
+import unittest
+
+from geoalchemy2.shape import from_shape
+from shapely.geometry import Point
+
+from c2corg_api.models.document import Document, DocumentGeometry
+from c2corg_api.models.utils import get_attributes, get_copier
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+
+
+class Recorder(object):
+    """Records which attributes are set.
+    """
+    def __init__(self, **values):
+        self.__dict__.update(values)
+        self.__dict__['set_attributes'] = []
+
+    def __setattr__(self, name, value):
+        self.set_attributes.append(name)
+        self.__dict__[name] = value
+
+
+class TestCopier(unittest.TestCase):
+
+    def test_get_attributes(self):
+        self.assertEqual(
+            get_attributes(Waypoint),
+            Document._ATTRIBUTES + Waypoint._ATTRIBUTES)
+        self.assertEqual(
+            get_attributes(Waypoint, '_ATTRIBUTES_WHITELISTED'),
+            ['document_id', 'version'] + Waypoint._ATTRIBUTES)
+        self.assertEqual(
+            get_attributes(WaypointLocale), [
+                'document_id', 'version', 'culture', 'title', 'description',
+                'pedestrian_access'])
+
+    def test_copy_changed_values(self):
+        waypoint = Waypoint(
+            document_id=1, version=2, waypoint_type='summit', elevation=2203)
+        target = Recorder(
+            document_id=1, version=1, waypoint_type='summit', elevation=None,
+            maps_info=None)
+        get_copier(Waypoint, '_ATTRIBUTES_WHITELISTED')(waypoint, target)
+        self.assertEqual(target.set_attributes, ['version', 'elevation'])
+        self.assertEqual(target.version, 2)
+        self.assertEqual(target.elevation, 2203)
+
+    def test_copy_geometry(self):
+        geom = from_shape(Point(1, 1), srid=3857)
+        geometry = DocumentGeometry(document_id=1, version=1, geom=geom)
+        target = Recorder(document_id=1, version=1, geom=geom)
+        get_copier(DocumentGeometry)(geometry, target)
+        # geometries are always set
+        self.assertEqual(target.set_attributes, ['geom'])
+
+    def test_copier_is_cached(self):
+        self.assertIs(get_copier(Waypoint), get_copier(Waypoint))
+        self.assertIsNot(
+            get_copier(Waypoint),
+            get_copier(Waypoint, '_ATTRIBUTES_WHITELISTED'))
+
+    def test_update(self):
+        waypoint = Waypoint(
+            document_id=1, version=1, waypoint_type='summit', elevation=2203,
+            locales=[
+                WaypointLocale(
+                    culture='en', title='A', pedestrian_access='yes')])
+        waypoint.update(Waypoint(
+            document_id=1, version=1, waypoint_type='hut', elevation=2203,
+            protected=True,
+            locales=[
+                WaypointLocale(
+                    culture='en', title='B', pedestrian_access='no')]))
+        self.assertEqual(waypoint.waypoint_type, 'hut')
+        # only the whitelisted attributes of `Document` are updated
+        self.assertIsNone(waypoint.protected)
+        locale = waypoint.get_locale('en')
+        self.assertEqual(locale.title, 'B')
+        self.assertEqual(locale.pedestrian_access, 'no')
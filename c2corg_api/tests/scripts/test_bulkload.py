@@ -0,0 +1,87 @@
+import json
+
+from c2corg_api.models.document_history import DocumentVersion
+from c2corg_api.models.route import Route, ArchiveRoute
+from c2corg_api.models.waypoint import (
+    Waypoint, ArchiveWaypoint, ArchiveWaypointLocale)
+from c2corg_api.scripts.bulkload import BulkLoader
+
+from c2corg_api.tests import BaseTestCase
+
+
+class TestBulkLoader(BaseTestCase):
+
+    def test_load(self):
+        lines = [
+            json.dumps({
+                'type': 'w', 'waypoint_type': 'summit', 'elevation': 2203,
+                'locales': [
+                    {'culture': 'fr', 'title': 'Mont Granier',
+                     'description': 'a\tb\nc\\d', 'pedestrian_access': 'oui'},
+                    {'culture': 'en', 'title': 'Mont Granier'}
+                ],
+                'geometry': {
+                    'geom': json.dumps({
+                        'type': 'Point', 'coordinates': [635956, 5723604]
+                    })
+                }
+            }),
+            '',
+            json.dumps({
+                'type': 'r', 'activities': 'hiking', 'height': 800,
+                'locales': [{'culture': 'fr', 'title': 'Face nord'}],
+                'geometry': {
+                    'geom': {
+                        'type': 'LineString',
+                        'coordinates': [[635956, 5723604], [635966, 5723644]]
+                    }
+                }
+            }),
+            json.dumps({
+                'type': 'w', 'waypoint_type': 'pass',
+                'locales': [{'culture': 'fr', 'title': 'Col'}]
+            })
+        ]
+        progress = []
+        count = BulkLoader(
+            self.connection, batch_size=2,
+            progress=lambda n, seconds: progress.append(n)).load(lines)
+        self.assertEqual(count, 3)
+        self.assertEqual(progress, [2, 3])
+
+        waypoints = self.session.query(Waypoint). \
+            order_by(Waypoint.document_id).all()
+        self.assertEqual(len(waypoints), 2)
+        waypoint = waypoints[0]
+        self.assertEqual(waypoint.version, 1)
+        self.assertEqual(waypoint.elevation, 2203)
+        self.assertEqual(
+            waypoint.get_locale('fr').description, 'a\tb\nc\\d')
+        self.assertEqual(
+            waypoint.get_locale('fr').pedestrian_access, 'oui')
+        self.assertIsNotNone(waypoint.geometry)
+        self.assertIsNone(waypoints[1].geometry)
+
+        route = self.session.query(Route).one()
+        self.assertEqual(route.activities, 'hiking')
+        self.assertIsNotNone(route.geometry)
+
+        # the archives and versions are created like for the API
+        self.assertEqual(
+            self.session.query(ArchiveWaypoint).
+            filter(ArchiveWaypoint.document_id == waypoint.document_id).
+            count(), 1)
+        self.assertEqual(
+            self.session.query(ArchiveRoute).count(), 1)
+        archive_locale = self.session.query(ArchiveWaypointLocale). \
+            filter_by(document_id=waypoint.document_id, culture='fr'). \
+            one()
+        self.assertEqual(archive_locale.pedestrian_access, 'oui')
+
+        versions = self.session.query(DocumentVersion). \
+            filter(DocumentVersion.document_id == waypoint.document_id). \
+            all()
+        self.assertEqual(len(versions), 2)
+        for version in versions:
+            self.assertIsNotNone(version.document_geometry_archive_id)
+            self.assertEqual(version.history_metadata.comment, 'creation')
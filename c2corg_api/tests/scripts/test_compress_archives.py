@@ -0,0 +1,56 @@
+from c2corg_api.models.archive_texts import load_locale_archive_texts
+from c2corg_api.models.waypoint import ArchiveWaypointLocale, Waypoint
+from c2corg_api.scripts.compress_archives import compress_archives
+
+from c2corg_api.tests import BaseTestCase
+
+
+class TestCompressArchives(BaseTestCase):
+
+    def test_compress_archives(self):
+        texts = {}
+        for i in range(3):
+            waypoint = Waypoint(waypoint_type='summit')
+            self.session.add(waypoint)
+            self.session.flush()
+            texts[waypoint.document_id] = [
+                'Line 1\nLine 2\nVersion %d\n' % j for j in range(5)]
+            self.session.add_all([
+                ArchiveWaypointLocale(
+                    document_id=waypoint.document_id, culture='fr',
+                    title='Mont Granier', description=text)
+                for text in texts[waypoint.document_id]
+            ])
+        self.session.flush()
+
+        progress = []
+        count = compress_archives(
+            self.connection, snapshot_interval=2, batch_size=2,
+            progress=lambda count, seconds: progress.append(count))
+        # 2 of 5 archives of every document are deltas
+        self.assertEqual(count, 6)
+        self.assertEqual(progress, [2, 3])
+        self._check_texts(texts, 6)
+
+        # the archives are already converted
+        self.assertEqual(compress_archives(self.connection, 2), 0)
+
+        # back to full copies
+        self.assertEqual(compress_archives(self.connection, 1), 6)
+        self._check_texts(texts, 0)
+
+    def _check_texts(self, texts, delta_count):
+        self.session.expunge_all()
+        archives = self.session.query(ArchiveWaypointLocale). \
+            filter(ArchiveWaypointLocale.document_id.in_(texts.keys())). \
+            order_by(ArchiveWaypointLocale.id).all()
+        self.assertEqual(
+            len([archive for archive in archives if archive.delta]),
+            delta_count)
+
+        load_locale_archive_texts(self.session, archives)
+        for document_id, document_texts in texts.items():
+            self.assertEqual(
+                [archive.description for archive in archives
+                 if archive.document_id == document_id],
+                document_texts)
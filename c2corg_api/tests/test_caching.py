@@ -0,0 +1,151 @@
+import unittest
+
+from c2corg_api.caching import (
+    LRUCache, SharedCache, NullCache, DocumentCache, TileCache,
+    get_cache_backend)
+
+
+class FakeCacheClient(object):
+    """A local stand-in for a redis client.
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        assert isinstance(value, basestring)
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(values)
+
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    def srem(self, key, *values):
+        self.data.get(key, set()).difference_update(values)
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(10)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {'x': 1})
+        self.assertEqual(cache.get('a'), {'x': 1})
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_max_size(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 'a' is now the most recently used entry
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+
+class TestSharedCache(unittest.TestCase):
+
+    def test_get_set(self):
+        client = FakeCacheClient()
+        cache = SharedCache(client)
+        cache.set('a', {'x': [1, 2]})
+        self.assertIn('c2corg:a', client.data)
+        self.assertEqual(cache.get('a'), {'x': [1, 2]})
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+
+class TestDocumentCache(unittest.TestCase):
+
+    def test_variants(self):
+        for backend in [LRUCache(10), SharedCache(FakeCacheClient())]:
+            cache = DocumentCache(backend)
+            cache.set('w', 1, 'fr|string', {'document_id': 1})
+            cache.set('w', 1, '|string', {'document_id': 1, 'locales': []})
+            cache.set('w', 2, 'fr|string', {'document_id': 2})
+            self.assertEqual(
+                cache.get('w', 1, 'fr|string'), {'document_id': 1})
+            self.assertIsNone(cache.get('w', 1, 'en|string'))
+            self.assertIsNone(cache.get('r', 1, 'fr|string'))
+
+            # all variants of a document are invalidated
+            cache.invalidate('w', 1)
+            self.assertIsNone(cache.get('w', 1, 'fr|string'))
+            self.assertIsNone(cache.get('w', 1, '|string'))
+            self.assertEqual(
+                cache.get('w', 2, 'fr|string'), {'document_id': 2})
+
+    def test_null_cache(self):
+        cache = DocumentCache(NullCache())
+        cache.set('w', 1, 'fr|string', {'document_id': 1})
+        self.assertIsNone(cache.get('w', 1, 'fr|string'))
+
+    def test_get_cache_backend(self):
+        self.assertIsInstance(get_cache_backend({}), NullCache)
+        backend = get_cache_backend(
+            {'cache.backend': 'memory', 'cache.size': '12'})
+        self.assertIsInstance(backend, LRUCache)
+        self.assertEqual(backend.max_size, 12)
+        self.assertRaises(
+            ValueError, get_cache_backend, {'cache.backend': 'unknown'})
+
+
+class TestTileCache(unittest.TestCase):
+
+    def test_variants(self):
+        for backend in [LRUCache(10), SharedCache(FakeCacheClient())]:
+            cache = TileCache(backend, max_zoom=10)
+            cache.set('waypoints', 10, 528, 365, 'fr', b'\x1a\x00')
+            cache.set('waypoints', 10, 528, 365, '', b'\x1a\x01')
+            self.assertEqual(
+                cache.get('waypoints', 10, 528, 365, 'fr'), b'\x1a\x00')
+            self.assertIsNone(cache.get('waypoints', 10, 528, 365, 'en'))
+            self.assertIsNone(cache.get('routes', 10, 528, 365, 'fr'))
+
+            # all variants of a tile are invalidated
+            cache.invalidate('waypoints', 10, [(528, 365)])
+            self.assertIsNone(cache.get('waypoints', 10, 528, 365, 'fr'))
+            self.assertIsNone(cache.get('waypoints', 10, 528, 365, ''))
+
+            # tiles above the maximum zoom level are not cached
+            cache.set('waypoints', 11, 1056, 730, '', b'\x1a\x00')
+            self.assertIsNone(cache.get('waypoints', 11, 1056, 730, ''))
+
+    def test_cached_tiles(self):
+        for backend in [LRUCache(10), SharedCache(FakeCacheClient())]:
+            cache = TileCache(backend, max_zoom=10)
+            cache.set('waypoints', 10, 528, 365, 'fr', b'\x1a\x00')
+            cache.set('waypoints', 10, 528, 365, '', b'\x1a\x00')
+            cache.set('waypoints', 10, 527, 365, '', b'\x1a\x00')
+            cache.set('waypoints', 9, 264, 182, '', b'\x1a\x00')
+            cache.set('routes', 10, 528, 365, '', b'\x1a\x00')
+            self.assertEqual(
+                cache.get_cached_tiles('waypoints', 10),
+                {(528, 365), (527, 365)})
+            self.assertEqual(cache.get_cached_tiles('routes', 9), set())
+
+            cache.invalidate('waypoints', 10, [(528, 365)])
+            self.assertEqual(
+                cache.get_cached_tiles('waypoints', 10), {(527, 365)})
+            self.assertEqual(
+                cache.get_cached_tiles('waypoints', 9), {(264, 182)})
+
+    def test_cached_tiles_dropped(self):
+        # the tiles dropped from a memory cache are removed from the index
+        cache = TileCache(LRUCache(1))
+        cache.set('waypoints', 10, 528, 365, '', b'\x1a\x00')
+        cache.set('waypoints', 10, 527, 365, '', b'\x1a\x00')
+        self.assertEqual(
+            cache.get_cached_tiles('waypoints', 10), {(527, 365)})
@@ -0,0 +1,264 @@
+import unittest
+import transaction
+
+from c2corg_api import indexing
+from c2corg_api.indexing import (
+    IndexQueue, Indexer, SyncWorker, sync_documents, get_all_keys, DOC_TYPE)
+from c2corg_api.models.document import DocumentGeometry
+from c2corg_api.models.route import Route, RouteLocale
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+from c2corg_api.scripts.reindex import reindex
+
+from c2corg_api.tests import BaseTestCase
+
+
+class FakeTransportError(Exception):
+    """Like `elasticsearch.TransportError`, `status_code` is 'N/A' for
+    connection errors.
+    """
+    def __init__(self, status_code):
+        super(FakeTransportError, self).__init__(status_code)
+        self.status_code = status_code
+
+
+class FakeIndices(object):
+
+    def __init__(self):
+        self.mappings = {}
+
+    def exists(self, index):
+        return index in self.mappings
+
+    def create(self, index, body):
+        self.mappings[index] = body['mappings']
+
+
+class FakeElasticsearch(object):
+    """A local stand-in for the Elasticsearch client, which stores the
+    indexed documents. The first `failures` requests raise an exception
+    with the status `failure_status`, the items with a status in
+    `item_statuses` (by document id) are rejected once with this status.
+    """
+    def __init__(self, failures=0, item_statuses=None, failure_status='N/A'):
+        self.failures = failures
+        self.failure_status = failure_status
+        self.item_statuses = dict(item_statuses or {})
+        self.documents = {}
+        self.requests = []
+        self.indices = FakeIndices()
+
+    def bulk(self, body):
+        self.requests.append(body)
+        if self.failures > 0:
+            self.failures -= 1
+            raise FakeTransportError(self.failure_status)
+
+        items = []
+        lines = iter(body)
+        for action in lines:
+            op_type, meta_data = action.items()[0]
+            document_id = meta_data['_id']
+            status = self.item_statuses.pop(document_id, None)
+            if status is None:
+                if op_type == 'index':
+                    self.documents[document_id] = next(lines)
+                    status = 201
+                else:
+                    status = 200 if self.documents.pop(
+                        document_id, None) else 404
+            elif op_type == 'index':
+                next(lines)
+            items.append({op_type: {'_id': document_id, 'status': status}})
+        return {'errors': False, 'items': items}
+
+
+class TestIndexQueue(unittest.TestCase):
+
+    def test_get_batch(self):
+        queue = IndexQueue()
+        queue.add('w', 1)
+        queue.add('r', 2)
+        queue.add('w', 1)
+        queue.add('w', 3)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.get_batch(2), [('w', 1), ('r', 2)])
+        self.assertEqual(queue.get_batch(2), [('w', 3)])
+        self.assertEqual(queue.get_batch(2, timeout=0.01), [])
+
+    def test_sync_documents(self):
+        queue = indexing.index_queue
+        indexing.index_queue = IndexQueue()
+        try:
+            with transaction.manager:
+                sync_documents([('w', 1), ('w', 2)])
+                # the documents are only queued after the commit
+                self.assertEqual(len(indexing.index_queue), 0)
+            self.assertEqual(
+                indexing.index_queue.get_batch(10), [('w', 1), ('w', 2)])
+
+            try:
+                with transaction.manager:
+                    sync_documents([('w', 3)])
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertEqual(len(indexing.index_queue), 0)
+        finally:
+            indexing.index_queue = queue
+
+
+class TestIndexer(BaseTestCase):
+
+    def setUp(self):  # noqa
+        BaseTestCase.setUp(self)
+        self.sleeps = []
+        self._add_test_data()
+
+    def test_index_documents(self):
+        client = FakeElasticsearch()
+        indexer = self._get_indexer(client, batch_size=2)
+        failed = indexer.index_documents(self._get_keys())
+        self.assertEqual(failed, [])
+        # 3 documents in batches of 2
+        self.assertEqual(len(client.requests), 2)
+
+        document = client.documents[self.waypoint.document_id]
+        self.assertEqual(document['type'], 'w')
+        self.assertEqual(document['title_fr'], 'Mont Granier')
+        self.assertEqual(document['description_en'], 'A summit')
+        self.assertEqual(document['waypoint_type'], 'summit')
+        self.assertAlmostEqual(document['geom']['lon'], 5.71, places=2)
+        self.assertAlmostEqual(document['geom']['lat'], 45.64, places=2)
+
+        document = client.documents[self.route.document_id]
+        self.assertEqual(document['activities'], 'hiking')
+        self.assertNotIn('geom', document)
+
+    def test_create_index(self):
+        client = FakeElasticsearch()
+        indexer = self._get_indexer(client)
+        self.assertTrue(indexer.create_index())
+        self.assertFalse(indexer.create_index())
+
+        properties = client.indices.mappings['c2corg'][DOC_TYPE]['properties']
+        self.assertEqual(properties['geom'], {'type': 'geo_point'})
+        self.assertEqual(properties['title_fr']['analyzer'], 'french')
+        self.assertEqual(
+            properties['description_en']['analyzer'], 'english')
+        self.assertEqual(properties['waypoint_type']['index'], 'not_analyzed')
+
+    def test_index_deleted_document(self):
+        client = FakeElasticsearch()
+        client.documents[-1] = {}
+        indexer = self._get_indexer(client)
+        self.assertEqual(indexer.index_documents([('w', -1)]), [])
+        self.assertNotIn(-1, client.documents)
+
+    def test_retry_failed_request(self):
+        client = FakeElasticsearch(failures=2)
+        indexer = self._get_indexer(client)
+        self.assertEqual(indexer.index_documents(self._get_keys()), [])
+        self.assertEqual(len(client.requests), 3)
+        self.assertEqual(len(client.documents), 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+
+    def test_retry_rejected_documents(self):
+        client = FakeElasticsearch(item_statuses={
+            self.waypoint.document_id: 429,
+            self.route.document_id: 400
+        })
+        indexer = self._get_indexer(client)
+        self.assertEqual(indexer.index_documents(self._get_keys()), [])
+        self.assertEqual(len(client.requests), 2)
+        # only the rejected document is sent again
+        self.assertEqual(len(client.requests[1]), 2)
+        self.assertIn(self.waypoint.document_id, client.documents)
+        # invalid documents are not retried
+        self.assertNotIn(self.route.document_id, client.documents)
+
+    def test_rejected_request(self):
+        client = FakeElasticsearch(failures=1, failure_status=400)
+        indexer = self._get_indexer(client)
+        # a request rejected as invalid is not retried
+        self.assertEqual(indexer.index_documents(self._get_keys()), [])
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_give_up(self):
+        client = FakeElasticsearch(failures=10)
+        indexer = self._get_indexer(client)
+        keys = self._get_keys()
+        self.assertEqual(indexer.index_documents(keys), keys)
+        self.assertEqual(len(client.requests), 4)
+
+    def test_sync_worker(self):
+        client = FakeElasticsearch(failures=4)
+        queue = IndexQueue()
+        worker = SyncWorker(queue, self._get_indexer(client))
+        queue.add('w', self.waypoint.document_id)
+
+        # the document could not be indexed and is queued again
+        worker.run_once()
+        self.assertEqual(len(queue), 1)
+        worker.run_once()
+        self.assertEqual(len(queue), 0)
+        self.assertIn(self.waypoint.document_id, client.documents)
+        self.assertEqual(worker.attempts, {})
+        # the index was created before indexing the first documents
+        self.assertIn('c2corg', client.indices.mappings)
+
+    def test_sync_worker_drop(self):
+        client = FakeElasticsearch(failures=100)
+        queue = IndexQueue()
+        worker = SyncWorker(
+            queue, self._get_indexer(client), max_attempts=2)
+        queue.add('w', self.waypoint.document_id)
+
+        worker.run_once()
+        self.assertEqual(len(queue), 1)
+        # the document is dropped after the second failed attempt
+        worker.run_once()
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(worker.attempts, {})
+
+    def test_reindex(self):
+        client = FakeElasticsearch()
+        indexer = self._get_indexer(client, batch_size=2)
+        self.assertEqual(reindex(indexer), 0)
+        self.assertIn('c2corg', client.indices.mappings)
+        for key in get_all_keys(self.session):
+            self.assertIn(key[1], client.documents)
+
+    def _get_indexer(self, client, batch_size=100):
+        return Indexer(
+            client, 'c2corg', lambda: self.Session(bind=self.connection),
+            batch_size=batch_size, sleep=self.sleeps.append)
+
+    def _get_keys(self):
+        return [
+            ('w', self.waypoint.document_id),
+            ('w', self.waypoint2.document_id),
+            ('r', self.route.document_id)
+        ]
+
+    def _add_test_data(self):
+        self.waypoint = Waypoint(
+            waypoint_type='summit', elevation=2203,
+            locales=[
+                WaypointLocale(
+                    culture='fr', title='Mont Granier',
+                    description='Un sommet'),
+                WaypointLocale(
+                    culture='en', title='Mont Granier',
+                    description='A summit')
+            ],
+            geometry=DocumentGeometry(
+                geom='SRID=3857;POINT(635956 5723604)'))
+        self.waypoint2 = Waypoint(
+            waypoint_type='pass',
+            locales=[WaypointLocale(culture='fr', title='Col')])
+        self.route = Route(
+            activities='hiking',
+            locales=[RouteLocale(culture='fr', title='Face nord')])
+        self.session.add_all([self.waypoint, self.waypoint2, self.route])
+        self.session.flush()
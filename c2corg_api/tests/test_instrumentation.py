@@ -0,0 +1,70 @@
+from pyramid import testing
+from pyramid.response import Response
+from sqlalchemy.exc import ProgrammingError
+
+from c2corg_api.instrumentation import (
+    db_stats_tween_factory, instrument_engine, uninstrument_engine,
+    get_current_stats)
+from c2corg_api.models import DBSession
+from c2corg_api.tests import BaseTestCase
+
+
+class TestDbStatsTween(BaseTestCase):
+
+    def setUp(self):  # noqa
+        BaseTestCase.setUp(self)
+        instrument_engine(self.connection)
+
+    def tearDown(self):  # noqa
+        uninstrument_engine(self.connection)
+        BaseTestCase.tearDown(self)
+
+    def test_tween(self):
+        def handler(request):
+            DBSession.execute('SELECT 1')
+            DBSession.execute('SELECT 2')
+            return Response('ok')
+
+        tween = db_stats_tween_factory(handler, None)
+        response = tween(testing.DummyRequest())
+
+        self.assertEqual(response.headers['X-DB-Queries'], '2')
+        server_timing = response.headers['Server-Timing']
+        self.assertTrue(server_timing.startswith('db;dur='))
+        self.assertIn('desc="2 queries"', server_timing)
+        self.assertIn('total;dur=', server_timing)
+
+        # statements executed outside of a request are not counted
+        self.assertIsNone(get_current_stats())
+        DBSession.execute('SELECT 3')
+
+    def test_tween_no_queries(self):
+        tween = db_stats_tween_factory(lambda request: Response('ok'), None)
+        response = tween(testing.DummyRequest())
+        self.assertEqual(response.headers['X-DB-Queries'], '0')
+
+    def test_tween_error(self):
+        def handler(request):
+            DBSession.execute('SELECT 1')
+            raise ValueError()
+
+        tween = db_stats_tween_factory(handler, None)
+        self.assertRaises(ValueError, tween, testing.DummyRequest())
+        self.assertIsNone(get_current_stats())
+
+    def test_failed_statement(self):
+        savepoint = self.connection.begin_nested()
+        self.assertRaises(
+            ProgrammingError, self.connection.execute,
+            'SELECT * FROM does_not_exist')
+        savepoint.rollback()
+        # the failed statement leaves no start time behind
+        self.assertNotIn('query_start_time', self.connection.info)
+
+        def handler(request):
+            DBSession.execute('SELECT 1')
+            return Response('ok')
+
+        tween = db_stats_tween_factory(handler, None)
+        response = tween(testing.DummyRequest())
+        self.assertEqual(response.headers['X-DB-Queries'], '1')
@@ -1,8 +1,79 @@
 import json
+from sqlalchemy import event
 
+from c2corg_api.models.document import DocumentGeometry
 from c2corg_api.tests import BaseTestCase
 
 
+def add_documents(
+        session, clazz, locale_clazz, count, with_geometry=False,
+        geometry_type='POINT', attributes=None, locale_attributes=None):
+    """Add `count` documents of the given class, each with an 'en' and a
+    'fr' locale, and return them.
+
+    A callable value in `attributes` or `locale_attributes` is called with
+    the index of the document, e.g. `{'elevation': lambda i: 1000 + i}`.
+    If `with_geometry` is set, the i-th document has a point (or a line
+    of 10 m for `geometry_type='LINESTRING'`) at x = 100 * i, y = 5723604.
+    """
+    def get_values(values, i):
+        return {
+            name: value(i) if callable(value) else value
+            for name, value in (values or {}).items()
+        }
+
+    documents = []
+    for i in range(count):
+        document = clazz(
+            locales=[
+                locale_clazz(
+                    culture=culture, title='Document %d' % i,
+                    **get_values(locale_attributes, i))
+                for culture in ['en', 'fr']
+            ],
+            **get_values(attributes, i))
+        if with_geometry:
+            x = 100 * i
+            if geometry_type == 'LINESTRING':
+                geom = 'SRID=3857;LINESTRING(%d 5723604, %d 5723644)' % (
+                    x, x + 10)
+            else:
+                geom = 'SRID=3857;POINT(%d 5723604)' % x
+            document.geometry = DocumentGeometry(geom=geom)
+        documents.append(document)
+    session.add_all(documents)
+    session.flush()
+    return documents
+
+
+class QueryCounter(object):
+    """Counts the SQL statements executed on a connection, e.g.:
+
+        with QueryCounter(self.connection) as counter:
+            self.app.get('/waypoints')
+        self.assertEqual(counter.count, 1)
+
+    The executed statements are kept in `statements`.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(
+            self.connection, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(
+            self.connection, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.count += 1
+        self.statements.append(statement)
+
+
 class BaseTestRest(BaseTestCase):
 
     def set_prefix_and_model(
@@ -29,6 +100,110 @@ class BaseTestRest(BaseTestCase):
         self.assertEqual(len(body), nb_docs)
         return body
 
+    def get_collection_paginated(self, reference, add_documents, limit=2):
+        """Add documents with `add_documents(count)`, then follow the `next`
+        links with the given page size and check that all documents (among
+        them `reference`) are returned exactly once and ordered by id.
+        """
+        add_documents(2 * limit)
+        document_ids = []
+        url = self._prefix + '?limit=' + str(limit)
+        while url:
+            response = self.app.get(url, status=200)
+            body = response.json
+            self.assertLessEqual(len(body), limit)
+            document_ids.extend([doc.get('document_id') for doc in body])
+
+            link = response.headers.get('Link')
+            if link:
+                self.assertTrue(link.endswith('>; rel="next"'))
+                url = link[1:link.index('>')]
+            else:
+                url = None
+
+        nb_docs = self.session.query(self._model).count()
+        self.assertEqual(len(document_ids), nb_docs)
+        self.assertEqual(document_ids, sorted(document_ids))
+        self.assertIn(reference.document_id, document_ids)
+        return document_ids
+
+    def get_collection_invalid_pagination(self):
+        for params in ['?limit=abc', '?limit=0', '?after=%21%21']:
+            response = self.app.get(self._prefix + params, status=400)
+            body = response.json
+            self.assertEqual(body.get('status'), 'error')
+
+    def get_collection_bbox(self, reference, add_documents):
+        """Add documents with geometries with `add_documents(count,
+        with_geometry=True)` and check that only the documents intersecting
+        the bbox are returned. `reference` is located in
+        635000,5723000,636000,5724000.
+        """
+        add_documents(2, with_geometry=True)
+
+        with QueryCounter(self.connection) as counter:
+            response = self.app.get(
+                self._prefix + '?bbox=635000,5723000,636000,5724000',
+                status=200)
+        # the geometries are loaded from the join used by the filter
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(
+            counter.statements[0].count('JOIN guidebook.documents_geometries'),
+            1)
+        body = response.json
+        self.assertEqual(len(body), 1)
+        self.assertEqual(body[0].get('document_id'), reference.document_id)
+
+        response = self.app.get(
+            self._prefix + '?bbox=0,5723000,1000,5724000', status=200)
+        self.assertEqual(len(response.json), 2)
+
+        response = self.app.get(
+            self._prefix + '?bbox=0,0,1000,1000', status=200)
+        self.assertEqual(len(response.json), 0)
+
+    def get_collection_invalid_bbox(self):
+        for bbox in ['abc', '1,2,3', '10,0,0,10']:
+            response = self.app.get(
+                self._prefix + '?bbox=' + bbox, status=400)
+            errors = response.json.get('errors')
+            self.assertEqual(errors[0].get('name'), 'bbox')
+
+    def get_collection_ids(self, add_documents):
+        """Add documents with `add_documents(count, with_geometry=True)` and
+        request all documents by id (in reverse order, with an id that does
+        not exist). The documents are loaded with a single query.
+        """
+        add_documents(3, with_geometry=True)
+        ids = [doc.document_id for doc in self.session.query(self._model)]
+        ids.reverse()
+        requested_ids = ids + [-1]
+
+        response = self.assertQueryCount(
+            self._prefix + '?ids=' + ','.join(map(str, requested_ids)), 1)
+        body = response.json
+        self.assertEqual(
+            [doc.get('document_id') for doc in body.get('documents')], ids)
+        self.assertEqual(body.get('missing'), [-1])
+        for doc in body.get('documents'):
+            self.assertIsNotNone(doc.get('geometry'))
+            self.assertEqual(len(doc.get('locales')), 2)
+
+    def get_collection_invalid_ids(self):
+        self.app.get(self._prefix + '?ids=1,a', status=400)
+        self.app.get(
+            self._prefix + '?ids=' + ','.join(map(str, range(101))),
+            status=400)
+
+    def assertQueryCount(self, url, expected_count):  # noqa
+        """Check that a GET request to the given url executes exactly the
+        given number of SQL statements.
+        """
+        with QueryCounter(self.connection) as counter:
+            response = self.app.get(url, status=200)
+        self.assertEqual(counter.count, expected_count)
+        return response
+
     def get(self, reference):
         response = self.app.get(self._prefix + '/' +
                                 str(reference.document_id),
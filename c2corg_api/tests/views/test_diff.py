@@ -0,0 +1,118 @@
+import unittest
+
+from c2corg_api.caching import version_cache, LRUCache
+from c2corg_api.models.document import DocumentGeometry
+from c2corg_api.models.document_history import DocumentVersion
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+from c2corg_api.views.diff import get_word_diff
+from c2corg_api.views.document import DocumentRest
+
+from c2corg_api.tests.views import BaseTestRest
+
+
+class TestWordDiff(unittest.TestCase):
+
+    def test_get_word_diff(self):
+        self.assertEqual(
+            get_word_diff('A small hut', 'A big hut near the lake'), [
+                {'op': 'equal', 'text': 'A'},
+                {'op': 'delete', 'text': 'small'},
+                {'op': 'insert', 'text': 'big'},
+                {'op': 'equal', 'text': 'hut'},
+                {'op': 'insert', 'text': 'near the lake'}
+            ])
+        self.assertEqual(
+            get_word_diff(None, 'A hut'), [{'op': 'insert', 'text': 'A hut'}])
+
+
+class TestDiffRest(BaseTestRest):
+
+    def setUp(self):  # noqa
+        BaseTestRest.setUp(self)
+        self.locale_en = WaypointLocale(
+            culture='en', title='Refuge', description='A small hut')
+        self.waypoint = Waypoint(
+            waypoint_type='hut', elevation=2203,
+            locales=[self.locale_en],
+            geometry=DocumentGeometry(
+                geom='SRID=3857;POINT(635956 5723604)'))
+        self.session.add(self.waypoint)
+        self.session.flush()
+        DocumentRest(None)._create_new_version(self.waypoint)
+
+        self.app.put_json(
+            '/waypoints/%d' % self.waypoint.document_id, {
+                'message': 'Update',
+                'document': {
+                    'document_id': self.waypoint.document_id,
+                    'version': self.waypoint.version,
+                    'waypoint_type': 'hut',
+                    'elevation': 2200,
+                    'locales': [{
+                        'culture': 'en', 'title': 'Refuge',
+                        'description': 'A big hut',
+                        'version': self.locale_en.version
+                    }]
+                }
+            }, status=200)
+
+        self.from_id, self.to_id = [
+            version.id for version in self.session.query(DocumentVersion).
+            filter(DocumentVersion.document_id == self.waypoint.document_id).
+            order_by(DocumentVersion.id)
+        ]
+
+    def test_get(self):
+        body = self.app.get(self._url(self.from_id, self.to_id)).json
+        self.assertEqual(body.get('from_version_id'), self.from_id)
+        self.assertEqual(body.get('to_version_id'), self.to_id)
+        self.assertEqual(
+            body.get('document'), {'elevation': {'from': 2203, 'to': 2200}})
+        self.assertEqual(
+            body.get('locale'),
+            {'description': {'from': 'A small hut', 'to': 'A big hut'}})
+        self.assertEqual(body.get('description'), [
+            {'op': 'equal', 'text': 'A'},
+            {'op': 'delete', 'text': 'small'},
+            {'op': 'insert', 'text': 'big'},
+            {'op': 'equal', 'text': 'hut'}
+        ])
+        self.assertEqual(body.get('geometry'), {})
+
+    def test_get_query_count(self):
+        # the geometry archive is shared by both versions and not loaded
+        self.assertQueryCount(self._url(self.from_id, self.to_id), 3)
+
+        # nothing is loaded for the same version
+        response = self.assertQueryCount(
+            self._url(self.from_id, self.from_id), 1)
+        body = response.json
+        self.assertEqual(body.get('document'), {})
+        self.assertEqual(body.get('locale'), {})
+        self.assertIsNone(body.get('description'))
+
+    def test_get_cached(self):
+        cache_backend = version_cache.backend
+        version_cache.backend = LRUCache(10)
+        try:
+            url = self._url(self.from_id, self.to_id)
+            body = self.app.get(url, status=200).json
+            response = self.assertQueryCount(url, 0)
+            self.assertEqual(response.json, body)
+        finally:
+            version_cache.backend = cache_backend
+
+    def test_get_not_found(self):
+        self.app.get(self._url(self.from_id, self.to_id + 1000), status=404)
+        self.app.get(
+            '/waypoints/%d/fr/diff/%d/%d' % (
+                self.waypoint.document_id, self.from_id, self.to_id),
+            status=404)
+        self.app.get(
+            '/routes/%d/en/diff/%d/%d' % (
+                self.waypoint.document_id, self.from_id, self.to_id),
+            status=404)
+
+    def _url(self, from_id, to_id):
+        return '/waypoints/%d/en/diff/%d/%d' % (
+            self.waypoint.document_id, from_id, to_id)
@@ -0,0 +1,109 @@
+from c2corg_api.models.document import DocumentGeometry
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+from c2corg_api.views import encode_cursor
+from c2corg_api.views.document import DocumentRest
+
+from c2corg_api.tests.views import BaseTestRest
+
+
+class TestHistoryRest(BaseTestRest):
+
+    def setUp(self):  # noqa
+        BaseTestRest.setUp(self)
+        self.locale_en = WaypointLocale(culture='en', title='Mont Granier')
+        self.waypoint = Waypoint(
+            waypoint_type='summit', elevation=2203,
+            locales=[
+                self.locale_en,
+                WaypointLocale(culture='fr', title='Mont Granier')
+            ],
+            geometry=DocumentGeometry(
+                geom='SRID=3857;POINT(635956 5723604)'))
+        self.session.add(self.waypoint)
+        self.session.flush()
+        DocumentRest(None)._create_new_version(self.waypoint)
+        self._prefix = '/waypoints/%d/history/' % self.waypoint.document_id
+
+        # change the English locale, then the figures
+        response = self.app.put_json(
+            '/waypoints/%d' % self.waypoint.document_id, {
+                'message': 'Add a description',
+                'document': {
+                    'document_id': self.waypoint.document_id,
+                    'version': self.waypoint.version,
+                    'waypoint_type': 'summit',
+                    'elevation': 2203,
+                    'locales': [{
+                        'culture': 'en', 'title': 'Mont Granier',
+                        'description': 'A summit',
+                        'version': self.locale_en.version
+                    }]
+                }
+            }, status=200)
+        self.app.put_json(
+            '/waypoints/%d' % self.waypoint.document_id, {
+                'message': 'Fix the elevation',
+                'document': {
+                    'document_id': self.waypoint.document_id,
+                    'version': response.json.get('version'),
+                    'waypoint_type': 'summit',
+                    'elevation': 2200,
+                    'locales': []
+                }
+            }, status=200)
+
+    def test_get(self):
+        response = self.app.get(self._prefix + 'en', status=200)
+        body = response.json
+        self.assertEqual(body.get('document_id'), self.waypoint.document_id)
+        self.assertEqual(body.get('culture'), 'en')
+
+        versions = body.get('versions')
+        self.assertEqual(len(versions), 3)
+        self.assertEqual(versions[0].get('comment'), 'Fix the elevation')
+        self.assertEqual(versions[0].get('changes'), ['document'])
+        self.assertEqual(versions[1].get('comment'), 'Add a description')
+        self.assertEqual(versions[1].get('changes'), ['locale'])
+        self.assertEqual(
+            versions[2].get('changes'), ['document', 'locale', 'geometry'])
+        self.assertIsNotNone(versions[2].get('written_at'))
+        self.assertGreater(
+            versions[0].get('version_id'), versions[1].get('version_id'))
+
+        response = self.app.get(self._prefix + 'fr', status=200)
+        versions = response.json.get('versions')
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(versions[0].get('changes'), ['document'])
+
+    def test_get_query_count(self):
+        self.assertQueryCount(self._prefix + 'en', 1)
+
+    def test_get_paginated(self):
+        response = self.app.get(self._prefix + 'en?limit=2', status=200)
+        versions = response.json.get('versions')
+        self.assertEqual(len(versions), 2)
+        link = response.headers['Link']
+        next_url = link[1:link.index('>')]
+
+        response = self.app.get(next_url, status=200)
+        versions = response.json.get('versions')
+        self.assertEqual(len(versions), 1)
+        self.assertEqual(
+            versions[0].get('changes'), ['document', 'locale', 'geometry'])
+        self.assertNotIn('Link', response.headers)
+
+    def test_get_not_found(self):
+        self.app.get(self._prefix + 'it', status=404)
+        self.app.get(
+            '/routes/%d/history/en' % self.waypoint.document_id, status=404)
+        self.app.get('/waypoints/-1/history/en', status=404)
+
+    def test_get_not_found_paginated(self):
+        after = '?after=' + encode_cursor(1000000)
+        self.app.get('/waypoints/9999999/history/en' + after, status=404)
+        self.app.get(self._prefix + 'it' + after, status=404)
+
+        # a page after the last version of an existing document is empty
+        response = self.app.get(
+            self._prefix + 'en?after=' + encode_cursor(1), status=200)
+        self.assertEqual(response.json.get('versions'), [])
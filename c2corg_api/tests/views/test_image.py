@@ -1,4 +1,5 @@
 import json
+from functools import partial
 from shapely.geometry import shape, Point
 
 from c2corg_api.models.image import (
@@ -6,7 +7,7 @@ from c2corg_api.models.image import (
 from c2corg_api.models.document import DocumentGeometry
 from c2corg_api.views.document import DocumentRest
 
-from c2corg_api.tests.views import BaseTestRest
+from c2corg_api.tests.views import BaseTestRest, add_documents
 
 
 class TestImageRest(BaseTestRest):
@@ -15,11 +16,32 @@ class TestImageRest(BaseTestRest):
         self.set_prefix_and_model(
             "/images", Image, ArchiveImage, ArchiveImageLocale)
         BaseTestRest.setUp(self)
+        self._add_documents = partial(
+            add_documents, self.session, Image, ImageLocale,
+            attributes={'activities': 'hiking', 'height': lambda i: 1000 + i})
         self._add_test_data()
 
     def test_get_collection(self):
         self.get_collection()
 
+    def test_get_collection_paginated(self):
+        self.get_collection_paginated(self.image, self._add_documents)
+
+    def test_get_collection_invalid_pagination(self):
+        self.get_collection_invalid_pagination()
+
+    def test_get_collection_bbox(self):
+        self.get_collection_bbox(self.image, self._add_documents)
+
+    def test_get_collection_invalid_bbox(self):
+        self.get_collection_invalid_bbox()
+
+    def test_get_collection_ids(self):
+        self.get_collection_ids(self._add_documents)
+
+    def test_get_collection_invalid_ids(self):
+        self.get_collection_invalid_ids()
+
     def test_get(self):
         body = self.get(self.image)
         self._assert_geometry(body)
@@ -1,4 +1,5 @@
 import json
+from functools import partial
 from shapely.geometry import shape, LineString
 
 from c2corg_api.models.route import (
@@ -6,7 +7,7 @@ from c2corg_api.models.route import (
 from c2corg_api.models.document import DocumentGeometry
 from c2corg_api.views.document import DocumentRest
 
-from c2corg_api.tests.views import BaseTestRest
+from c2corg_api.tests.views import BaseTestRest, add_documents
 
 
 class TestRouteRest(BaseTestRest):
@@ -15,11 +16,34 @@ class TestRouteRest(BaseTestRest):
         self.set_prefix_and_model(
             "/routes", Route, ArchiveRoute, ArchiveRouteLocale)
         BaseTestRest.setUp(self)
+        self._add_documents = partial(
+            add_documents, self.session, Route, RouteLocale,
+            geometry_type='LINESTRING',
+            attributes={'activities': 'hiking', 'height': lambda i: 1000 + i},
+            locale_attributes={'gear': 'shoes'})
         self._add_test_data()
 
     def test_get_collection(self):
         self.get_collection()
 
+    def test_get_collection_paginated(self):
+        self.get_collection_paginated(self.route, self._add_documents)
+
+    def test_get_collection_invalid_pagination(self):
+        self.get_collection_invalid_pagination()
+
+    def test_get_collection_bbox(self):
+        self.get_collection_bbox(self.route, self._add_documents)
+
+    def test_get_collection_invalid_bbox(self):
+        self.get_collection_invalid_bbox()
+
+    def test_get_collection_ids(self):
+        self.get_collection_ids(self._add_documents)
+
+    def test_get_collection_invalid_ids(self):
+        self.get_collection_invalid_ids()
+
     def test_get(self):
         body = self.get(self.route)
         self.assertEqual(
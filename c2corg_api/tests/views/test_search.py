@@ -0,0 +1,142 @@
+from c2corg_api.models.route import Route, RouteLocale
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+
+from c2corg_api.tests.views import BaseTestRest
+
+
+class TestSearchRest(BaseTestRest):
+
+    def setUp(self):  # noqa
+        BaseTestRest.setUp(self)
+        self._add_test_data()
+
+    def test_search(self):
+        response = self.app.get('/search?q=refuges', status=200)
+        documents = response.json.get('documents')
+        document_ids = [doc.get('document_id') for doc in documents]
+        # the match in the title ranks higher
+        self.assertEqual(
+            document_ids,
+            [self.waypoint_hut.document_id, self.waypoint_lake.document_id])
+        self.assertEqual(documents[0].get('type'), 'w')
+        self.assertEqual(len(documents[0].get('locales')), 2)
+
+    def test_search_culture(self):
+        response = self.app.get('/search?q=hut&l=en', status=200)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(
+            documents[0].get('document_id'), self.waypoint_hut.document_id)
+        locales = documents[0].get('locales')
+        self.assertEqual(len(locales), 1)
+        self.assertEqual(locales[0].get('culture'), 'en')
+
+        response = self.app.get('/search?q=hut&l=fr', status=200)
+        self.assertEqual(len(response.json.get('documents')), 0)
+
+    def test_search_type_specific_text(self):
+        response = self.app.get('/search?q=crampons&t=r', status=200)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(
+            documents[0].get('document_id'), self.route.document_id)
+        self.assertEqual(documents[0].get('type'), 'r')
+
+        response = self.app.get('/search?q=crampons&t=w', status=200)
+        self.assertEqual(len(response.json.get('documents')), 0)
+
+    def test_search_updated_locale(self):
+        locale = self.waypoint_lake.get_locale('fr')
+        locale.title = 'Lac des Chamois'
+        self.session.flush()
+
+        response = self.app.get('/search?q=chamois&l=fr', status=200)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(
+            documents[0].get('document_id'), self.waypoint_lake.document_id)
+
+    def test_search_paginated(self):
+        response = self.app.get('/search?q=refuge&limit=1', status=200)
+        self.assertEqual(len(response.json.get('documents')), 1)
+        link = response.headers.get('Link')
+        self.assertIsNotNone(link)
+
+        response = self.app.get(link[1:link.index('>')], status=200)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(
+            documents[0].get('document_id'), self.waypoint_lake.document_id)
+        self.assertNotIn('Link', response.headers)
+
+    def test_search_invalid(self):
+        for params in ['', '?q=', '?q=refuge&l=xx', '?q=refuge&t=x',
+                       '?q=refuge&limit=0', '?q=refuge&offset=-1']:
+            response = self.app.get('/search' + params, status=400)
+            self.assertEqual(response.json.get('status'), 'error')
+
+    def test_autocomplete(self):
+        response = self.app.get('/autocomplete?q=gout', status=200)
+        results = response.json
+        self.assertEqual(len(results), 2)
+        # the title starting with the terms comes first
+        self.assertEqual(results[0], {
+            'document_id': self.waypoint_hut.document_id,
+            'type': 'w',
+            'culture': 'en',
+            'title': 'Gouter hut'
+        })
+        self.assertEqual(results[1].get('title'), 'Refuge du Gouter')
+
+    def test_autocomplete_filters(self):
+        response = self.app.get('/autocomplete?q=gout&l=fr', status=200)
+        results = response.json
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].get('culture'), 'fr')
+
+        response = self.app.get('/autocomplete?q=ret&t=r', status=200)
+        results = response.json
+        self.assertEqual(len(results), 1)
+        self.assertEqual(
+            results[0].get('document_id'), self.route.document_id)
+
+        response = self.app.get('/autocomplete?q=gout&limit=1', status=200)
+        self.assertEqual(len(response.json), 1)
+
+    def test_autocomplete_wildcards(self):
+        response = self.app.get('/autocomplete?q=%25%25%25', status=200)
+        self.assertEqual(len(response.json), 0)
+
+    def test_autocomplete_invalid(self):
+        for params in ['', '?q=go', '?q=gout&l=xx', '?q=gout&limit=0']:
+            response = self.app.get('/autocomplete' + params, status=400)
+            self.assertEqual(response.json.get('status'), 'error')
+
+    def _add_test_data(self):
+        self.waypoint_hut = Waypoint(
+            waypoint_type='hut', elevation=2800,
+            locales=[
+                WaypointLocale(
+                    culture='fr', title='Refuge du Gouter',
+                    description='Un grand refuge'),
+                WaypointLocale(
+                    culture='en', title='Gouter hut',
+                    description='A large hut')
+            ])
+        self.waypoint_lake = Waypoint(
+            waypoint_type='lake', elevation=2100,
+            locales=[
+                WaypointLocale(
+                    culture='fr', title='Lac Blanc',
+                    description='Pres des refuges de la Flegere')
+            ])
+        self.route = Route(
+            activities='snow_ice_mixed', height=800,
+            locales=[
+                RouteLocale(
+                    culture='fr', title='Arete des Cosmiques',
+                    gear='crampons, piolet')
+            ])
+        self.session.add_all(
+            [self.waypoint_hut, self.waypoint_lake, self.route])
+        self.session.flush()
@@ -0,0 +1,80 @@
+import unittest
+
+from shapely.geometry import Point
+from geoalchemy2.shape import from_shape
+
+from c2corg_api.models.document import DocumentGeometry
+from c2corg_api.models.waypoint import (
+    Waypoint, WaypointLocale, schema_waypoint)
+from c2corg_api.models.route import Route, RouteLocale, schema_route
+from c2corg_api.views import serialize
+from c2corg_api.views.serializer import (
+    get_serializer, GEOMETRY_FORMAT_GEOJSON)
+
+
+class TestSerializer(unittest.TestCase):
+
+    def test_waypoint(self):
+        waypoint = Waypoint(
+            document_id=1, version=2, waypoint_type='summit', elevation=2203,
+            locales=[
+                WaypointLocale(
+                    version=3, culture='en', title='Mont Granier',
+                    description='...', pedestrian_access='yep'),
+                WaypointLocale(
+                    version=4, culture='fr', title='Mont Granier')
+            ],
+            geometry=DocumentGeometry(
+                version=5, geom=from_shape(Point(1.0, 2.0), srid=3857)))
+        self._assert_same_result(waypoint, schema_waypoint)
+
+        data = get_serializer(schema_waypoint)(waypoint)
+        self.assertEqual(data['elevation'], 2203)
+        self.assertIsNone(data['maps_info'])
+        self.assertEqual(len(data['locales']), 2)
+        self.assertIsInstance(data['locales'][0]['title'], unicode)
+        self.assertEqual(
+            data['geometry']['geom'],
+            '{"type": "Point", "coordinates": [1.0, 2.0]}')
+
+    def test_route_without_geometry(self):
+        route = Route(
+            document_id=1, version=1, activities='skitouring', height=1200,
+            locales=[
+                RouteLocale(version=1, culture='en', title='A', gear='...')
+            ])
+        self._assert_same_result(route, schema_route)
+
+        data = get_serializer(schema_route)(route)
+        self.assertIsNone(data['geometry'])
+        self.assertEqual(data['locales'][0]['gear'], '...')
+
+    def test_geojson(self):
+        geometry = DocumentGeometry(
+            version=1, geom=from_shape(Point(1.0, 2.0), srid=3857))
+        waypoint = Waypoint(
+            document_id=1, version=1, waypoint_type='summit',
+            locales=[], geometry=geometry)
+        serializer = get_serializer(schema_waypoint, GEOMETRY_FORMAT_GEOJSON)
+
+        # without GeoJSON generated by the database, the geometry is
+        # converted in Python
+        data = serializer(waypoint)
+        self.assertEqual(
+            data['geometry']['geom'],
+            {'type': 'Point', 'coordinates': (1.0, 2.0)})
+
+        geometry.geom_geojson = '{"type":"Point","coordinates":[3,4]}'
+        data = serializer(waypoint)
+        self.assertEqual(
+            data['geometry']['geom'],
+            {'type': 'Point', 'coordinates': [3, 4]})
+
+    def test_compiled_once(self):
+        self.assertIs(
+            get_serializer(schema_waypoint), get_serializer(schema_waypoint))
+
+    def _assert_same_result(self, document, schema):
+        self.assertEqual(
+            get_serializer(schema)(document),
+            serialize(schema.dictify(document)))
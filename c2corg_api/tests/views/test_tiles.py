@@ -0,0 +1,143 @@
+import unittest
+import transaction
+
+from c2corg_api.caching import tile_cache, LRUCache
+from c2corg_api.models.document import DocumentGeometry
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+from c2corg_api.views.tiles import (
+    get_tile_bounds, get_tile_range, invalidate_tiles, TILE_CONTENT_TYPE)
+
+from c2corg_api.tests.views import BaseTestRest
+
+
+class TestTileCoordinates(unittest.TestCase):
+
+    def test_get_tile_bounds(self):
+        minx, miny, maxx, maxy = get_tile_bounds(0, 0, 0)
+        self.assertAlmostEqual(minx, -20037508.34, places=2)
+        self.assertAlmostEqual(maxy, 20037508.34, places=2)
+
+        minx, miny, maxx, maxy = get_tile_bounds(1, 1, 0)
+        self.assertAlmostEqual(minx, 0)
+        self.assertAlmostEqual(miny, 0)
+
+    def test_get_tile_range(self):
+        point = (635956, 5723604, 635956, 5723604)
+        self.assertEqual(get_tile_range(point, 0), (0, 0, 0, 0))
+        self.assertEqual(get_tile_range(point, 10), (528, 365, 528, 365))
+
+        # the buffer extends to the neighbouring tiles
+        minx, miny, maxx, maxy = get_tile_bounds(10, 528, 365)
+        self.assertEqual(
+            get_tile_range((minx + 1, miny + 1, minx + 1, miny + 1), 10, 64),
+            (527, 365, 528, 366))
+
+
+class TestInvalidateTiles(unittest.TestCase):
+
+    def setUp(self):  # noqa
+        self.cache_backend = tile_cache.backend
+        tile_cache.backend = LRUCache(100)
+        for z, x, y in [(0, 0, 0), (10, 528, 365), (10, 0, 0)]:
+            tile_cache.set('waypoints', z, x, y, '', b'\x1a\x00')
+        tile_cache.set('routes', 10, 528, 365, '', b'\x1a\x00')
+
+    def tearDown(self):  # noqa
+        tile_cache.backend = self.cache_backend
+
+    def test_invalidate_tiles(self):
+        point = (635956, 5723604, 635956, 5723604)
+        with transaction.manager:
+            invalidate_tiles('waypoints', [None, point])
+            # the tiles are only invalidated after the commit
+            self.assertIsNotNone(
+                tile_cache.get('waypoints', 10, 528, 365, ''))
+
+        self.assertIsNone(tile_cache.get('waypoints', 0, 0, 0, ''))
+        self.assertIsNone(tile_cache.get('waypoints', 10, 528, 365, ''))
+        self.assertEqual(
+            tile_cache.get_cached_tiles('waypoints', 10), {(0, 0)})
+        self.assertIsNotNone(tile_cache.get('routes', 10, 528, 365, ''))
+
+    def test_invalidate_tiles_abort(self):
+        point = (635956, 5723604, 635956, 5723604)
+        try:
+            with transaction.manager:
+                invalidate_tiles('waypoints', [point])
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertIsNotNone(tile_cache.get('waypoints', 10, 528, 365, ''))
+
+
+class TestTilesRest(BaseTestRest):
+
+    def setUp(self):  # noqa
+        BaseTestRest.setUp(self)
+        self.waypoint = Waypoint(
+            waypoint_type='summit', elevation=2203,
+            locales=[WaypointLocale(culture='fr', title='Mont Granier')],
+            geometry=DocumentGeometry(
+                geom='SRID=3857;POINT(635956 5723604)'))
+        self.session.add(self.waypoint)
+        self.session.flush()
+
+    def test_get(self):
+        response = self.app.get('/tiles/waypoints/10/528/365.mvt', status=200)
+        self.assertEqual(response.content_type, TILE_CONTENT_TYPE)
+        self.assertIn(b'Mont Granier', response.body)
+        self.assertIn(b'summit', response.body)
+
+    def test_get_empty(self):
+        response = self.app.get('/tiles/waypoints/10/0/0.mvt', status=200)
+        self.assertEqual(response.body, b'')
+        response = self.app.get('/tiles/routes/10/528/365.mvt', status=200)
+        self.assertEqual(response.body, b'')
+
+    def test_get_invalid(self):
+        self.app.get('/tiles/waypoints/1/2/0.mvt', status=400)
+        self.app.get('/tiles/waypoints/23/0/0.mvt', status=400)
+        self.app.get('/tiles/waypoints/10/528/365.mvt?l=xx', status=400)
+        self.app.get('/tiles/outings/10/528/365.mvt', status=404)
+
+    def test_get_cached(self):
+        cache_backend = tile_cache.backend
+        tile_cache.backend = LRUCache(100)
+        try:
+            path = '/tiles/waypoints/10/528/365.mvt'
+            body = self.app.get(path, status=200).body
+
+            # the second request is served from the cache
+            response = self.assertQueryCount(path, 0)
+            self.assertEqual(response.body, body)
+
+            # moving the waypoint invalidates the tiles at the old location
+            body_put = {
+                'message': 'Update',
+                'document': {
+                    'document_id': self.waypoint.document_id,
+                    'version': self.waypoint.version,
+                    'waypoint_type': 'summit',
+                    'elevation': 2203,
+                    'geometry': {
+                        'version': self.waypoint.geometry.version,
+                        'geom': '{"type": "Point", "coordinates": [0, 0]}'
+                    },
+                    'locales': []
+                }
+            }
+            # only run the hooks registered by this request, not the ones
+            # left on the transaction of the thread by other tests
+            hook_count = len(list(transaction.get().getAfterCommitHooks()))
+            self.app.put_json(
+                '/waypoints/%d' % self.waypoint.document_id, body_put,
+                status=200)
+            # the tiles are invalidated once the transaction is committed,
+            # which the tests do not do
+            self.assertQueryCount(path, 0)
+            hooks = list(transaction.get().getAfterCommitHooks())
+            for hook, args, kws in hooks[hook_count:]:
+                hook(True, *args, **kws)
+            self.assertEqual(self.app.get(path, status=200).body, b'')
+        finally:
+            tile_cache.backend = cache_backend
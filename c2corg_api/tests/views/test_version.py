@@ -0,0 +1,144 @@
+from c2corg_api.caching import version_cache, LRUCache
+from c2corg_api.models.document import DocumentGeometry
+from c2corg_api.models.document_history import DocumentVersion
+from c2corg_api.models.waypoint import Waypoint, WaypointLocale
+from c2corg_api.views.document import DocumentRest
+
+from c2corg_api.tests.views import BaseTestRest
+
+
+class TestVersionRest(BaseTestRest):
+
+    def setUp(self):  # noqa
+        BaseTestRest.setUp(self)
+        self.waypoint = Waypoint(
+            waypoint_type='summit', elevation=2203,
+            locales=[
+                WaypointLocale(
+                    culture='en', title='Mont Granier',
+                    pedestrian_access='yep'),
+                WaypointLocale(culture='fr', title='Mont Granier')
+            ],
+            geometry=DocumentGeometry(
+                geom='SRID=3857;POINT(635956 5723604)'))
+        self.session.add(self.waypoint)
+        self.session.flush()
+        DocumentRest(None)._create_new_version(self.waypoint)
+
+        self.app.put_json(
+            '/waypoints/%d' % self.waypoint.document_id, {
+                'message': 'Fix the elevation',
+                'document': {
+                    'document_id': self.waypoint.document_id,
+                    'version': self.waypoint.version,
+                    'waypoint_type': 'summit',
+                    'elevation': 2200,
+                    'locales': []
+                }
+            }, status=200)
+
+        self.versions_en = [
+            version.id for version in self.session.query(DocumentVersion).
+            filter(DocumentVersion.document_id == self.waypoint.document_id).
+            filter(DocumentVersion.culture == 'en').
+            order_by(DocumentVersion.id)
+        ]
+
+    def test_get(self):
+        response = self.app.get(self._url('en', self.versions_en[0]))
+        body = response.json
+        document = body.get('document')
+        self.assertEqual(
+            document.get('document_id'), self.waypoint.document_id)
+        self.assertEqual(document.get('elevation'), 2203)
+        self.assertEqual(document.get('version'), 1)
+        locales = document.get('locales')
+        self.assertEqual(len(locales), 1)
+        self.assertEqual(locales[0].get('culture'), 'en')
+        self.assertEqual(locales[0].get('pedestrian_access'), 'yep')
+        self.assertIn('635956', document.get('geometry').get('geom'))
+        self.assertEqual(
+            body.get('version').get('version_id'), self.versions_en[0])
+        self.assertIn('max-age', response.headers['Cache-Control'])
+
+        response = self.app.get(self._url('en', self.versions_en[1]))
+        body = response.json
+        self.assertEqual(body.get('document').get('elevation'), 2200)
+        self.assertEqual(
+            body.get('version').get('comment'), 'Fix the elevation')
+
+    def test_get_query_count(self):
+        self.assertQueryCount(self._url('en', self.versions_en[0]), 1)
+
+    def test_get_cached(self):
+        cache_backend = version_cache.backend
+        version_cache.backend = LRUCache(10)
+        try:
+            url = self._url('en', self.versions_en[0])
+            body = self.app.get(url, status=200).json
+            response = self.assertQueryCount(url, 0)
+            self.assertEqual(response.json, body)
+        finally:
+            version_cache.backend = cache_backend
+
+    def test_get_locale_deltas(self):
+        settings = self.app.app.registry.settings
+        settings['archives.locale_deltas'] = 'true'
+        try:
+            url = '/waypoints/%d' % self.waypoint.document_id
+            for description in ['A summit', 'A summit\nwith a cross']:
+                current = self.app.get(url, status=200).json
+                self.app.put_json(url, {
+                    'message': 'Update',
+                    'document': {
+                        'document_id': self.waypoint.document_id,
+                        'version': current.get('version'),
+                        'waypoint_type': 'summit',
+                        'elevation': 2200,
+                        'locales': [{
+                            'culture': 'en', 'title': 'Mont Granier',
+                            'description': description,
+                            'pedestrian_access': 'yep',
+                            'version': self._get_locale(current, 'en').get(
+                                'version')
+                        }]
+                    }
+                }, status=200)
+        finally:
+            del settings['archives.locale_deltas']
+
+        versions = [
+            version for version in self.session.query(DocumentVersion).
+            filter(DocumentVersion.document_id == self.waypoint.document_id).
+            filter(DocumentVersion.culture == 'en').
+            order_by(DocumentVersion.id)
+        ]
+        # the new archives are stored as deltas
+        self.assertIsNotNone(
+            versions[-1].document_locales_archive.snapshot_id)
+
+        response = self.app.get(self._url('en', versions[-1].id))
+        locale = response.json.get('document').get('locales')[0]
+        self.assertEqual(locale.get('description'), 'A summit\nwith a cross')
+        self.assertEqual(locale.get('pedestrian_access'), 'yep')
+
+    def test_get_not_found(self):
+        version_id = self.versions_en[0]
+        # the version exists, but for another culture, document or type
+        self.app.get(self._url('fr', version_id), status=404)
+        self.app.get(
+            '/waypoints/%d/en/%d' % (
+                self.waypoint.document_id + 1, version_id),
+            status=404)
+        self.app.get(
+            '/routes/%d/en/%d' % (self.waypoint.document_id, version_id),
+            status=404)
+
+    def _get_locale(self, document, culture):
+        return next(
+            locale for locale in document.get('locales')
+            if locale.get('culture') == culture)
+
+    def _url(self, culture, version_id):
+        return '/waypoints/%d/%s/%d' % (
+            self.waypoint.document_id, culture, version_id)
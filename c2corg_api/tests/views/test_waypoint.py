@@ -1,13 +1,18 @@
 import json
+from contextlib import contextmanager
+from functools import partial
 from shapely.geometry import shape, Point
 
 from c2corg_api.models.waypoint import (
     Waypoint, WaypointLocale, ArchiveWaypoint, ArchiveWaypointLocale)
 from c2corg_api.models.document import (
     DocumentGeometry, ArchiveDocumentGeometry)
+from c2corg_api.models.document_history import DocumentVersion
+from c2corg_api.views import document as document_view
 from c2corg_api.views.document import DocumentRest
+from c2corg_api.caching import document_cache, LRUCache
 
-from c2corg_api.tests.views import BaseTestRest
+from c2corg_api.tests.views import BaseTestRest, add_documents, QueryCounter
 
 
 class TestWaypointRest(BaseTestRest):
@@ -16,11 +21,248 @@ class TestWaypointRest(BaseTestRest):
         self.set_prefix_and_model(
             "/waypoints", Waypoint, ArchiveWaypoint, ArchiveWaypointLocale)
         BaseTestRest.setUp(self)
+        self._add_documents = partial(
+            add_documents, self.session, Waypoint, WaypointLocale,
+            attributes={
+                'waypoint_type': 'summit', 'elevation': lambda i: 1000 + i},
+            locale_attributes={'pedestrian_access': 'yes'})
         self._add_test_data()
 
     def test_get_collection(self):
         self.get_collection()
 
+    def test_get_collection_paginated(self):
+        self.get_collection_paginated(self.waypoint, self._add_documents)
+
+    def test_get_collection_limit(self):
+        self._add_documents(2)
+        response = self.app.get(self._prefix + '?limit=2', status=200)
+        self.assertEqual(len(response.json), 2)
+        self.assertIn('Link', response.headers)
+
+        response = self.app.get(self._prefix + '?limit=1000', status=200)
+        self.assertEqual(len(response.json), 3)
+        self.assertNotIn('Link', response.headers)
+
+    def test_get_collection_invalid_pagination(self):
+        self.get_collection_invalid_pagination()
+
+    def test_get_collection_bbox(self):
+        self.get_collection_bbox(self.waypoint, self._add_documents)
+
+    def test_get_collection_clusters(self):
+        self._add_documents(3, with_geometry=True)
+        hut = Waypoint(
+            waypoint_type='hut',
+            geometry=DocumentGeometry(geom='SRID=3857;POINT(200 5723700)'))
+        self.session.add(hut)
+        self.session.flush()
+
+        response = self.app.get(
+            self._prefix + '?bbox=0,5700000,700000,5800000&cluster=100000'
+            '&geom_format=geojson',
+            status=200)
+        body = response.json
+        self.assertEqual(len(body), 2)
+        self.assertEqual(body[0].get('count'), 4)
+        self.assertEqual(
+            body[0].get('waypoint_types'), {'summit': 3, 'hut': 1})
+        self.assertEqual(
+            body[0].get('geometry').get('geom').get('coordinates'),
+            [125, 5723628])
+        self.assertEqual(body[1].get('count'), 1)
+        self.assertEqual(body[1].get('waypoint_types'), {'summit': 1})
+
+    def test_get_collection_invalid_clusters(self):
+        for params in [
+                'cluster=1000',
+                'bbox=0,0,1000,1000&cluster=abc',
+                'bbox=0,0,1000,1000&cluster=1']:
+            response = self.app.get(self._prefix + '?' + params, status=400)
+            errors = response.json.get('errors')
+            self.assertEqual(errors[0].get('name'), 'cluster')
+
+    def test_get_nearby(self):
+        self._add_documents(3, with_geometry=True)
+        hut = Waypoint(
+            waypoint_type='hut',
+            geometry=DocumentGeometry(geom='SRID=3857;POINT(150 5723604)'))
+        self.session.add(hut)
+        self.session.flush()
+
+        response = self.app.get(
+            self._prefix + '/nearby?point=0,5723604&waypoint_type=summit'
+            '&limit=2',
+            status=200)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[0].get('distance'), 0)
+        self.assertEqual(documents[0].get('elevation'), 1000)
+        self.assertEqual(documents[1].get('elevation'), 1001)
+        # distances are in meters, not in EPSG:3857 units
+        self.assertAlmostEqual(documents[1].get('distance'), 70, delta=1)
+        self.assertEqual(len(documents[1].get('locales')), 2)
+
+        response = self.app.get(
+            self._prefix + '/nearby?point=0,5723604&waypoint_type=hut,access'
+            '&l=en',
+            status=200)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(documents[0].get('document_id'), hut.document_id)
+
+    def test_get_nearby_invalid(self):
+        for params, name in [
+                ('', 'point'),
+                ('point=1', 'point'),
+                ('point=1,2&waypoint_type=abc', 'waypoint_type')]:
+            response = self.app.get(
+                self._prefix + '/nearby?' + params, status=400)
+            errors = response.json.get('errors')
+            self.assertEqual(errors[0].get('name'), name)
+
+    def test_get_collection_invalid_bbox(self):
+        self.get_collection_invalid_bbox()
+
+    def test_get_collection_query_count(self):
+        """The geometries and locales of all documents in a page are loaded
+        with the documents, not with one query per document.
+        """
+        self._add_documents(10, with_geometry=True)
+        response = self.assertQueryCount(self._prefix, 1)
+        body = response.json
+        self.assertEqual(len(body), 11)
+        for doc in body:
+            self.assertIsNotNone(doc.get('geometry'))
+            self.assertGreater(len(doc.get('locales')), 0)
+
+    def test_get_query_count(self):
+        prefix = self._prefix + '/' + str(self.waypoint.document_id)
+        response = self.assertQueryCount(prefix, 1)
+        locale_en = response.json.get('locales')[0]
+        self.assertEqual(locale_en.get('pedestrian_access'), 'yep')
+        self._assert_geometry(response.json)
+
+        response = self.assertQueryCount(prefix + '?l=en', 1)
+        self._assert_geometry(response.json)
+
+    def test_get_geojson(self):
+        """API version 2 returns the geometries as GeoJSON objects, which are
+        generated by the database.
+        """
+        prefix = self._prefix + '/' + str(self.waypoint.document_id)
+        with QueryCounter(self.connection) as counter:
+            response = self.app.get(
+                prefix, headers={'X-Api-Version': '2'}, status=200)
+        self.assertEqual(counter.count, 2)
+        self._assert_geojson_geometry(response.json)
+
+        response = self.app.get(prefix + '?geom_format=geojson', status=200)
+        self._assert_geojson_geometry(response.json)
+
+        # geometries can still be requested as strings with API version 2
+        response = self.app.get(
+            prefix + '?geom_format=string', headers={'X-Api-Version': '2'},
+            status=200)
+        self._assert_geometry(response.json)
+
+    def test_get_collection_geojson(self):
+        self._add_documents(3, with_geometry=True)
+        response = self.assertQueryCount(
+            self._prefix + '?geom_format=geojson', 2)
+        body = response.json
+        self.assertEqual(len(body), 4)
+        for doc in body:
+            geom = doc.get('geometry').get('geom')
+            self.assertEqual(geom.get('type'), 'Point')
+
+    def test_get_invalid_geometry_format(self):
+        response = self.app.get(
+            self._prefix + '?geom_format=wkt', status=400)
+        self.assertEqual(response.json.get('status'), 'error')
+
+    def test_get_collection_ids(self):
+        self.get_collection_ids(self._add_documents)
+
+    def test_get_collection_ids_culture(self):
+        self._add_documents(3)
+        ids = [
+            doc.document_id for doc in self.session.query(Waypoint).all()]
+
+        response = self.assertQueryCount(
+            self._prefix + '?l=fr&ids=' + ','.join(map(str, ids)), 2)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 4)
+        for doc in documents:
+            locales = doc.get('locales')
+            self.assertEqual(len(locales), 1)
+            self.assertEqual(locales[0].get('culture'), 'fr')
+            self.assertIsNotNone(locales[0].get('pedestrian_access'))
+
+    def test_get_collection_invalid_ids(self):
+        self.get_collection_invalid_ids()
+
+    def _get_export(self, url):
+        """Export with a session bound to the connection of the test (the
+        test data is not committed, so the dedicated connection used by the
+        export would not see it).
+        """
+        @contextmanager
+        def export_session(bind):
+            session = self.Session(bind=self.connection)
+            try:
+                yield session
+            finally:
+                session.close()
+
+        original_export_session = document_view.export_session
+        document_view.export_session = export_session
+        try:
+            return self.app.get(url, status=200)
+        finally:
+            document_view.export_session = original_export_session
+
+    def test_export(self):
+        self._add_documents(4, with_geometry=True)
+
+        # export in several batches
+        batch_size = document_view.EXPORT_BATCH_SIZE
+        document_view.EXPORT_BATCH_SIZE = 2
+        try:
+            response = self._get_export(self._prefix + '/export')
+        finally:
+            document_view.EXPORT_BATCH_SIZE = batch_size
+        self.assertEqual(response.content_type, 'application/x-ndjson')
+
+        documents = [
+            json.loads(line) for line in response.body.splitlines()]
+        self.assertEqual(len(documents), 5)
+        document_ids = [doc.get('document_id') for doc in documents]
+        self.assertEqual(document_ids, sorted(document_ids))
+        self.assertIn(self.waypoint.document_id, document_ids)
+        for doc in documents:
+            self.assertEqual(doc.get('type'), 'w')
+            self.assertEqual(len(doc.get('locales')), 2)
+            self.assertIsNotNone(doc.get('geometry'))
+
+    def test_export_geojson(self):
+        response = self._get_export(
+            self._prefix + '/export?geom_format=geojson')
+        documents = [
+            json.loads(line) for line in response.body.splitlines()]
+        self.assertEqual(len(documents), 1)
+        self._assert_geojson_geometry(documents[0])
+
+    def test_export_session(self):
+        with document_view.export_session(self.engine) as session:
+            self.assertEqual(
+                session.execute('SHOW transaction_isolation').scalar(),
+                'repeatable read')
+            self.assertEqual(
+                session.execute('SHOW transaction_read_only').scalar(), 'on')
+            connection = session.connection()
+        self.assertTrue(connection.closed)
+
     def test_get(self):
         body = self.get(self.waypoint)
         self._assert_geometry(body)
@@ -28,6 +270,101 @@ class TestWaypointRest(BaseTestRest):
     def test_get_lang(self):
         self.get_lang(self.waypoint)
 
+    def test_get_cached(self):
+        cache_backend = document_cache.backend
+        document_cache.backend = LRUCache(10)
+        try:
+            prefix = self._prefix + '/' + str(self.waypoint.document_id)
+            body = self.get(self.waypoint)
+
+            # the second request is served from the cache
+            response = self.assertQueryCount(prefix, 0)
+            self.assertEqual(response.json, body)
+
+            # the cultures are cached separately
+            self.assertQueryCount(prefix + '?l=en', 1)
+
+            # an update invalidates the cache
+            body_put = {
+                'message': 'Update',
+                'document': {
+                    'document_id': self.waypoint.document_id,
+                    'version': self.waypoint.version,
+                    'waypoint_type': 'summit',
+                    'elevation': 1234,
+                    'locales': []
+                }
+            }
+            self.app.put_json(prefix, body_put, status=200)
+            response = self.app.get(prefix, status=200)
+            self.assertEqual(response.json.get('elevation'), 1234)
+        finally:
+            document_cache.backend = cache_backend
+
+    def test_get_etag(self):
+        prefix = self._prefix + '/' + str(self.waypoint.document_id)
+        response = self.app.get(prefix, status=200)
+        etag = response.headers.get('ETag')
+        self.assertIsNotNone(etag)
+
+        # only the version numbers are loaded to check the ETag
+        with QueryCounter(self.connection) as counter:
+            response = self.app.get(
+                prefix, headers={'If-None-Match': etag}, status=304)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(response.headers.get('ETag'), etag)
+
+        # the ETag depends on the culture and on the geometry format
+        response = self.app.get(
+            prefix + '?l=en', headers={'If-None-Match': etag}, status=200)
+        etag_en = response.headers.get('ETag')
+        self.assertNotEqual(etag_en, etag)
+        self.app.get(
+            prefix + '?l=en', headers={'If-None-Match': etag_en}, status=304)
+        self.app.get(
+            prefix + '?geom_format=geojson', headers={'If-None-Match': etag},
+            status=200)
+
+        # the ETag changes when the document is updated
+        body_put = {
+            'message': 'Update',
+            'document': {
+                'document_id': self.waypoint.document_id,
+                'version': self.waypoint.version,
+                'waypoint_type': 'summit',
+                'elevation': 1234,
+                'locales': []
+            }
+        }
+        self.app.put_json(prefix, body_put, status=200)
+        response = self.app.get(
+            prefix, headers={'If-None-Match': etag}, status=200)
+        self.assertNotEqual(response.headers.get('ETag'), etag)
+
+    def test_get_etag_cached(self):
+        cache_backend = document_cache.backend
+        document_cache.backend = LRUCache(10)
+        try:
+            prefix = self._prefix + '/' + str(self.waypoint.document_id)
+            etag = self.app.get(prefix, status=200).headers.get('ETag')
+            with QueryCounter(self.connection) as counter:
+                self.app.get(
+                    prefix, headers={'If-None-Match': etag}, status=304)
+            self.assertEqual(counter.count, 0)
+        finally:
+            document_cache.backend = cache_backend
+
+    def test_get_collection_etag(self):
+        response = self.app.get(self._prefix, status=200)
+        etag = response.headers.get('ETag')
+        self.assertIsNotNone(etag)
+        self.app.get(
+            self._prefix, headers={'If-None-Match': etag}, status=304)
+
+        self._add_documents(1)
+        self.app.get(
+            self._prefix, headers={'If-None-Match': etag}, status=200)
+
     def test_post_error(self):
         body = self.post_error({})
         errors = body.get('errors')
@@ -100,6 +437,73 @@ class TestWaypointRest(BaseTestRest):
         self.assertEqual(archive_geometry.version, doc.geometry.version)
         self.assertIsNotNone(archive_geometry.geom)
 
+    def test_post_batch(self):
+        body = {
+            'documents': [
+                {
+                    'waypoint_type': 'summit', 'elevation': 3779,
+                    'geometry': {
+                        'geom':
+                            '{"type": "Point", '
+                            '"coordinates": [635956, 5723604]}'
+                    },
+                    'locales': [
+                        {'culture': 'fr', 'title': 'Mont Pourri'},
+                        {'culture': 'en', 'title': 'Mont Pourri'}
+                    ]
+                },
+                {
+                    'waypoint_type': 'pass', 'elevation': 2000,
+                    'locales': [{'culture': 'fr', 'title': 'Col'}]
+                }
+            ]
+        }
+        response = self.app.post_json(
+            self._prefix + '/batch', body, status=200)
+        documents = response.json.get('documents')
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[0].get('elevation'), 3779)
+        self.assertEqual(documents[1].get('elevation'), 2000)
+        self._assert_geometry(documents[0])
+
+        for document, locale_count in zip(documents, [2, 1]):
+            self.assertEqual(document.get('version'), 1)
+            doc = self.session.query(Waypoint).get(
+                document.get('document_id'))
+            self.assertEqual(len(doc.versions), locale_count)
+            version = doc.versions[0]
+            self.assertEqual(version.history_metadata.comment, 'creation')
+            self.assertEqual(
+                version.document_archive.elevation, doc.elevation)
+
+    def test_post_batch_invalid(self):
+        body = {
+            'documents': [
+                {
+                    'waypoint_type': 'summit',
+                    'locales': [{'culture': 'fr', 'title': 'Mont Pourri'}]
+                },
+                {
+                    'waypoint_type': 'pass',
+                    'locales': [{'culture': 'fr'}]
+                }
+            ]
+        }
+        response = self.app.post_json(
+            self._prefix + '/batch', body, status=400)
+        errors = response.json.get('errors')
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(
+            errors[0].get('name'), 'documents.1.locales.0.title')
+
+        # no document was created
+        self.assertEqual(self.session.query(Waypoint).count(), 1)
+
+        response = self.app.post_json(
+            self._prefix + '/batch', {'documents': []}, status=400)
+        self.assertEqual(
+            response.json.get('errors')[0].get('name'), 'documents')
+
     def test_put_wrong_document_id(self):
         body = {
             'document': {
@@ -322,6 +726,109 @@ class TestWaypointRest(BaseTestRest):
 
         self.assertEquals(waypoint.get_locale('en').pedestrian_access, 'no')
 
+    def test_put_query_count(self):
+        """The archives of the unchanged parts (document, geometry) are
+        resolved with a single query.
+        """
+        body = {
+            'message': 'Changing lang',
+            'document': {
+                'document_id': self.waypoint.document_id,
+                'version': self.waypoint.version,
+                'waypoint_type': 'summit',
+                'elevation': 2203,
+                'locales': [
+                    {'culture': 'en', 'title': 'Mont Granier',
+                     'description': '...', 'pedestrian_access': 'no',
+                     'version': self.locale_en.version}
+                ]
+            }
+        }
+        with QueryCounter(self.connection) as counter:
+            self.app.put_json(
+                self._prefix + '/' + str(self.waypoint.document_id), body,
+                status=200)
+        # 1 select of the document, 2 updates of the locale, 1 select of
+        # the current archives, 4 inserts (history metadata, locale archive
+        # (2 tables), version)
+        self.assertEqual(counter.count, 8)
+
+    def test_put_without_versions(self):
+        """A document without versions (e.g. imported without history) can
+        be updated, the missing archives are created.
+        """
+        waypoint = self._add_waypoint_without_versions()
+        self._put_lang_only(waypoint)
+
+        version = self._get_single_version(waypoint)
+        self.assertEqual(version.document_archive.version, waypoint.version)
+        self.assertEqual(
+            version.document_geometry_archive.version,
+            waypoint.geometry.version)
+        self.assertEqual(version.document_locales_archive.culture, 'en')
+
+    def test_put_without_versions_with_archives(self):
+        """For a document without versions, the archives with the current
+        version numbers are used for the unchanged parts.
+        """
+        waypoint = self._add_waypoint_without_versions()
+        archive = waypoint.to_archive()
+        geometry_archive = waypoint.get_archive_geometry()
+        locale_archives = waypoint.get_archive_locales()
+        self.session.add(archive)
+        self.session.add(geometry_archive)
+        self.session.add_all(locale_archives)
+        self.session.flush()
+        self._put_lang_only(waypoint)
+
+        version = self._get_single_version(waypoint)
+        self.assertEqual(version.document_archive_id, archive.id)
+        self.assertEqual(
+            version.document_geometry_archive_id, geometry_archive.id)
+        # the locale has changed, a new archive is created
+        self.assertNotEqual(
+            version.document_locales_archive_id, locale_archives[0].id)
+
+    def _add_waypoint_without_versions(self):
+        waypoint = Waypoint(
+            waypoint_type='summit', elevation=2000,
+            locales=[
+                WaypointLocale(
+                    culture='en', title='Imported', pedestrian_access='yes')
+            ],
+            geometry=DocumentGeometry(
+                geom='SRID=3857;POINT(635956 5723604)'))
+        self.session.add(waypoint)
+        self.session.flush()
+        return waypoint
+
+    def _put_lang_only(self, waypoint):
+        body = {
+            'message': 'Changing lang',
+            'document': {
+                'document_id': waypoint.document_id,
+                'version': waypoint.version,
+                'waypoint_type': 'summit',
+                'elevation': 2000,
+                'locales': [
+                    {'culture': 'en', 'title': 'Imported',
+                     'pedestrian_access': 'no',
+                     'version': waypoint.locales[0].version}
+                ]
+            }
+        }
+        self.app.put_json(
+            self._prefix + '/' + str(waypoint.document_id), body,
+            status=200)
+
+    def _get_single_version(self, document):
+        self.session.expire_all()
+        versions = self.session.query(DocumentVersion). \
+            filter(DocumentVersion.document_id == document.document_id). \
+            all()
+        self.assertEqual(len(versions), 1)
+        return versions[0]
+
     def test_put_success_new_lang(self):
         """Test updating a document by adding a new locale.
         """
@@ -422,6 +929,27 @@ class TestWaypointRest(BaseTestRest):
         self.assertEqual(meta_data_en.comment, 'Adding geom')
         self.assertIsNotNone(meta_data_en.written_at)
 
+    def test_post_geojson(self):
+        body = {
+            'geometry': {
+                'geom': {'type': 'Point', 'coordinates': [635956, 5723604]}
+            },
+            'waypoint_type': 'summit',
+            'elevation': 3779,
+            'locales': [
+                {'culture': 'en', 'title': 'Mont Pourri'}
+            ]
+        }
+        response = self.app.post_json(
+            self._prefix, body, headers={'X-Api-Version': '2'}, status=200)
+        self._assert_geojson_geometry(response.json)
+
+    def _assert_geojson_geometry(self, body):
+        geom = body.get('geometry').get('geom')
+        self.assertEqual(geom.get('type'), 'Point')
+        self.assertAlmostEqual(geom.get('coordinates')[0], 635956)
+        self.assertAlmostEqual(geom.get('coordinates')[1], 5723604)
+
     def _assert_geometry(self, body):
         self.assertIsNotNone(body.get('geometry'))
         geometry = body.get('geometry')
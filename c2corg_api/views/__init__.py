@@ -1,7 +1,8 @@
+import base64
 import collections
 import datetime
 from colander import null
-from pyramid.httpexceptions import HTTPError, HTTPNotFound
+from pyramid.httpexceptions import HTTPError, HTTPNotFound, HTTPBadRequest
 from pyramid.view import view_config
 from cornice import Errors
 from cornice.util import json_error, _JSONError
@@ -11,6 +12,13 @@ from geoalchemy2.shape import to_shape
 from shapely.geometry import mapping
 import json
 
+from c2corg_api.views.serializer import (
+    get_serializer, GEOMETRY_FORMAT_STRING, GEOMETRY_FORMAT_GEOJSON,
+    GEOMETRY_FORMATS)
+
+# the request header in which clients can ask for a specific API version
+API_VERSION_HEADER = 'X-Api-Version'
+
 
 @view_config(context=HTTPNotFound)
 @view_config(context=HTTPError)
@@ -45,8 +53,39 @@ def json_view(**kw):
     return view(**kw)
 
 
-def to_json_dict(obj, schema):
-    return serialize(schema.dictify(obj))
+def to_json_dict(obj, schema, geometry_format=GEOMETRY_FORMAT_STRING):
+    """Convert the given object into a dict that can be serialized to JSON.
+    The result is the same as `serialize(schema.dictify(obj))`, but uses
+    a serializer that is compiled once per schema.
+    """
+    return get_serializer(schema, geometry_format)(obj)
+
+
+def get_api_version(request):
+    """Returns the API version requested in the `X-Api-Version` header
+    (default: 1).
+    """
+    try:
+        return int(request.headers.get(API_VERSION_HEADER, 1))
+    except ValueError:
+        raise HTTPBadRequest('invalid API version')
+
+
+def get_geometry_format(request):
+    """Returns in which format geometries should be returned. The format can
+    be chosen with the parameter `geom_format` (`string` or `geojson`).
+    By default, API version 1 returns geometries as GeoJSON strings, later
+    versions return GeoJSON objects.
+    """
+    geometry_format = request.GET.get('geom_format')
+    if geometry_format is None:
+        if get_api_version(request) >= 2:
+            return GEOMETRY_FORMAT_GEOJSON
+        else:
+            return GEOMETRY_FORMAT_STRING
+    elif geometry_format not in GEOMETRY_FORMATS:
+        raise HTTPBadRequest('invalid geometry format')
+    return geometry_format
 
 
 def serialize(data):
@@ -83,3 +122,107 @@ def validate_id(request):
         request.validated['id'] = int(request.matchdict['id'])
     except ValueError:
         request.errors.add('url', 'id', 'invalid id')
+
+
+# number of documents returned by a collection request if no `limit` is given
+DEFAULT_LIMIT = 30
+
+# the maximum number of documents that can be requested at once
+MAX_LIMIT = 100
+
+
+def validate_pagination(request):
+    """Checks the pagination parameters `limit` and `after` of a collection
+    request. `after` is the opaque cursor returned in the `next` link of
+    the previous page.
+    """
+    validate_limit(request)
+
+    after = request.GET.get('after')
+    if after is None:
+        request.validated['after'] = None
+    else:
+        try:
+            request.validated['after'] = decode_cursor(after)
+        except ValueError:
+            request.errors.add('querystring', 'after', 'invalid cursor')
+
+
+def validate_limit(request):
+    """Checks the `limit` parameter (the number of documents to return) of a
+    collection request.
+    """
+    limit = request.GET.get('limit')
+    if limit is None:
+        request.validated['limit'] = DEFAULT_LIMIT
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            request.errors.add('querystring', 'limit', 'invalid limit')
+        else:
+            if limit < 1:
+                request.errors.add('querystring', 'limit', 'invalid limit')
+            else:
+                request.validated['limit'] = min(limit, MAX_LIMIT)
+
+
+def validate_bbox(request):
+    """Checks the optional `bbox` parameter (`minx,miny,maxx,maxy` in
+    EPSG:3857) of a collection request.
+    """
+    bbox = request.GET.get('bbox')
+    if bbox is None:
+        request.validated['bbox'] = None
+        return
+
+    try:
+        bbox = [float(coord) for coord in bbox.split(',')]
+    except ValueError:
+        request.errors.add('querystring', 'bbox', 'invalid bbox')
+        return
+
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        request.errors.add('querystring', 'bbox', 'invalid bbox')
+    else:
+        request.validated['bbox'] = bbox
+
+
+def validate_ids(request):
+    """Checks the optional `ids` parameter (comma-separated list of document
+    ids) of a collection request. At most `MAX_LIMIT` ids can be requested.
+    """
+    ids = request.GET.get('ids')
+    if ids is None:
+        request.validated['ids'] = None
+        return
+
+    try:
+        ids = [int(id) for id in ids.split(',')]
+    except ValueError:
+        request.errors.add('querystring', 'ids', 'invalid ids')
+        return
+
+    if len(ids) > MAX_LIMIT:
+        request.errors.add(
+            'querystring', 'ids', 'at most %d ids can be requested' %
+            MAX_LIMIT)
+    else:
+        request.validated['ids'] = ids
+
+
+def encode_cursor(document_id):
+    """Returns the opaque cursor pointing behind the given document id.
+    """
+    return base64.urlsafe_b64encode(str(document_id)).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the document id encoded in the given cursor. A `ValueError`
+    is raised if the cursor is invalid.
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(str(cursor) + padding))
+    except (TypeError, UnicodeEncodeError):
+        raise ValueError('invalid cursor')
@@ -0,0 +1,53 @@
+from colander import Invalid, Length, SchemaNode, Sequence
+from cornice import Service
+
+from c2corg_api.models.document_types import (
+    document_types, document_types_by_name, DOCUMENT_TYPE_NAMES_PATTERN)
+from c2corg_api.views.document import DocumentRest
+
+# the maximum number of documents that can be created with one request
+MAX_BATCH_SIZE = 100
+
+batch_service = Service(
+    name='batch',
+    path='/{doc_type:%s}/batch' % DOCUMENT_TYPE_NAMES_PATTERN,
+    description='Create several documents of a type at once')
+
+# the schemas for a list of documents, by document type
+_batch_schemas = {
+    document_type.name: SchemaNode(
+        Sequence(), document_type.schema.clone(), name='documents',
+        validator=Length(min=1, max=MAX_BATCH_SIZE))
+    for document_type in document_types
+}
+
+
+def validate_documents(request):
+    """Validates the list of documents given in the request body, e.g.
+    `{"documents": [{...}, {...}]}`. The errors are reported per document,
+    e.g. `documents.1.locales.0.title`.
+    """
+    try:
+        body = request.json_body
+    except ValueError:
+        request.errors.add('body', 'documents', 'invalid JSON')
+        return
+    documents = body.get('documents') if isinstance(body, dict) else None
+    if documents is None:
+        request.errors.add('body', 'documents', 'documents is missing')
+        return
+
+    schema = _batch_schemas[request.matchdict['doc_type']]
+    try:
+        request.validated['documents'] = schema.deserialize(documents)
+    except Invalid as e:
+        for name, message in e.asdict().items():
+            request.errors.add('body', name, message)
+
+
+@batch_service.post(
+    validators=validate_documents, content_type='application/json')
+def post_documents(request):
+    document_type = document_types_by_name[request.matchdict['doc_type']]
+    return DocumentRest(request)._collection_post_batch(
+        document_type.clazz, document_type.schema)
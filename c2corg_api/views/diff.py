@@ -0,0 +1,189 @@
+from cornice import Service
+from pyramid.httpexceptions import HTTPNotFound
+import difflib
+
+from c2corg_api.caching import version_cache
+from c2corg_api.models import DBSession
+from c2corg_api.models.archive_texts import load_locale_archive_texts
+from c2corg_api.models.document import Document, ArchiveDocumentGeometry
+from c2corg_api.models.document_history import DocumentVersion
+from c2corg_api.models.document_types import (
+    document_types_by_name, DOCUMENT_TYPE_NAMES_PATTERN)
+from c2corg_api.views import validate_id, to_json_dict, get_geometry_format
+from c2corg_api.views.document import ARCHIVE_MAX_AGE
+
+diff_service = Service(
+    name='diff',
+    path='/{doc_type:%s}/{id:\d+}/{culture:[a-z]{2}}/diff/'
+    '{from_id:\d+}/{to_id:\d+}' % DOCUMENT_TYPE_NAMES_PATTERN,
+    description='The differences between two versions of a document')
+
+# the attributes that are not compared, they are different in every version
+IGNORED_ATTRIBUTES = set(['document_id', 'version'])
+
+
+def validate_version_ids(request):
+    """Checks the ids of the two versions of a diff request.
+    """
+    request.validated['from_id'] = int(request.matchdict['from_id'])
+    request.validated['to_id'] = int(request.matchdict['to_id'])
+
+
+@diff_service.get(validators=[validate_id, validate_version_ids])
+def get_diff(request):
+    """Get the differences between two versions of a document in a culture,
+    e.g.:
+
+        {
+            "from_version_id": 11,
+            "to_version_id": 12,
+            "document": {"elevation": {"from": 2203, "to": 2200}},
+            "locale": {"description": {"from": "A hut", "to": "A big hut"}},
+            "description": [
+                {"op": "equal", "text": "A"},
+                {"op": "insert", "text": "big"},
+                {"op": "equal", "text": "hut"}
+            ],
+            "geometry": {}
+        }
+
+    `document`, `locale` and `geometry` contain the changed attributes,
+    `description` the word-level diff of the description (or `null` if the
+    description has not changed). A part is only loaded if the versions
+    reference different archives for it. The archives are never changed,
+    so the diffs are cached without invalidation.
+    """
+    document_type = document_types_by_name[request.matchdict['doc_type']]
+    id = request.validated['id']
+    culture = request.matchdict['culture']
+    from_id = request.validated['from_id']
+    to_id = request.validated['to_id']
+    geometry_format = get_geometry_format(request)
+
+    request.response.cache_control.public = True
+    request.response.cache_control.max_age = ARCHIVE_MAX_AGE
+
+    # the diffs are cached as variants of the first version
+    cache_variant = 'diff:%d:%s' % (to_id, geometry_format)
+    cached = version_cache.get(
+        document_type.type, id, culture, from_id, cache_variant)
+    if cached is not None:
+        return cached
+
+    versions = dict(
+        (row[0], row[1:]) for row in DBSession.
+        query(
+            DocumentVersion.id,
+            DocumentVersion.document_archive_id,
+            DocumentVersion.document_locales_archive_id,
+            DocumentVersion.document_geometry_archive_id).
+        join(Document, Document.document_id == DocumentVersion.document_id).
+        filter(DocumentVersion.id.in_([from_id, to_id])).
+        filter(DocumentVersion.document_id == id).
+        filter(DocumentVersion.culture == culture).
+        filter(Document.type == document_type.type))
+    if from_id not in versions or to_id not in versions:
+        raise HTTPNotFound('version not found')
+    from_ids = versions[from_id]
+    to_ids = versions[to_id]
+
+    schema = document_type.schema
+    locale_schema = schema['locales'].children[0]
+    geometry_schema = schema['geometry']
+
+    from_document, to_document = _load_archives(
+        document_type.archive_clazz, from_ids[0], to_ids[0])
+    from_locale, to_locale = _load_archives(
+        document_type.archive_locale_clazz, from_ids[1], to_ids[1])
+    load_locale_archive_texts(DBSession, [from_locale, to_locale])
+    from_geometry, to_geometry = _load_archives(
+        ArchiveDocumentGeometry, from_ids[2], to_ids[2])
+
+    locale_diff = _get_attribute_diff(
+        from_locale, to_locale, locale_schema, geometry_format)
+    description_diff = None
+    if 'description' in locale_diff:
+        description_diff = get_word_diff(
+            locale_diff['description']['from'],
+            locale_diff['description']['to'])
+
+    diff = {
+        'from_version_id': from_id,
+        'to_version_id': to_id,
+        'document': _get_attribute_diff(
+            from_document, to_document, schema, geometry_format),
+        'locale': locale_diff,
+        'description': description_diff,
+        'geometry': _get_attribute_diff(
+            from_geometry, to_geometry, geometry_schema, geometry_format)
+    }
+    version_cache.set(
+        document_type.type, id, culture, from_id, cache_variant, diff)
+    return diff
+
+
+def _load_archives(clazz, from_archive_id, to_archive_id):
+    """Load the two archives with the given ids with a single query. If both
+    versions reference the same archive, nothing is loaded and `(None,
+    None)` is returned.
+    """
+    if from_archive_id == to_archive_id:
+        return None, None
+    ids = [id for id in (from_archive_id, to_archive_id) if id is not None]
+    archives = {
+        archive.id: archive
+        for archive in DBSession.query(clazz).filter(clazz.id.in_(ids))
+    }
+    return archives.get(from_archive_id), archives.get(to_archive_id)
+
+
+def _get_attribute_diff(from_archive, to_archive, schema, geometry_format):
+    """Returns the attributes that are different in the two archives as
+    `{name: {'from': ..., 'to': ...}}`. Relationships (e.g. the locales of a
+    document) are not compared.
+    """
+    if from_archive is None and to_archive is None:
+        return {}
+    from_json = _to_json(from_archive, schema, geometry_format)
+    to_json = _to_json(to_archive, schema, geometry_format)
+    return {
+        name: {'from': from_json.get(name), 'to': to_json.get(name)}
+        for name in set(from_json) | set(to_json)
+        if name not in IGNORED_ATTRIBUTES and
+        from_json.get(name) != to_json.get(name)
+    }
+
+
+def _to_json(archive, schema, geometry_format):
+    if archive is None:
+        return {}
+    # the archive classes have no relationships to their locales and
+    # geometries, the serializer only needs the attributes
+    archive.locales = []
+    archive.geometry = None
+    archive_json = to_json_dict(archive, schema, geometry_format)
+    archive_json.pop('locales', None)
+    archive_json.pop('geometry', None)
+    return archive_json
+
+
+def get_word_diff(old_text, new_text):
+    """Returns the word-level diff of two texts as list of
+    `{'op': 'equal'|'delete'|'insert', 'text': ...}`.
+    """
+    old_words = (old_text or '').split()
+    new_words = (new_text or '').split()
+    diff = []
+    matcher = difflib.SequenceMatcher(None, old_words, new_words)
+    for op, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if op in ('equal', 'delete', 'replace'):
+            diff.append({
+                'op': 'equal' if op == 'equal' else 'delete',
+                'text': ' '.join(old_words[old_start:old_end])
+            })
+        if op in ('insert', 'replace'):
+            diff.append({
+                'op': 'insert',
+                'text': ' '.join(new_words[new_start:new_end])
+            })
+    return diff
@@ -1,13 +1,77 @@
-from sqlalchemy.orm import joinedload, contains_eager
+from contextlib import contextmanager
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, contains_eager, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.exc import StaleDataError
-from pyramid.httpexceptions import HTTPNotFound, HTTPConflict, HTTPBadRequest
-
+from pyramid.httpexceptions import (
+    HTTPNotFound, HTTPConflict, HTTPBadRequest, HTTPNotModified)
+from pyramid.settings import asbool
+import hashlib
+import json
+import transaction
+
+from c2corg_api.caching import document_cache, version_cache
+from c2corg_api.indexing import sync_documents
+
+from c2corg_api.models.archive_texts import (
+    compress_locale_archives, load_locale_archive_texts,
+    DEFAULT_SNAPSHOT_INTERVAL)
 from c2corg_api.models.document_history import HistoryMetaData, DocumentVersion
 from c2corg_api.models.document import (
-    UpdateType, DocumentLocale, ArchiveDocumentLocale, ArchiveDocument,
-    ArchiveDocumentGeometry)
+    UpdateType, Document, DocumentLocale, DocumentGeometry, ArchiveDocument,
+    ArchiveDocumentLocale, ArchiveDocumentGeometry)
 from c2corg_api.models import DBSession
-from c2corg_api.views import to_json_dict
+from c2corg_api.models.document_types import document_types_by_type
+from c2corg_api.views import (
+    to_json_dict, encode_cursor, get_geometry_format, GEOMETRY_FORMAT_STRING,
+    GEOMETRY_FORMAT_GEOJSON)
+from c2corg_api.views.tiles import invalidate_tiles, get_geometry_bounds
+
+# default number of decimal places of the coordinates in generated GeoJSON
+DEFAULT_GEOJSON_PRECISION = 2
+
+# number of documents loaded at once when exporting a collection
+EXPORT_BATCH_SIZE = 500
+
+# how long clients may cache an archived version of a document (one year)
+ARCHIVE_MAX_AGE = 365 * 24 * 3600
+
+
+@contextmanager
+def export_session(bind):
+    """Open a session for an export on a dedicated connection of the given
+    engine. The export is written after the request transaction has ended,
+    so it does not use `DBSession` but its own read-only REPEATABLE READ
+    transaction, in which all batches see the same snapshot of the
+    database. The connection is closed when leaving the context.
+    """
+    connection = bind.connect().execution_options(
+        isolation_level='REPEATABLE READ')
+    try:
+        trans = connection.begin()
+        connection.execute('SET TRANSACTION READ ONLY')
+        session = sessionmaker(bind=connection)()
+        try:
+            yield session
+        finally:
+            session.close()
+            trans.rollback()
+    finally:
+        connection.close()
+
+
+def get_document_type(clazz):
+    """Returns the type of a document class (e.g. 'w' for `Waypoint`).
+    """
+    return clazz.__mapper__.polymorphic_identity
+
+
+def get_etag(*args):
+    """Compute a strong ETag from the given JSON-serializable values (e.g.
+    the document id, the versions of the document and its locales and the
+    requested culture).
+    """
+    return hashlib.sha1(json.dumps(args, sort_keys=True)).hexdigest()
 
 
 class DocumentRest(object):
@@ -16,19 +80,363 @@ class DocumentRest(object):
         self.request = request
 
     def _collection_get(self, clazz, schema):
-        documents = DBSession. \
+        """Get a page of documents ordered by `document_id`.
+
+        The pagination is keyset-based: instead of an offset, the request
+        contains the (opaque) id of the last document of the previous page,
+        so that every page is loaded with an index seek on the primary key.
+        If there are more documents, a link to the next page is returned in
+        the `Link` header.
+
+        If a `bbox` is given, only documents whose geometry intersects the
+        bbox are returned.
+
+        If a list of `ids` is given, these documents are returned instead
+        (see `_get_documents_by_ids`).
+        """
+        if self.request.validated.get('ids') is not None:
+            return self._get_documents_by_ids(clazz, schema)
+
+        limit = self.request.validated['limit']
+        after = self.request.validated['after']
+        bbox = self.request.validated['bbox']
+        geometry_format = get_geometry_format(self.request)
+        document_id = getattr(clazz, 'document_id')
+
+        query = DBSession. \
             query(clazz). \
             options(joinedload(getattr(clazz, 'locales'))). \
-            limit(30)
+            order_by(document_id)
+        if after is not None:
+            query = query.filter(document_id > after)
+        if bbox is not None:
+            # the geometries are loaded from the join used by the filter
+            query = self._filter_bbox(query, clazz, bbox)
+        query = query.options(self._load_geometry(
+            clazz, geometry_format, joined=bbox is not None))
+
+        # fetch one document more to know if there is a next page
+        documents = query.limit(limit + 1).all()
+        if len(documents) > limit:
+            documents = documents[:limit]
+            self._set_next_link(documents[-1].document_id, limit)
+
+        etag = get_etag(
+            self.request.query_string, get_document_type(clazz),
+            geometry_format,
+            [(doc.document_id, doc.get_versions()) for doc in documents])
+        if self._is_not_modified(etag):
+            return self._not_modified()
+
+        self._load_geojson(documents, geometry_format)
+        return [
+            to_json_dict(doc, schema, geometry_format) for doc in documents
+        ]
+
+    def _export(self, clazz, schema):
+        """Stream all documents of a type as newline-delimited JSON (one
+        document with its locales and geometry per line, ordered by
+        `document_id`).
+
+        The documents are loaded in batches of `EXPORT_BATCH_SIZE` while the
+        response is written (in a session of its own, see `export_session`),
+        and the session is cleared after each batch, so that the memory usage
+        does not depend on the number of documents.
+        """
+        geometry_format = get_geometry_format(self.request)
+        doc_type = get_document_type(clazz)
+
+        response = self.request.response
+        response.content_type = 'application/x-ndjson'
+        response.app_iter = self._export_lines(
+            clazz, schema, doc_type, geometry_format)
+        return response
+
+    def _export_lines(self, clazz, schema, doc_type, geometry_format):
+        document_id = getattr(clazz, 'document_id')
+        last_id = None
+        with export_session(DBSession.session_factory.kw['bind']) as session:
+            while True:
+                # `yield_per` can not be used together with the eager
+                # loading of the locales, so the table is iterated in
+                # batches using the primary key instead.
+                query = session. \
+                    query(clazz). \
+                    options(joinedload(getattr(clazz, 'locales'))). \
+                    options(self._load_geometry(clazz, geometry_format)). \
+                    order_by(document_id)
+                if last_id is not None:
+                    query = query.filter(document_id > last_id)
+                documents = query.limit(EXPORT_BATCH_SIZE).all()
+                if not documents:
+                    break
+
+                self._load_geojson(documents, geometry_format, session)
+                lines = []
+                for document in documents:
+                    document_json = to_json_dict(
+                        document, schema, geometry_format)
+                    document_json['type'] = doc_type
+                    lines.append(json.dumps(document_json) + '\n')
+                yield ''.join(lines).encode('utf-8')
+
+                last_id = documents[-1].document_id
+                session.expunge_all()
+                if len(documents) < EXPORT_BATCH_SIZE:
+                    break
+
+    def _get_documents_by_ids(self, clazz, schema):
+        """Get the documents with the given ids in the requested order. The
+        documents, their geometries and locales (all or only the locale for
+        the culture given with `l`) are loaded with a constant number of
+        queries. The ids of documents that do not exist are returned in
+        `missing`.
+        """
+        ids = self.request.validated['ids']
+        culture = self.request.GET.get('l')
+        geometry_format = get_geometry_format(self.request)
+        document_id = getattr(clazz, 'document_id')
 
-        return [to_json_dict(doc, schema) for doc in documents]
+        query = DBSession. \
+            query(clazz). \
+            options(self._load_geometry(clazz, geometry_format)). \
+            filter(document_id.in_(ids))
+        if not culture:
+            query = query.options(joinedload(getattr(clazz, 'locales')))
+        documents = query.all()
+
+        if culture:
+            self._load_locales(documents, culture)
+        self._load_geojson(documents, geometry_format)
+
+        documents_by_id = {doc.document_id: doc for doc in documents}
+        requested_ids = []
+        for id in ids:
+            if id not in requested_ids:
+                requested_ids.append(id)
+
+        return {
+            'documents': [
+                to_json_dict(documents_by_id[id], schema, geometry_format)
+                for id in requested_ids if id in documents_by_id
+            ],
+            'missing': [
+                id for id in requested_ids if id not in documents_by_id
+            ]
+        }
+
+    def _load_locales(self, documents, culture):
+        """Load the locales with the given culture of all documents with a
+        single query and set them as the (only) locales of the documents.
+        """
+        if not documents:
+            return
+        locales = DBSession.query(DocumentLocale). \
+            filter(DocumentLocale.document_id.in_(
+                [doc.document_id for doc in documents])). \
+            filter(DocumentLocale.culture == culture). \
+            all()
+        locales_by_document = {
+            locale.document_id: locale for locale in locales}
+        for document in documents:
+            locale = locales_by_document.get(document.document_id)
+            set_committed_value(
+                document, 'locales', [locale] if locale else [])
+
+    def _filter_bbox(self, query, clazz, bbox):
+        """Only keep the documents whose geometry intersects the given bbox.
+        `ST_Intersects` first does a bbox comparison (`&&`), which uses the
+        GiST index on `documents_geometries.geom`.
+        The geometries are joined to the query, use
+        `_load_geometry(..., joined=True)` to load them from this join.
+        """
+        envelope = func.ST_MakeEnvelope(
+            bbox[0], bbox[1], bbox[2], bbox[3], 3857)
+        return query. \
+            join(getattr(clazz, 'geometry')). \
+            filter(DocumentGeometry.geom.intersects(envelope))
+
+    def _set_next_link(self, last_document_id, limit):
+        params = dict(self.request.GET)
+        params['after'] = encode_cursor(last_document_id)
+        params['limit'] = limit
+        next_url = self.request.current_route_url(_query=params)
+        self.request.response.headers['Link'] = \
+            '<%s>; rel="next"' % next_url
 
     def _get(self, clazz, schema):
+        """Get a single document. The serialized documents are cached, the
+        cache entry is invalidated when the document is updated.
+
+        The response contains an ETag derived from the versions of the
+        document, its locales and its geometry. If the client already has
+        the current version (`If-None-Match`), a "304 Not Modified" is
+        returned. To check this, only the version numbers are loaded.
+        """
         id = self.request.validated['id']
         culture = self.request.GET.get('l')
-        document = self._get_document(clazz, id, culture)
-
-        return to_json_dict(document, schema)
+        geometry_format = get_geometry_format(self.request)
+
+        doc_type = get_document_type(clazz)
+        cache_variant = '%s|%s' % (culture or '', geometry_format)
+        cached = document_cache.get(doc_type, id, cache_variant)
+        if cached is not None:
+            if self._is_not_modified(cached['etag']):
+                return self._not_modified()
+            return cached['document']
+
+        if self.request.if_none_match:
+            versions = self._get_versions(doc_type, id, culture)
+            if versions is not None:
+                etag = get_etag(
+                    doc_type, id, versions, culture, geometry_format)
+                if self._is_not_modified(etag):
+                    return self._not_modified()
+
+        document = self._get_document(clazz, id, culture, geometry_format)
+        etag = get_etag(
+            doc_type, id, document.get_versions(), culture, geometry_format)
+
+        self._load_geojson([document], geometry_format)
+        document_json = to_json_dict(document, schema, geometry_format)
+
+        document_cache.set(
+            doc_type, id, cache_variant,
+            {'etag': etag, 'document': document_json})
+        if self._is_not_modified(etag):
+            return self._not_modified()
+        return document_json
+
+    def _get_version(self, clazz, schema):
+        """Get a document as it was in a version of a culture, e.g.:
+
+            {
+                "document": {"document_id": 1, "locales": [...], ...},
+                "version": {
+                    "version_id": 12,
+                    "written_at": "2015-06-01T12:00:00",
+                    "comment": "Add the access"
+                }
+            }
+
+        The archives of the document, the locale and the geometry and the
+        meta data of the version are loaded with a single query through the
+        `DocumentVersion` row. The archives are never changed, so the
+        response is cached without invalidation and may be cached by
+        clients.
+        """
+        id = self.request.validated['id']
+        culture = self.request.matchdict['culture']
+        version_id = self.request.validated['version_id']
+        geometry_format = get_geometry_format(self.request)
+        doc_type = get_document_type(clazz)
+
+        self.request.response.cache_control.public = True
+        self.request.response.cache_control.max_age = ARCHIVE_MAX_AGE
+
+        cached = version_cache.get(
+            doc_type, id, culture, version_id, geometry_format)
+        if cached is not None:
+            return cached
+
+        document_type = document_types_by_type[doc_type]
+        archive_clazz = document_type.archive_clazz
+        archive_locale_clazz = document_type.archive_locale_clazz
+        result = DBSession. \
+            query(
+                archive_clazz, archive_locale_clazz, ArchiveDocumentGeometry,
+                HistoryMetaData). \
+            select_from(DocumentVersion). \
+            join(
+                archive_clazz,
+                archive_clazz.id == DocumentVersion.document_archive_id). \
+            join(
+                archive_locale_clazz,
+                archive_locale_clazz.id ==
+                DocumentVersion.document_locales_archive_id). \
+            outerjoin(
+                ArchiveDocumentGeometry,
+                ArchiveDocumentGeometry.id ==
+                DocumentVersion.document_geometry_archive_id). \
+            join(
+                HistoryMetaData,
+                HistoryMetaData.id == DocumentVersion.history_metadata_id). \
+            filter(DocumentVersion.id == version_id). \
+            filter(DocumentVersion.document_id == id). \
+            filter(DocumentVersion.culture == culture). \
+            first()
+        if result is None:
+            raise HTTPNotFound('version not found')
+
+        archive, locale_archive, geometry_archive, meta_data = result
+        load_locale_archive_texts(DBSession, [locale_archive])
+        # the archive classes have no relationships to their locales and
+        # geometries, the serializer only needs the attributes
+        archive.locales = [locale_archive]
+        archive.geometry = geometry_archive
+
+        version_json = {
+            'document': to_json_dict(archive, schema, geometry_format),
+            'version': {
+                'version_id': version_id,
+                'written_at': meta_data.written_at.isoformat(),
+                'comment': meta_data.comment
+            }
+        }
+        version_cache.set(
+            doc_type, id, culture, version_id, geometry_format, version_json)
+        return version_json
+
+    def _is_not_modified(self, etag):
+        """Set the ETag of the response and check if it matches the ETag
+        given by the client in `If-None-Match`.
+        """
+        self.request.response.etag = etag
+        return etag in self.request.if_none_match
+
+    def _not_modified(self):
+        return HTTPNotModified(
+            headers={'ETag': self.request.response.headers['ETag']})
+
+    def _get_versions(self, doc_type, id, culture=None):
+        """Get the version numbers of a document, its locales (only for the
+        given culture, if set) and its geometry with a single query that
+        only reads the version columns, in the same format as
+        `Document.get_versions()`.
+        Returns `None` if the document (or the locale) does not exist.
+        """
+        documents = Document.__table__
+        locales = DocumentLocale.__table__
+        geometries = DocumentGeometry.__table__
+
+        locale_join = locales.c.document_id == documents.c.document_id
+        if culture:
+            locale_join &= locales.c.culture == culture
+
+        rows = DBSession. \
+            query(
+                documents.c.version, geometries.c.version,
+                locales.c.culture, locales.c.version). \
+            select_from(documents). \
+            outerjoin(
+                geometries,
+                geometries.c.document_id == documents.c.document_id). \
+            outerjoin(locales, locale_join). \
+            filter(documents.c.document_id == id). \
+            filter(documents.c.type == doc_type). \
+            all()
+
+        if not rows or (culture and rows[0][2] is None):
+            return None
+        return {
+            'document': rows[0][0],
+            'locales': {
+                locale_culture: locale_version
+                for (_, _, locale_culture, locale_version) in rows
+                if locale_culture is not None
+            },
+            'geometry': rows[0][1]
+        }
 
     def _collection_post(self, clazz, schema):
         document = schema.objectify(self.request.validated)
@@ -41,8 +449,11 @@ class DocumentRest(object):
         DBSession.flush()
 
         self._create_new_version(document)
+        sync_documents([(get_document_type(clazz), document.document_id)])
+        self._invalidate_tiles(clazz, [document.geometry])
 
-        return to_json_dict(document, schema)
+        return to_json_dict(
+            document, schema, get_geometry_format(self.request))
 
     def _put(self, clazz, schema):
         id = self.request.validated['id']
@@ -54,8 +465,10 @@ class DocumentRest(object):
         document = self._get_document(clazz, id)
         self._check_versions(document, document_in)
 
-        # remember the current version numbers of the document
+        # remember the current version numbers and the bounds of the
+        # geometry of the document
         old_versions = document.get_versions()
+        old_bounds = get_geometry_bounds(document.geometry)
 
         # update the document with the input document
         document.update(document_in)
@@ -64,6 +477,10 @@ class DocumentRest(object):
             DBSession.flush()
         except StaleDataError:
             raise HTTPConflict('concurrent modification')
+        self._invalidate_cache(clazz, id)
+        sync_documents([(get_document_type(clazz), id)])
+        # the tiles at the old and the new location show the document
+        self._invalidate_tiles(clazz, [document.geometry], [old_bounds])
 
         # when flushing the session, SQLAlchemy automatically updates the
         # version numbers in case attributes have changed. by comparing with
@@ -75,20 +492,47 @@ class DocumentRest(object):
             document, self.request.validated['message'], update_type,
             changed_langs)
 
-        return to_json_dict(document, schema)
+        return to_json_dict(
+            document, schema, get_geometry_format(self.request))
+
+    def _invalidate_cache(self, clazz, id):
+        """Remove the document from the cache. This is done right away and
+        again once the transaction is committed, so that a concurrent
+        request, which still sees the old version, can not put it back
+        into the cache.
+        """
+        doc_type = get_document_type(clazz)
+        document_cache.invalidate(doc_type, id)
+        transaction.get().addAfterCommitHook(
+            lambda success: document_cache.invalidate(doc_type, id))
+
+    def _invalidate_tiles(self, clazz, geometries, bounds_list=()):
+        """Remove the cached vector tiles which contain the given geometries
+        or the given bounds (e.g. the bounds of a geometry before it was
+        changed, see `get_geometry_bounds`).
+        """
+        invalidate_tiles(
+            self._get_layer(clazz),
+            [get_geometry_bounds(geometry) for geometry in geometries] +
+            list(bounds_list))
 
-    def _get_document(self, clazz, id, culture=None):
+    def _get_layer(self, clazz):
+        return document_types_by_type[get_document_type(clazz)].name
+
+    def _get_document(
+            self, clazz, id, culture=None,
+            geometry_format=GEOMETRY_FORMAT_STRING):
         """Get a document with either a single locale (if `culture is given)
         or with all locales.
         If no document exists for the given id, a `HTTPNotFound` exception is
         raised.
         """
-        # TODO eager load geometry?
         if not culture:
             document = DBSession. \
                 query(clazz). \
                 filter(getattr(clazz, 'document_id') == id). \
                 options(joinedload(getattr(clazz, 'locales'))). \
+                options(self._load_geometry(clazz, geometry_format)). \
                 first()
         else:
             document = DBSession. \
@@ -96,6 +540,7 @@ class DocumentRest(object):
                 join(getattr(clazz, 'locales')). \
                 filter(getattr(clazz, 'document_id') == id). \
                 options(contains_eager(getattr(clazz, 'locales'))). \
+                options(self._load_geometry(clazz, geometry_format)). \
                 filter(DocumentLocale.culture == culture). \
                 first()
 
@@ -104,7 +549,86 @@ class DocumentRest(object):
 
         return document
 
+    def _load_geometry(self, clazz, geometry_format, joined=False):
+        """Returns the loader option for the geometry of the documents. If
+        the geometries are returned as GeoJSON objects, the geometry column
+        is not loaded because the GeoJSON is generated by the database (see
+        `_load_geojson`).
+        If the query already joins the geometries (`joined`), they are
+        loaded from this join instead of a second (aliased) join.
+        """
+        if joined:
+            option = contains_eager(getattr(clazz, 'geometry'))
+        else:
+            option = joinedload(getattr(clazz, 'geometry'))
+        if geometry_format == GEOMETRY_FORMAT_GEOJSON:
+            option = option.defer('geom')
+        return option
+
+    def _load_geojson(self, documents, geometry_format, session=DBSession):
+        """Generate the GeoJSON of the geometries of the given documents with
+        `ST_AsGeoJSON` (one query for all documents), so that the geometries
+        do not have to be parsed and converted in Python.
+        """
+        if geometry_format != GEOMETRY_FORMAT_GEOJSON:
+            return
+        geometries = [doc.geometry for doc in documents if doc.geometry]
+        if not geometries:
+            return
+
+        precision = int(self.request.registry.settings.get(
+            'geojson.precision', DEFAULT_GEOJSON_PRECISION))
+        geojson_by_id = dict(
+            session.query(
+                DocumentGeometry.id,
+                func.ST_AsGeoJSON(DocumentGeometry.geom, precision)).
+            filter(DocumentGeometry.id.in_(
+                [geometry.id for geometry in geometries])).
+            all())
+        for geometry in geometries:
+            geometry.geom_geojson = geojson_by_id.get(geometry.id)
+
+    def _collection_post_batch(self, clazz, schema):
+        """Create several documents at once. All documents are inserted with
+        one flush, then the archives and versions of all documents are
+        inserted with a second flush. The created documents are returned in
+        the order of the request.
+        """
+        documents = [
+            schema.objectify(document_in)
+            for document_in in self.request.validated['documents']
+        ]
+        for document in documents:
+            document.document_id = None
+
+        DBSession.add_all(documents)
+        DBSession.flush()
+
+        for document in documents:
+            self._add_new_version(document)
+        DBSession.flush()
+        doc_type = get_document_type(clazz)
+        sync_documents(
+            [(doc_type, document.document_id) for document in documents])
+        self._invalidate_tiles(
+            clazz, [document.geometry for document in documents])
+
+        geometry_format = get_geometry_format(self.request)
+        return {
+            'documents': [
+                to_json_dict(document, schema, geometry_format)
+                for document in documents
+            ]
+        }
+
     def _create_new_version(self, document):
+        self._add_new_version(document)
+        DBSession.flush()
+
+    def _add_new_version(self, document):
+        """Add the archives and versions for a newly created document to the
+        session (without flushing).
+        """
         archive = document.to_archive()
         archive_locales = document.get_archive_locales()
         archive_geometry = document.get_archive_geometry()
@@ -126,68 +650,180 @@ class DocumentRest(object):
         DBSession.add_all(archive_locales)
         DBSession.add(meta_data)
         DBSession.add_all(versions)
-        DBSession.flush()
 
     def _update_version(self, document, comment, update_types, changed_langs):
         assert update_types
 
-        meta_data = HistoryMetaData(comment=comment)
-        archive = self._get_document_archive(document, update_types)
-        geometry_archive = \
-            self._get_geometry_archive(document, update_types)
-
         cultures = \
             self._get_cultures_to_update(document, update_types, changed_langs)
+        archive_ids = self._get_current_archive_ids(
+            document, update_types, cultures, changed_langs)
+
+        meta_data = HistoryMetaData(comment=comment)
+        archive = None
+        if UpdateType.FIGURES in update_types or \
+                archive_ids['document'] is None:
+            # the document has changed (or has no archive), create a new
+            # archive version
+            archive = document.to_archive()
+        geometry_archive = None
+        if document.geometry and (
+                UpdateType.GEOM in update_types or
+                archive_ids['geometry'] is None):
+            # the geometry has changed (or has no archive), create a new
+            # archive version
+            geometry_archive = document.geometry.to_archive()
+
         locale_versions = []
+        locale_archives = []
         for culture in cultures:
             locale = document.get_locale(culture)
-            locale_archive = self._get_locale_archive(locale, changed_langs)
+            locale_archive = None
+            if culture in changed_langs or \
+                    archive_ids['locales'].get(culture) is None:
+                # create new archive version for this locale
+                locale_archive = locale.to_archive()
+                locale_archives.append(locale_archive)
 
             version = DocumentVersion(
                 document_id=document.document_id,
                 culture=locale.culture,
-                document_archive=archive,
-                document_geometry_archive=geometry_archive,
-                document_locales_archive=locale_archive,
                 history_metadata=meta_data
             )
+            # for the parts that have not changed, the previous archive
+            # versions are used
+            self._set_archive(
+                version, 'document_archive', archive,
+                archive_ids['document'])
+            self._set_archive(
+                version, 'document_geometry_archive', geometry_archive,
+                archive_ids['geometry'])
+            self._set_archive(
+                version, 'document_locales_archive', locale_archive,
+                archive_ids['locales'].get(culture))
             locale_versions.append(version)
 
-        DBSession.add(archive)
+        self._compress_locale_archives(locale_archives)
+        if archive is not None:
+            DBSession.add(archive)
         DBSession.add(meta_data)
         DBSession.add_all(locale_versions)
         DBSession.flush()
 
-    def _get_document_archive(self, document, update_types):
-        if (UpdateType.FIGURES in update_types):
-            # the document has changed, create a new archive version
-            archive = document.to_archive()
+    def _compress_locale_archives(self, locale_archives):
+        """Store the descriptions of the new locale archives as deltas, if
+        enabled with the setting `archives.locale_deltas`.
+        """
+        settings = self.request.registry.settings
+        if asbool(settings.get('archives.locale_deltas', False)):
+            compress_locale_archives(
+                DBSession, locale_archives,
+                int(settings.get(
+                    'archives.snapshot_interval',
+                    DEFAULT_SNAPSHOT_INTERVAL)))
+
+    def _set_archive(self, version, name, archive, archive_id):
+        """Link a version to either a new archive or to the id of an existing
+        archive.
+        """
+        if archive is not None:
+            setattr(version, name, archive)
         else:
-            # the document has not changed, load the previous archive version
-            archive = DBSession.query(ArchiveDocument). \
+            setattr(version, name + '_id', archive_id)
+
+    def _get_current_archive_ids(
+            self, document, update_types, cultures, changed_langs):
+        """Get the ids of the current archive versions of the document, its
+        geometry and its locales with a single query.
+
+        Every version references the archives that were current when it was
+        created. So the latest version of each culture references the
+        current archive of the locale, and the latest version of all
+        cultures the current archives of the document and of the geometry.
+        A document without versions (e.g. imported without history) falls
+        back to the archives with the current version numbers (see
+        `_get_archive_ids_by_version`).
+
+        The id of a part is `None` if it has no archive (a new archive has
+        to be created for it). No query is made if all parts have changed.
+        """
+        new_geometry_archive = \
+            not document.geometry or UpdateType.GEOM in update_types
+        new_locale_archives = \
+            all(culture in changed_langs for culture in cultures)
+        if UpdateType.FIGURES in update_types and new_geometry_archive and \
+                new_locale_archives:
+            return {'document': None, 'geometry': None, 'locales': {}}
+
+        latest_versions = DBSession. \
+            query(
+                DocumentVersion.id, DocumentVersion.culture,
+                DocumentVersion.document_archive_id,
+                DocumentVersion.document_locales_archive_id,
+                DocumentVersion.document_geometry_archive_id). \
+            filter(DocumentVersion.document_id == document.document_id). \
+            distinct(DocumentVersion.culture). \
+            order_by(DocumentVersion.culture, DocumentVersion.id.desc()). \
+            all()
+        if not latest_versions:
+            return self._get_archive_ids_by_version(document, cultures)
+        latest_version = max(latest_versions, key=lambda version: version.id)
+
+        return {
+            'document': latest_version.document_archive_id,
+            'geometry': latest_version.document_geometry_archive_id,
+            'locales': {
+                version.culture: version.document_locales_archive_id
+                for version in latest_versions
+            }
+        }
+
+    def _get_archive_ids_by_version(self, document, cultures):
+        """Get the ids of the archives of the document, its geometry and its
+        locales (for the given cultures) which have the current version
+        numbers, in the format of `_get_current_archive_ids`.
+        """
+        document_archive_id = DBSession. \
+            query(ArchiveDocument.id). \
+            filter(ArchiveDocument.document_id == document.document_id). \
+            filter(ArchiveDocument.version == document.version). \
+            scalar()
+
+        geometry_archive_id = None
+        if document.geometry:
+            geometry_archive_id = DBSession. \
+                query(ArchiveDocumentGeometry.id). \
                 filter(
-                    ArchiveDocument.version == document.version,
-                    ArchiveDocument.document_id == document.document_id). \
-                one()
-        return archive
-
-    def _get_geometry_archive(self, document, update_types):
-        if not document.geometry:
-            return None
-        elif (UpdateType.GEOM in update_types):
-            # the geometry has changed, create a new archive version
-            archive = document.geometry.to_archive()
-        else:
-            # the geometry has not changed, load the previous archive version
-            archive = DBSession.query(ArchiveDocumentGeometry). \
+                    ArchiveDocumentGeometry.document_id ==
+                    document.document_id). \
                 filter(
                     ArchiveDocumentGeometry.version ==
-                    document.geometry.version,
-                    ArchiveDocumentGeometry.document_id ==
-                    document.document_id
-                ). \
-                one()
-        return archive
+                    document.geometry.version). \
+                scalar()
+
+        locale_versions = {
+            culture: document.get_locale(culture).version
+            for culture in cultures
+        }
+        locale_archive_ids = {}
+        if cultures:
+            for archive_id, culture, version in DBSession. \
+                    query(
+                        ArchiveDocumentLocale.id,
+                        ArchiveDocumentLocale.culture,
+                        ArchiveDocumentLocale.version). \
+                    filter(
+                        ArchiveDocumentLocale.document_id ==
+                        document.document_id). \
+                    filter(ArchiveDocumentLocale.culture.in_(cultures)):
+                if locale_versions[culture] == version:
+                    locale_archive_ids[culture] = archive_id
+
+        return {
+            'document': document_archive_id,
+            'geometry': geometry_archive_id,
+            'locales': locale_archive_ids
+        }
 
     def _get_cultures_to_update(self, document, update_types, changed_langs):
         if UpdateType.GEOM not in update_types and \
@@ -199,20 +835,6 @@ class DocumentRest(object):
             # if the figures or geometry have been changed, update all locales
             return [locale.culture for locale in document.locales]
 
-    def _get_locale_archive(self, locale, changed_langs):
-        if locale.culture in changed_langs:
-            # create new archive version for this locale
-            locale_archive = locale.to_archive()
-        else:
-            # the locale has not changed, use the old archive version
-            locale_archive = DBSession.query(ArchiveDocumentLocale). \
-                filter(
-                    ArchiveDocumentLocale.version == locale.version,
-                    ArchiveDocumentLocale.document_id == locale.document_id,
-                    ArchiveDocumentLocale.culture == locale.culture). \
-                one()
-        return locale_archive
-
     def _check_document_id(self, id, document_id):
         """Checks that the id given in the URL ("/waypoints/{id}") matches
         the document_id given in the request body.
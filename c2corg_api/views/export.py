@@ -0,0 +1,17 @@
+from cornice import Service
+
+from c2corg_api.models.document_types import (
+    document_types_by_name, DOCUMENT_TYPE_NAMES_PATTERN)
+from c2corg_api.views.document import DocumentRest
+
+export_service = Service(
+    name='export',
+    path='/{doc_type:%s}/export' % DOCUMENT_TYPE_NAMES_PATTERN,
+    description='Export all documents of a type as newline-delimited JSON')
+
+
+@export_service.get()
+def export_documents(request):
+    document_type = document_types_by_name[request.matchdict['doc_type']]
+    return DocumentRest(request)._export(
+        document_type.clazz, document_type.schema)
@@ -0,0 +1,116 @@
+from cornice import Service
+from pyramid.httpexceptions import HTTPNotFound
+from sqlalchemy import func
+
+from c2corg_api.models import DBSession
+from c2corg_api.models.document import Document
+from c2corg_api.models.document_history import HistoryMetaData, DocumentVersion
+from c2corg_api.models.document_types import (
+    document_types_by_name, DOCUMENT_TYPE_NAMES_PATTERN)
+from c2corg_api.views import validate_id, validate_pagination
+from c2corg_api.views.document import DocumentRest
+
+history_service = Service(
+    name='history',
+    path='/{doc_type:%s}/{id:\d+}/history/{culture:[a-z]{2}}' %
+    DOCUMENT_TYPE_NAMES_PATTERN,
+    description='The versions of a document in a culture')
+
+
+@history_service.get(validators=[validate_id, validate_pagination])
+def get_history(request):
+    """Get a page of the versions of a document in a culture, newest first,
+    e.g.:
+
+        {
+            "document_id": 1,
+            "culture": "fr",
+            "versions": [
+                {
+                    "version_id": 12,
+                    "written_at": "2015-06-01T12:00:00",
+                    "comment": "Add the access",
+                    "changes": ["locale"]
+                }
+            ]
+        }
+
+    `changes` lists the parts (`document`, `locale` and `geometry`) which
+    are different from the previous version in this culture. The versions
+    are read with a single query over `documents_versions` and
+    `history_metadata`, the changes are detected by comparing the archive
+    ids with the previous version (`lag`), without loading the archives.
+    """
+    doc_type = document_types_by_name[request.matchdict['doc_type']].type
+    id = request.validated['id']
+    culture = request.matchdict['culture']
+    limit = request.validated['limit']
+    after = request.validated['after']
+
+    def changed(column):
+        previous = func.lag(column).over(
+            partition_by=DocumentVersion.culture,
+            order_by=DocumentVersion.id)
+        return column.op('IS DISTINCT FROM')(previous)
+
+    versions = DBSession. \
+        query(
+            DocumentVersion.id.label('id'),
+            DocumentVersion.history_metadata_id.label('history_metadata_id'),
+            changed(DocumentVersion.document_archive_id).label('document'),
+            changed(DocumentVersion.document_locales_archive_id).
+            label('locale'),
+            changed(DocumentVersion.document_geometry_archive_id).
+            label('geometry')). \
+        join(Document, Document.document_id == DocumentVersion.document_id). \
+        filter(DocumentVersion.document_id == id). \
+        filter(DocumentVersion.culture == culture). \
+        filter(Document.type == doc_type). \
+        subquery()
+
+    query = DBSession. \
+        query(
+            versions, HistoryMetaData.written_at, HistoryMetaData.comment). \
+        join(HistoryMetaData,
+             HistoryMetaData.id == versions.c.history_metadata_id). \
+        order_by(versions.c.id.desc())
+    if after is not None:
+        query = query.filter(versions.c.id < after)
+
+    # fetch one version more to know if there is a next page
+    results = query.limit(limit + 1).all()
+    if not results and (
+            after is None or not _has_versions(doc_type, id, culture)):
+        # a page after the last version is empty, but only if the document
+        # exists in this culture
+        raise HTTPNotFound('document not found')
+    if len(results) > limit:
+        results = results[:limit]
+        DocumentRest(request)._set_next_link(results[-1].id, limit)
+
+    return {
+        'document_id': id,
+        'culture': culture,
+        'versions': [
+            {
+                'version_id': version.id,
+                'written_at': version.written_at.isoformat(),
+                'comment': version.comment,
+                'changes': [
+                    part for part in ['document', 'locale', 'geometry']
+                    if getattr(version, part)
+                ]
+            }
+            for version in results
+        ]
+    }
+
+
+def _has_versions(doc_type, id, culture):
+    return DBSession.query(
+        DBSession.query(DocumentVersion).
+        join(Document, Document.document_id == DocumentVersion.document_id).
+        filter(DocumentVersion.document_id == id).
+        filter(DocumentVersion.culture == culture).
+        filter(Document.type == doc_type).
+        exists()).scalar()
@@ -2,12 +2,15 @@ from cornice.resource import resource, view
 
 from c2corg_api.models.image import Image, schema_image, schema_update_image
 from c2corg_api.views.document import DocumentRest
-from c2corg_api.views import validate_id, json_view
+from c2corg_api.views import (
+    validate_id, validate_pagination, validate_bbox, validate_ids,
+    json_view)
 
 
-@resource(collection_path='/images', path='/images/{id}')
+@resource(collection_path='/images', path='/images/{id:\d+}')
 class ImageRest(DocumentRest):
 
+    @view(validators=[validate_pagination, validate_bbox, validate_ids])
     def collection_get(self):
         return self._collection_get(Image, schema_image)
 
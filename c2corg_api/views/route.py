@@ -2,12 +2,15 @@ from cornice.resource import resource, view
 
 from c2corg_api.models.route import Route, schema_route, schema_update_route
 from c2corg_api.views.document import DocumentRest
-from c2corg_api.views import validate_id, json_view
+from c2corg_api.views import (
+    validate_id, validate_pagination, validate_bbox, validate_ids,
+    json_view)
 
 
-@resource(collection_path='/routes', path='/routes/{id}')
+@resource(collection_path='/routes', path='/routes/{id:\d+}')
 class RouteRest(DocumentRest):
 
+    @view(validators=[validate_pagination, validate_bbox, validate_ids])
     def collection_get(self):
         return self._collection_get(Route, schema_route)
 
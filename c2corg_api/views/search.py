@@ -0,0 +1,274 @@
+from cornice import Service
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from c2corg_api.attributes import default_cultures
+from c2corg_api.models import DBSession
+from c2corg_api.models.document import DocumentLocale
+from c2corg_api.models.document_types import (
+    document_types_by_type, document_types)
+from c2corg_api.models.search import get_ts_config, get_ts_configs
+from c2corg_api.views import (
+    to_json_dict, get_geometry_format, validate_limit)
+from c2corg_api.views.document import DocumentRest
+
+# number of titles returned by an autocomplete request if no `limit` is given
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+
+# the maximum number of titles returned by an autocomplete request
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+# the minimum length of the terms of an autocomplete request
+AUTOCOMPLETE_MIN_LENGTH = 3
+
+search_service = Service(
+    name='search',
+    path='/search',
+    description='Full-text search over the documents of all types')
+
+autocomplete_service = Service(
+    name='autocomplete',
+    path='/autocomplete',
+    description='Autocompletion of document titles')
+
+
+def validate_search(request):
+    """Checks the search terms `q` of a search request.
+    """
+    _validate_terms(request, 1)
+
+
+def validate_autocomplete(request):
+    """Checks the search terms `q` of an autocomplete request. At least
+    `AUTOCOMPLETE_MIN_LENGTH` characters are required, shorter terms can
+    not be looked up in the trigram index.
+    """
+    _validate_terms(request, AUTOCOMPLETE_MIN_LENGTH)
+
+
+def _validate_terms(request, min_length):
+    q = request.GET.get('q', '').strip()
+    if not q:
+        request.errors.add('querystring', 'q', 'q is missing')
+    elif len(q) < min_length:
+        request.errors.add(
+            'querystring', 'q',
+            'at least %d characters are required' % min_length)
+    request.validated['q'] = q
+
+
+def validate_filters(request):
+    """Checks the optional culture `l` and the optional document types `t`
+    (e.g. `w,r`) of a search request.
+    """
+    culture = request.GET.get('l')
+    if culture is not None and culture not in default_cultures:
+        request.errors.add('querystring', 'l', 'invalid culture')
+    request.validated['culture'] = culture
+
+    types = request.GET.get('t')
+    if types is None:
+        request.validated['types'] = None
+    else:
+        types = types.split(',')
+        if any(doc_type not in document_types_by_type for doc_type in types):
+            request.errors.add('querystring', 't', 'invalid type')
+        request.validated['types'] = types
+
+
+def validate_autocomplete_limit(request):
+    """Checks the `limit` parameter of an autocomplete request.
+    """
+    limit = request.GET.get('limit')
+    if limit is None:
+        request.validated['limit'] = AUTOCOMPLETE_DEFAULT_LIMIT
+        return
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        request.errors.add('querystring', 'limit', 'invalid limit')
+    else:
+        request.validated['limit'] = min(limit, AUTOCOMPLETE_MAX_LIMIT)
+
+
+def validate_offset(request):
+    """Checks the `offset` parameter (the number of results to skip) of a
+    search request.
+    """
+    offset = request.GET.get('offset')
+    if offset is None:
+        request.validated['offset'] = 0
+        return
+    try:
+        offset = int(offset)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        request.errors.add('querystring', 'offset', 'invalid offset')
+    else:
+        request.validated['offset'] = offset
+
+
+@search_service.get(validators=[
+    validate_search, validate_filters, validate_limit, validate_offset])
+def search(request):
+    """Search documents whose locales contain the given words. The documents
+    are ordered by relevance (the best rank of their locales), matches in
+    the title rank higher than matches in the description.
+
+    The words are looked up in the `search_vector` of the locales, which is
+    indexed with a GIN index. If a culture is given, only the locales in this
+    culture are searched and only these locales are returned. If there are
+    more results, a link to the next page is returned in the `Link` header.
+    """
+    q = request.validated['q']
+    culture = request.validated['culture']
+    types = request.validated['types']
+    limit = request.validated['limit']
+    offset = request.validated['offset']
+
+    ts_query = _get_ts_query(q, culture)
+    rank = func.max(func.ts_rank(DocumentLocale.search_vector, ts_query))
+    query = DBSession. \
+        query(DocumentLocale.document_id, DocumentLocale.type). \
+        filter(DocumentLocale.search_vector.op('@@')(ts_query)). \
+        group_by(DocumentLocale.document_id, DocumentLocale.type). \
+        order_by(rank.desc(), DocumentLocale.document_id)
+    if culture:
+        query = query.filter(DocumentLocale.culture == culture)
+    if types:
+        query = query.filter(DocumentLocale.type.in_(types))
+
+    # fetch one document more to know if there is a next page
+    results = query.limit(limit + 1).offset(offset).all()
+    if len(results) > limit:
+        results = results[:limit]
+        _set_next_link(request, offset + limit, limit)
+
+    documents = _load_documents(request, results, culture)
+    return {'documents': documents}
+
+
+@autocomplete_service.get(validators=[
+    validate_autocomplete, validate_filters, validate_autocomplete_limit])
+def autocomplete(request):
+    """Get the titles containing the given terms, e.g.:
+
+        [
+            {
+                "document_id": 1,
+                "type": "w",
+                "culture": "fr",
+                "title": "Mont Blanc"
+            }
+        ]
+
+    Only the columns of `documents_locales` are queried, the `ILIKE` filter
+    uses the trigram index on the titles. The titles starting with the
+    terms come first, then the titles are ordered by similarity.
+    """
+    q = request.validated['q']
+    culture = request.validated['culture']
+    types = request.validated['types']
+    limit = request.validated['limit']
+
+    title = DocumentLocale.title
+    pattern = _escape_like(q)
+    query = DBSession. \
+        query(
+            DocumentLocale.document_id, DocumentLocale.type,
+            DocumentLocale.culture, title). \
+        filter(title.ilike('%' + pattern + '%', escape='\\')). \
+        order_by(
+            title.ilike(pattern + '%', escape='\\').desc(),
+            func.similarity(title, q).desc(),
+            DocumentLocale.document_id)
+    if culture:
+        query = query.filter(DocumentLocale.culture == culture)
+    if types:
+        query = query.filter(DocumentLocale.type.in_(types))
+
+    return [
+        {
+            'document_id': document_id,
+            'type': doc_type,
+            'culture': locale_culture,
+            'title': locale_title
+        }
+        for document_id, doc_type, locale_culture, locale_title
+        in query.limit(limit)
+    ]
+
+
+def _escape_like(value):
+    """Escape the wildcards of a `LIKE` pattern.
+    """
+    return value. \
+        replace('\\', '\\\\'). \
+        replace('%', '\\%'). \
+        replace('_', '\\_')
+
+
+def _get_ts_query(q, culture):
+    """Parse the search terms with the text search configuration of the
+    culture. Without culture, the terms are parsed with the configurations
+    of all cultures and the queries are combined, so that the words are
+    found in the locales of every culture.
+    """
+    configs = [get_ts_config(culture)] if culture else get_ts_configs()
+    ts_query = None
+    for config in configs:
+        config_query = func.plainto_tsquery(config, q)
+        ts_query = config_query if ts_query is None \
+            else ts_query.op('||')(config_query)
+    return ts_query
+
+
+def _load_documents(request, results, culture):
+    """Load the found documents (one query per document type) and return
+    them in the order of the results.
+    """
+    geometry_format = get_geometry_format(request)
+    rest = DocumentRest(request)
+
+    ids_by_type = {}
+    for document_id, doc_type in results:
+        ids_by_type.setdefault(doc_type, []).append(document_id)
+
+    documents_by_id = {}
+    for document_type in document_types:
+        ids = ids_by_type.get(document_type.type)
+        if not ids:
+            continue
+        clazz = document_type.clazz
+        query = DBSession. \
+            query(clazz). \
+            options(rest._load_geometry(clazz, geometry_format)). \
+            filter(clazz.document_id.in_(ids))
+        if not culture:
+            query = query.options(joinedload(clazz.locales))
+        documents = query.all()
+        if culture:
+            rest._load_locales(documents, culture)
+        rest._load_geojson(documents, geometry_format)
+
+        for document in documents:
+            document_json = to_json_dict(
+                document, document_type.schema, geometry_format)
+            document_json['type'] = document_type.type
+            documents_by_id[document.document_id] = document_json
+
+    return [
+        documents_by_id[document_id]
+        for document_id, _ in results if document_id in documents_by_id
+    ]
+
+
+def _set_next_link(request, offset, limit):
+    params = dict(request.GET)
+    params['offset'] = offset
+    params['limit'] = limit
+    next_url = request.current_route_url(_query=params)
+    request.response.headers['Link'] = '<%s>; rel="next"' % next_url
@@ -0,0 +1,165 @@
+"""JSON serialization of documents using a plan that is compiled once per
+ColanderAlchemy schema.
+
+`serialize(schema.dictify(obj))` walks the schema for every object and then
+checks the type of every value of the resulting dict. The serializer
+returned by `get_serializer` inspects the schema only once: for each node
+it resolves whether it is a column or a relationship and which conversion
+is needed for its type. Serializing an object then only reads the
+attributes and applies the pre-selected conversions.
+"""
+from operator import attrgetter
+import json
+
+import colander
+from geoalchemy2 import WKBElement
+from geoalchemy2.shape import to_shape
+from shapely.geometry import mapping
+
+from c2corg_api.ext import colander_ext
+
+# the compiled serializers, by schema
+_serializers = {}
+
+
+# geometries are returned as GeoJSON strings (API version 1)
+GEOMETRY_FORMAT_STRING = 'string'
+
+# geometries are returned as GeoJSON objects
+GEOMETRY_FORMAT_GEOJSON = 'geojson'
+
+GEOMETRY_FORMATS = [GEOMETRY_FORMAT_STRING, GEOMETRY_FORMAT_GEOJSON]
+
+
+def get_serializer(schema, geometry_format=GEOMETRY_FORMAT_STRING):
+    """Returns a function that converts an object into a JSON-ready dict.
+    With `GEOMETRY_FORMAT_STRING` the output is the same as
+    `serialize(schema.dictify(obj))`.
+
+    With `GEOMETRY_FORMAT_GEOJSON` geometries are returned as GeoJSON
+    objects. If the GeoJSON was already generated by the database (e.g.
+    `DocumentGeometry.geom_geojson` for `DocumentGeometry.geom`), it is
+    used instead of the geometry column.
+    """
+    key = (schema, geometry_format)
+    serializer = _serializers.get(key)
+    if serializer is None:
+        serializer = _compile_mapping(schema, geometry_format)
+        _serializers[key] = serializer
+    return serializer
+
+
+def _compile_mapping(schema, geometry_format):
+    """Compile the serializer for a `SQLAlchemySchemaNode`.
+    """
+    mapper = schema.inspector
+    names = []
+    converters = []
+    # fields whose converter takes the whole object instead of the
+    # attribute value
+    object_fields = []
+    for node in schema:
+        name = node.name
+        if name in mapper.column_attrs:
+            if geometry_format == GEOMETRY_FORMAT_GEOJSON and \
+                    isinstance(node.typ, colander_ext.Geometry):
+                object_fields.append((name, _geojson_converter(name)))
+                continue
+            converter = _get_converter(node.typ)
+        elif name in mapper.relationships:
+            if mapper.relationships[name].uselist:
+                converter = _sequence_converter(
+                    _compile_mapping(node.children[0], geometry_format))
+            else:
+                converter = _optional_converter(
+                    _compile_mapping(node, geometry_format))
+        else:
+            # like `dictify`, ignore nodes that are not part of the model
+            continue
+        names.append(name)
+        converters.append(converter)
+
+    fields = tuple(zip(names, converters))
+    if not names:
+        def getter(obj):
+            return ()
+    elif len(names) == 1:
+        # `attrgetter` with a single name does not return a tuple
+        single_getter = attrgetter(names[0])
+
+        def getter(obj):
+            return (single_getter(obj), )
+    else:
+        getter = attrgetter(*names)
+
+    def serialize_mapping(obj):
+        data = {
+            name: value if converter is None else converter(value)
+            for (name, converter), value in zip(fields, getter(obj))
+        }
+        for name, converter in object_fields:
+            data[name] = converter(obj)
+        return data
+
+    return serialize_mapping
+
+
+def _get_converter(typ):
+    """Returns the conversion function for a column of the given Colander
+    type, or `None` if the value can be used as is.
+    """
+    if isinstance(typ, colander.String):
+        return _convert_string
+    if isinstance(typ, (colander.Integer, colander.Float, colander.Boolean)):
+        return None
+    if isinstance(typ, (colander.Date, colander.DateTime)):
+        return _convert_date
+    if isinstance(typ, colander_ext.Geometry):
+        return _convert_geometry
+    return _convert_any
+
+
+def _sequence_converter(convert_item):
+    def convert_sequence(values):
+        return [convert_item(value) for value in values]
+    return convert_sequence
+
+
+def _optional_converter(convert):
+    def convert_optional(value):
+        return None if value is None else convert(value)
+    return convert_optional
+
+
+def _convert_string(value):
+    return value if value is None else unicode(value)
+
+
+def _convert_date(value):
+    return value if value is None else value.isoformat()
+
+
+def _convert_geometry(value):
+    if isinstance(value, WKBElement):
+        return json.dumps(mapping(to_shape(value)))
+    return _convert_any(value)
+
+
+def _geojson_converter(name):
+    geojson_name = name + '_geojson'
+
+    def convert_geojson(obj):
+        geojson = getattr(obj, geojson_name, None)
+        if geojson is not None:
+            return json.loads(geojson)
+        value = getattr(obj, name)
+        if isinstance(value, WKBElement):
+            return mapping(to_shape(value))
+        return _convert_any(value)
+    return convert_geojson
+
+
+def _convert_any(value):
+    # imported here to avoid a circular import
+    from c2corg_api.views import serialize
+    return serialize(value)
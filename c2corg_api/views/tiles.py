@@ -0,0 +1,193 @@
+import math
+
+from cornice import Service
+from geoalchemy2 import WKBElement
+from geoalchemy2.shape import to_shape
+from sqlalchemy import text
+import transaction
+
+from c2corg_api.attributes import default_cultures
+from c2corg_api.caching import tile_cache
+from c2corg_api.models import DBSession
+from c2corg_api.models.document import (
+    Document, DocumentLocale, DocumentGeometry)
+from c2corg_api.models.document_types import (
+    document_types_by_name, DOCUMENT_TYPE_NAMES_PATTERN)
+from c2corg_api.models.waypoint import Waypoint
+
+# half of the width of the world in EPSG:3857
+ORIGIN_SHIFT = 20037508.342789244
+
+# the size of a tile in tile coordinates
+TILE_EXTENT = 4096
+
+# the features are clipped with this buffer (in tile coordinates) around
+# the tile
+TILE_BUFFER = 64
+
+MAX_ZOOM = 22
+
+TILE_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+tiles_service = Service(
+    name='tiles',
+    path='/tiles/{layer:%s}/{z:\d+}/{x:\d+}/{y:\d+}.mvt' %
+    DOCUMENT_TYPE_NAMES_PATTERN,
+    description='Mapbox Vector Tiles with the geometries of the documents')
+
+_TILE_QUERY = '''
+SELECT ST_AsMVT(tile, :layer, %(extent)d, 'geom') FROM (
+  SELECT
+    d.document_id,
+    d.type,
+    (SELECT l.title FROM %(locales)s l
+     WHERE l.document_id = d.document_id
+     ORDER BY l.culture = :culture DESC, l.culture LIMIT 1) AS title,
+    w.waypoint_type::text AS waypoint_type,
+    w.elevation,
+    ST_AsMVTGeom(
+      g.geom, ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 3857),
+      %(extent)d, %(buffer)d, true) AS geom
+  FROM %(geometries)s g
+  JOIN %(documents)s d ON d.document_id = g.document_id
+  LEFT JOIN %(waypoints)s w ON w.document_id = d.document_id
+  WHERE d.type = :type AND g.geom && ST_MakeEnvelope(
+    :minx - :buffer, :miny - :buffer, :maxx + :buffer, :maxy + :buffer,
+    3857)
+) AS tile
+WHERE tile.geom IS NOT NULL
+''' % {
+    'extent': TILE_EXTENT,
+    'buffer': TILE_BUFFER,
+    'locales': DocumentLocale.__table__.fullname,
+    'geometries': DocumentGeometry.__table__.fullname,
+    'documents': Document.__table__.fullname,
+    'waypoints': Waypoint.__table__.fullname
+}
+
+
+def get_tile_size(z):
+    """Returns the width of a tile at the given zoom level in meters.
+    """
+    return 2 * ORIGIN_SHIFT / 2 ** z
+
+
+def get_tile_bounds(z, x, y):
+    """Returns the bounds (`minx, miny, maxx, maxy` in EPSG:3857) of a tile.
+    """
+    size = get_tile_size(z)
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+
+def get_tile_range(bounds, z, buffer=0):
+    """Returns the range `(min_x, min_y, max_x, max_y)` of the tiles at the
+    given zoom level which intersect the given bounds, extended by `buffer`
+    (in tile coordinates).
+    """
+    size = get_tile_size(z)
+    margin = size * buffer / TILE_EXTENT
+    max_index = 2 ** z - 1
+
+    def index(value):
+        return min(max(int(math.floor(value / size)), 0), max_index)
+
+    return (
+        index(bounds[0] - margin + ORIGIN_SHIFT),
+        index(ORIGIN_SHIFT - bounds[3] - margin),
+        index(bounds[2] + margin + ORIGIN_SHIFT),
+        index(ORIGIN_SHIFT - bounds[1] + margin))
+
+
+def get_geometry_bounds(geometry):
+    """Returns the bounds of a `DocumentGeometry`, or `None` if there is no
+    geometry.
+    """
+    if geometry is None or not isinstance(geometry.geom, WKBElement):
+        return None
+    return to_shape(geometry.geom).bounds
+
+
+def invalidate_tiles(layer, bounds_list):
+    """Remove the cached tiles of a layer which contain features in the
+    given bounds, once the transaction is committed. Only the tiles which
+    are in the cache are looked at.
+    """
+    bounds_list = [bounds for bounds in bounds_list if bounds is not None]
+    if not bounds_list:
+        return
+
+    def invalidate(success):
+        if not success:
+            return
+        for z in range(tile_cache.max_zoom + 1):
+            cached_tiles = tile_cache.get_cached_tiles(layer, z)
+            if not cached_tiles:
+                continue
+            tile_ranges = [
+                get_tile_range(bounds, z, TILE_BUFFER)
+                for bounds in bounds_list]
+            tile_cache.invalidate(layer, z, [
+                (x, y) for x, y in cached_tiles
+                if any(
+                    min_x <= x <= max_x and min_y <= y <= max_y
+                    for min_x, min_y, max_x, max_y in tile_ranges)
+            ])
+
+    transaction.get().addAfterCommitHook(invalidate)
+
+
+def validate_tile(request):
+    """Checks the tile coordinates and the optional culture `l` (used for the
+    titles, if a document has no locale in this culture, the title of
+    another locale is used).
+    """
+    z = int(request.matchdict['z'])
+    x = int(request.matchdict['x'])
+    y = int(request.matchdict['y'])
+    if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        request.errors.add('url', 'tile', 'invalid tile')
+    request.validated['tile'] = (z, x, y)
+
+    culture = request.GET.get('l')
+    if culture is not None and culture not in default_cultures:
+        request.errors.add('querystring', 'l', 'invalid culture')
+    request.validated['culture'] = culture
+
+
+@tiles_service.get(validators=validate_tile)
+def get_tile(request):
+    """Get a vector tile with the geometries of the documents of a type. The
+    features have the properties `document_id`, `type`, `title`,
+    `waypoint_type` and `elevation`. The tile is generated by PostGIS
+    (`ST_AsMVT`) and cached.
+    """
+    layer = request.matchdict['layer']
+    z, x, y = request.validated['tile']
+    culture = request.validated['culture']
+
+    tile = tile_cache.get(layer, z, x, y, culture or '')
+    if tile is None:
+        tile = _generate_tile(layer, z, x, y, culture)
+        tile_cache.set(layer, z, x, y, culture or '', tile)
+
+    response = request.response
+    response.content_type = TILE_CONTENT_TYPE
+    response.body = tile
+    return response
+
+
+def _generate_tile(layer, z, x, y, culture):
+    minx, miny, maxx, maxy = get_tile_bounds(z, x, y)
+    tile = DBSession.execute(text(_TILE_QUERY), {
+        'layer': layer,
+        'type': document_types_by_name[layer].type,
+        'culture': culture or '',
+        'minx': minx,
+        'miny': miny,
+        'maxx': maxx,
+        'maxy': maxy,
+        'buffer': get_tile_size(z) * TILE_BUFFER / TILE_EXTENT
+    }).scalar()
+    return bytes(tile) if tile is not None else b''
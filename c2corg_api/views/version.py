@@ -0,0 +1,25 @@
+from cornice import Service
+
+from c2corg_api.models.document_types import (
+    document_types_by_name, DOCUMENT_TYPE_NAMES_PATTERN)
+from c2corg_api.views import validate_id
+from c2corg_api.views.document import DocumentRest
+
+version_service = Service(
+    name='version',
+    path='/{doc_type:%s}/{id:\d+}/{culture:[a-z]{2}}/{version_id:\d+}' %
+    DOCUMENT_TYPE_NAMES_PATTERN,
+    description='A document as it was in a version of a culture')
+
+
+def validate_version_id(request):
+    """Checks the version id of a version request.
+    """
+    request.validated['version_id'] = int(request.matchdict['version_id'])
+
+
+@version_service.get(validators=[validate_id, validate_version_id])
+def get_version(request):
+    document_type = document_types_by_name[request.matchdict['doc_type']]
+    return DocumentRest(request)._get_version(
+        document_type.clazz, document_type.schema)
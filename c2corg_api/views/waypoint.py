@@ -1,15 +1,91 @@
+from cornice import Service
 from cornice.resource import resource, view
+from geoalchemy2 import Geography
+from sqlalchemy import func, cast
+from sqlalchemy.orm import joinedload
+import json
 
+from c2corg_api.attributes import waypoint_types
+from c2corg_api.models import DBSession
+from c2corg_api.models.document import DocumentGeometry
 from c2corg_api.models.waypoint import (
     Waypoint, schema_waypoint, schema_update_waypoint)
-from c2corg_api.views.document import DocumentRest
-from c2corg_api.views import validate_id, json_view
+from c2corg_api.views.document import (
+    DocumentRest, DEFAULT_GEOJSON_PRECISION)
+from c2corg_api.views import (
+    validate_id, validate_pagination, validate_bbox, validate_ids,
+    validate_limit, json_view, get_geometry_format, to_json_dict,
+    GEOMETRY_FORMAT_STRING)
 
+# the maximum number of grid cells of a clustered request
+MAX_CLUSTER_CELLS = 10000
 
-@resource(collection_path='/waypoints', path='/waypoints/{id}')
+nearby_service = Service(
+    name='waypoints_nearby',
+    path='/waypoints/nearby',
+    description='The waypoints nearest to a point')
+
+
+def validate_cluster(request):
+    """Checks the optional `cluster` parameter (the size of the grid cells in
+    meters) of a collection request. A `bbox` is required, and it may be
+    divided into at most `MAX_CLUSTER_CELLS` cells.
+    """
+    cluster = request.GET.get('cluster')
+    if cluster is None:
+        request.validated['cluster'] = None
+        return
+    try:
+        cluster = float(cluster)
+    except ValueError:
+        cluster = 0
+    bbox = request.validated.get('bbox')
+    if cluster <= 0:
+        request.errors.add('querystring', 'cluster', 'invalid cluster size')
+    elif bbox is None:
+        request.errors.add(
+            'querystring', 'cluster', 'a bbox is required for clusters')
+    elif (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) / cluster ** 2 > \
+            MAX_CLUSTER_CELLS:
+        request.errors.add(
+            'querystring', 'cluster', 'cluster size too small for bbox')
+    else:
+        request.validated['cluster'] = cluster
+
+
+def validate_nearby(request):
+    """Checks the point `point` (`x,y` in EPSG:3857) and the optional
+    waypoint types `waypoint_type` (e.g. `hut,access`) of a nearby request.
+    """
+    point = request.GET.get('point')
+    try:
+        point = [float(coord) for coord in point.split(',')]
+    except (AttributeError, ValueError):
+        point = None
+    if point is None or len(point) != 2:
+        request.errors.add('querystring', 'point', 'invalid point')
+    else:
+        request.validated['point'] = point
+
+    types = request.GET.get('waypoint_type')
+    if types is None:
+        request.validated['waypoint_types'] = None
+    else:
+        types = types.split(',')
+        if any(waypoint_type not in waypoint_types for waypoint_type in types):
+            request.errors.add(
+                'querystring', 'waypoint_type', 'invalid waypoint type')
+        request.validated['waypoint_types'] = types
+
+
+@resource(collection_path='/waypoints', path='/waypoints/{id:\d+}')
 class WaypointRest(DocumentRest):
 
+    @view(validators=[
+        validate_pagination, validate_bbox, validate_ids, validate_cluster])
     def collection_get(self):
+        if self.request.validated['cluster'] is not None:
+            return self._get_clusters()
         return self._collection_get(Waypoint, schema_waypoint)
 
     @view(validators=validate_id)
@@ -23,3 +99,130 @@ class WaypointRest(DocumentRest):
     @json_view(schema=schema_update_waypoint, validators=validate_id)
     def put(self):
         return self._put(Waypoint, schema_waypoint)
+
+    def _get_nearby(self):
+        """Get the `limit` waypoints nearest to the given point, ordered by
+        distance. Every document has a `distance` attribute (in meters).
+
+        The waypoints are ordered with the KNN operator `<->`, so that the
+        GiST index on `documents_geometries.geom` returns them in order of
+        distance, only the distances of the returned waypoints are computed.
+        The distances are measured on the spheroid, as distances in
+        EPSG:3857 are stretched away from the equator.
+        """
+        x, y = self.request.validated['point']
+        types = self.request.validated['waypoint_types']
+        limit = self.request.validated['limit']
+        culture = self.request.GET.get('l')
+        geometry_format = get_geometry_format(self.request)
+
+        point = func.ST_SetSRID(func.ST_MakePoint(x, y), 3857)
+        distance = func.ST_Distance(
+            cast(func.ST_Transform(DocumentGeometry.geom, 4326), Geography),
+            cast(func.ST_Transform(point, 4326), Geography))
+        query = DBSession. \
+            query(Waypoint.document_id, distance). \
+            join(Waypoint.geometry). \
+            order_by(DocumentGeometry.geom.op('<->')(point))
+        if types:
+            query = query.filter(Waypoint.waypoint_type.in_(types))
+        results = query.limit(limit).all()
+        if not results:
+            return {'documents': []}
+
+        query = DBSession. \
+            query(Waypoint). \
+            options(self._load_geometry(Waypoint, geometry_format)). \
+            filter(Waypoint.document_id.in_(
+                [document_id for document_id, _ in results]))
+        if not culture:
+            query = query.options(joinedload(Waypoint.locales))
+        documents = query.all()
+        if culture:
+            self._load_locales(documents, culture)
+        self._load_geojson(documents, geometry_format)
+
+        documents_by_id = {doc.document_id: doc for doc in documents}
+        documents_json = []
+        for document_id, document_distance in results:
+            document_json = to_json_dict(
+                documents_by_id[document_id], schema_waypoint,
+                geometry_format)
+            document_json['distance'] = round(document_distance, 1)
+            documents_json.append(document_json)
+        return {'documents': documents_json}
+
+    def _get_clusters(self):
+        """Get the waypoints inside the bbox grouped on a grid with cells of
+        the size `cluster`, e.g.:
+
+            [
+                {
+                    "count": 12,
+                    "waypoint_types": {"summit": 10, "hut": 2},
+                    "geometry": {
+                        "geom": "{\\"type\\": \\"Point\\", ...}"
+                    }
+                }
+            ]
+
+        The clusters are computed in the database: the waypoints are looked
+        up with the spatial index and grouped by cell and type, the point of
+        a cluster is the mean of the points of its waypoints.
+        """
+        bbox = self.request.validated['bbox']
+        size = self.request.validated['cluster']
+
+        centroid = func.ST_Centroid(DocumentGeometry.geom)
+        x = func.ST_X(centroid)
+        y = func.ST_Y(centroid)
+        envelope = func.ST_MakeEnvelope(
+            bbox[0], bbox[1], bbox[2], bbox[3], 3857)
+        cell_x = func.floor(x / size).label('cell_x')
+        cell_y = func.floor(y / size).label('cell_y')
+        cells = DBSession. \
+            query(
+                cell_x, cell_y,
+                Waypoint.waypoint_type.label('waypoint_type'),
+                func.count().label('count'),
+                func.sum(x).label('sum_x'),
+                func.sum(y).label('sum_y')). \
+            join(Waypoint.geometry). \
+            filter(DocumentGeometry.geom.intersects(envelope)). \
+            group_by(cell_x, cell_y, Waypoint.waypoint_type). \
+            subquery()
+        count = func.sum(cells.c.count)
+        clusters = DBSession. \
+            query(
+                count,
+                func.sum(cells.c.sum_x) / count,
+                func.sum(cells.c.sum_y) / count,
+                func.json_object_agg(cells.c.waypoint_type, cells.c.count)). \
+            group_by(cells.c.cell_x, cells.c.cell_y). \
+            order_by(cells.c.cell_x, cells.c.cell_y). \
+            all()
+
+        geometry_format = get_geometry_format(self.request)
+        precision = int(self.request.registry.settings.get(
+            'geojson.precision', DEFAULT_GEOJSON_PRECISION))
+        result = []
+        for cluster_count, cluster_x, cluster_y, type_counts in clusters:
+            geom = {
+                'type': 'Point',
+                'coordinates': [
+                    round(float(cluster_x), precision),
+                    round(float(cluster_y), precision)]
+            }
+            if geometry_format == GEOMETRY_FORMAT_STRING:
+                geom = json.dumps(geom)
+            result.append({
+                'count': int(cluster_count),
+                'waypoint_types': type_counts,
+                'geometry': {'geom': geom}
+            })
+        return result
+
+
+@nearby_service.get(validators=[validate_nearby, validate_limit])
+def get_nearby(request):
+    return WaypointRest(request)._get_nearby()
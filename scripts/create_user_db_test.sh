@@ -7,6 +7,16 @@ $PSQL <<EOF
 create database c2corg_${USER}_tests owner "www-data";
 \c c2corg_${USER}_tests
 create extension postgis;
+-- the vector tiles need PostGIS >= 2.4 (ST_AsMVT)
+DO \$\$ BEGIN
+  IF ARRAY[
+      split_part(postgis_lib_version(), '.', 1)::int,
+      split_part(postgis_lib_version(), '.', 2)::int] < ARRAY[2, 4] THEN
+    RAISE EXCEPTION 'PostGIS >= 2.4 is required, found %',
+      postgis_lib_version();
+  END IF;
+END \$\$;
+create extension pg_trgm;
 create schema guidebook authorization "www-data";
 \q
 EOF
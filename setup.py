@@ -50,5 +50,8 @@ setup(name='c2corg_api',
       main = c2corg_api:main
       [console_scripts]
       initialize_c2corg_api_db = c2corg_api.scripts.initializedb:main
+      bulkload_c2corg_api = c2corg_api.scripts.bulkload:main
+      reindex_c2corg_api = c2corg_api.scripts.reindex:main
+      compress_archives_c2corg_api = c2corg_api.scripts.compress_archives:main
       """,
       )